@@ -0,0 +1,18 @@
+# gunicorn reads this from the working directory, whatever the worker class
+
+
+def post_worker_init(worker):
+    # The app is loaded by now: warm up before this worker takes requests,
+    # so the first visitor after a cold start doesn't pay for it
+    from hotmine import warmup
+
+    warmup.run()
+
+    # Periodic jobs; a database lease picks one worker per run (see
+    # hotmine/scheduler.py)
+    from django.conf import settings
+
+    if getattr(settings, "SCHEDULER_EMBEDDED", False):
+        from hotmine import scheduler
+
+        scheduler.start()
@@ -0,0 +1,67 @@
+import string
+
+from django.contrib.auth.models import User
+from django.db.models import CharField, Func
+
+ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+
+def normalize_email(email):
+    """
+    Canonical form used for email identity lookups. Only ASCII letters are
+    folded, as SQLite's LOWER() does in the index, so "É" and "é" stay
+    different addresses rather than matching here but not in the database.
+    """
+    if not email:
+        return ""
+    return email.strip().translate(ASCII_LOWER)
+
+
+class EmailKey(Func):
+    """SQL expression matching the auth_user email index from migration 0011"""
+
+    # The empty string is inlined rather than bound as a parameter so SQLite's
+    # planner recognises the expression as the indexed one.
+    template = "NULLIF(LOWER(%(expressions)s), '')"
+    output_field = CharField()
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        # Postgres' LOWER() follows the collation; "C" folds ASCII only
+        return self.as_sql(
+            compiler,
+            connection,
+            template="NULLIF(LOWER(%(expressions)s COLLATE \"C\"), '')",
+            **extra_context,
+        )
+
+
+def _lookup(email):
+    return (
+        User.objects.annotate(email_key=EmailKey("email"))
+        .filter(email_key=email)
+        .order_by("pk")
+        .first()
+    )
+
+
+def get_user_by_email(email, request=None):
+    """Resolve a user by email (case-insensitive), memoized per request"""
+    email = normalize_email(email)
+    if not email:
+        return None
+
+    if request is None:
+        return _lookup(email)
+
+    cache = request.__dict__.setdefault("_users_by_email", {})
+    if email not in cache:
+        cache[email] = _lookup(email)
+    return cache[email]
+
+
+def email_in_use(email, exclude_user=None, request=None):
+    """Check if an email belongs to an account other than exclude_user"""
+    user = get_user_by_email(email, request=request)
+    if user is None:
+        return False
+    return exclude_user is None or user.pk != exclude_user.pk
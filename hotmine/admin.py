@@ -1,15 +1,29 @@
 # Updated admin.py with withdrawal controls
 
+from datetime import datetime, timezone as dt_timezone
+
+from django import forms
 from django.contrib import admin
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.db import transaction
+from django.http import Http404, HttpResponse
+from django.template.response import TemplateResponse
 from django.utils.html import format_html
-from django.urls import reverse
+from django.urls import path, reverse
 from django.utils.safestring import mark_safe
 from django.contrib import messages
+from django.utils import timezone
+from . import forecast, live, outbox, planstats, routers, settlement, tracing
 from .models import (
+    ArchivedInvestment,
+    ArchivedWithdrawalRequest,
     UserProfile,
     Investment,
     InvestmentPlan,
+    InvestmentPlanStats,
     CryptoWallet,
+    JobLease,
+    OutboxMessage,
     Amount,
     Totalearnings,
     totalwithdraw,
@@ -17,8 +31,51 @@ from .models import (
 )
 
 
+class OutboxStatusMixin:
+    """
+    Status edits in the change form or changelist notify the user. Admins
+    using it set outbox_event_prefix and outbox_payload(obj), the payload
+    for the object's message.
+    """
+
+    outbox_event_prefix = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if not cls.outbox_event_prefix or not callable(
+            getattr(cls, "outbox_payload", None)
+        ):
+            raise TypeError(
+                f"{cls.__name__} needs outbox_event_prefix and outbox_payload"
+            )
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        # The admin saves inside a transaction, so this commits with it
+        if change and "status" in form.changed_data and obj.status:
+            outbox.enqueue(
+                obj.user_id,
+                f"{self.outbox_event_prefix}.{obj.status.lower()}",
+                self.outbox_payload(obj),
+            )
+
+
+class ReplicaChangeListMixin:
+    """Changelists are the admin's heavy reads; serve them from a replica"""
+
+    def changelist_view(self, request, extra_context=None):
+        if request.method not in ("GET", "HEAD"):
+            return super().changelist_view(request, extra_context)
+        with routers.replica():
+            response = super().changelist_view(request, extra_context)
+            # The result list is only queried while the template renders
+            if hasattr(response, "render"):
+                response.render()
+        return response
+
+
 @admin.register(UserProfile)
-class UserProfileAdmin(admin.ModelAdmin):
+class UserProfileAdmin(ReplicaChangeListMixin, admin.ModelAdmin):
     list_display = [
         "user",
         "phone_number",
@@ -117,9 +174,13 @@ class InvestmentPlanAdmin(admin.ModelAdmin):
         "investment_duration_days",
         "deposit_return_display",
         "crypto_wallet",
+        "investors_display",
+        "aum_display",
+        "capacity_display",
         "is_active",
         "sort_order",
     ]
+    list_select_related = ["crypto_wallet", "stats"]
     list_filter = [
         "is_active",
         "deposit_return",
@@ -132,6 +193,10 @@ class InvestmentPlanAdmin(admin.ModelAdmin):
         "updated_at",
         "total_return_percentage",
         "estimated_total_return_display",
+        "investors_display",
+        "aum_display",
+        "pending_display",
+        "capacity_display",
     ]
     ordering = ["sort_order", "title"]
 
@@ -149,10 +214,22 @@ class InvestmentPlanAdmin(admin.ModelAdmin):
                     "daily_earnings_percentage",
                     "investment_duration_days",
                     "deposit_return",
+                    "capacity",
                 )
             },
         ),
         ("Crypto Configuration", {"fields": ("crypto_wallet",)}),
+        (
+            "Investors",
+            {
+                "fields": (
+                    "investors_display",
+                    "aum_display",
+                    "pending_display",
+                    "capacity_display",
+                ),
+            },
+        ),
         (
             "Calculated Fields",
             {
@@ -187,9 +264,105 @@ class InvestmentPlanAdmin(admin.ModelAdmin):
         "Estimated Total Return (Min Investment)"
     )
 
+    def _stats(self, obj):
+        # Counters kept by hotmine/planstats.py; a new plan has none yet
+        try:
+            return obj.stats
+        except InvestmentPlanStats.DoesNotExist:
+            return InvestmentPlanStats(plan=obj)
+
+    def investors_display(self, obj):
+        return self._stats(obj).investors
+
+    investors_display.short_description = "Investors"
+
+    def aum_display(self, obj):
+        stats = self._stats(obj)
+        return f"${stats.aum:,.2f} ({stats.active_investments} active)"
+
+    aum_display.short_description = "Invested"
+
+    def pending_display(self, obj):
+        stats = self._stats(obj)
+        return f"${stats.pending_amount:,.2f} ({stats.pending_investments} pending)"
+
+    pending_display.short_description = "Awaiting Payment"
+
+    def capacity_display(self, obj):
+        if obj.capacity is None:
+            return "No limit"
+        used = self._stats(obj).capacity_used_percentage
+        return f"{used:.0f}% of ${obj.capacity:,.0f}"
+
+    capacity_display.short_description = "Capacity Used"
+
+
+class InvestmentAdminForm(forms.ModelForm):
+    class Meta:
+        model = Investment
+        fields = "__all__"
+
+    def clean_status(self):
+        status = self.cleaned_data["status"]
+        was_completed = self.instance.pk and self.initial.get("status") == "COMPLETED"
+        # Completing returned the deposit; reopened, it would come back twice
+        if was_completed and status != "COMPLETED":
+            raise ValidationError("A completed investment can't be reopened.")
+        # A saved status would skip the final accrual, the deposit return and
+        # date_completed, which settlement.complete() sees to
+        if status == "COMPLETED" and not was_completed:
+            raise ValidationError(
+                'Complete investments with the "Mark selected investments as '
+                'completed" action, which credits the last earnings and returns '
+                "the deposit."
+            )
+        return status
+
+
+def activated_fields(status):
+    """Extra fields to set with a status change"""
+    if status == "ACTIVE":
+        # Earnings accrue from activation, not from date_invested
+        return {"last_accrued_on": timezone.now().date()}
+    return {}
+
 
 @admin.register(Investment)
-class InvestmentAdmin(admin.ModelAdmin):
+class InvestmentAdmin(OutboxStatusMixin, ReplicaChangeListMixin, admin.ModelAdmin):
+    form = InvestmentAdminForm
+    outbox_event_prefix = "investment"
+
+    def outbox_payload(self, obj):
+        plan = obj.investment_plan.title if obj.investment_plan else obj.plan
+        return outbox.investment_payload(obj.pk, obj.amount, plan)
+
+    # Edits and deletes move the plan counters in the same transaction
+
+    def get_changelist_form(self, request, **kwargs):
+        # The status column is editable there too
+        return super().get_changelist_form(request, form=self.form, **kwargs)
+
+    def save_model(self, request, obj, form, change):
+        before = None
+        if change:
+            before = planstats.rows(Investment.objects.filter(pk=obj.pk)).get(obj.pk)
+        if obj.status == "ACTIVE" and (before is None or before.status != "ACTIVE"):
+            for field, value in activated_fields(obj.status).items():
+                setattr(obj, field, value)
+        super().save_model(request, obj, form, change)
+        planstats.record([(before, planstats.row(obj))])
+
+    def delete_model(self, request, obj):
+        before = planstats.row(obj)
+        super().delete_model(request, obj)
+        planstats.record([(before, None)])
+
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic():
+            before = planstats.rows(queryset)
+            super().delete_queryset(request, queryset)
+            planstats.record((row, None) for row in before.values())
+
     list_display = [
         "user",
         "investment_plan_title",
@@ -208,6 +381,8 @@ class InvestmentAdmin(admin.ModelAdmin):
     ]
     readonly_fields = [
         "date_invested",
+        "matures_at",
+        "last_accrued_on",
         "daily_earnings_display",
         "expected_total_earnings_display",
         "expected_total_return_display",
@@ -243,7 +418,17 @@ class InvestmentAdmin(admin.ModelAdmin):
                 )
             },
         ),
-        ("Dates", {"fields": ("date_invested", "date_completed")}),
+        (
+            "Dates",
+            {
+                "fields": (
+                    "date_invested",
+                    "matures_at",
+                    "date_completed",
+                    "last_accrued_on",
+                )
+            },
+        ),
         (
             "Legacy Fields",
             {
@@ -323,50 +508,136 @@ class InvestmentAdmin(admin.ModelAdmin):
 
     actions = ["mark_as_active", "mark_as_completed", "mark_as_cancelled"]
 
+    def _set_status(self, queryset, status):
+        # The users hear about it through the outbox, committed with the change
+        with transaction.atomic():
+            queryset = queryset.exclude(status=status)
+            if status == "ACTIVE":
+                # Completing returned the deposit; reopened, it would come
+                # back twice
+                queryset = queryset.exclude(status="COMPLETED")
+            before = planstats.rows(queryset)
+            changed = list(
+                queryset.values_list(
+                    "pk", "user_id", "amount", "investment_plan__title"
+                )
+            )
+            updated = queryset.update(status=status, **activated_fields(status))
+            planstats.record(
+                (row, row._replace(status=status)) for row in before.values()
+            )
+            outbox.enqueue_many(
+                (
+                    user_id,
+                    f"investment.{status.lower()}",
+                    outbox.investment_payload(pk, amount, plan),
+                )
+                for pk, user_id, amount, plan in changed
+            )
+        return updated
+
     def mark_as_active(self, request, queryset):
-        updated = queryset.update(status="ACTIVE")
+        skipped = queryset.filter(status="COMPLETED").count()
+        updated = self._set_status(queryset, "ACTIVE")
         self.message_user(request, f"{updated} investments marked as active.")
+        if skipped:
+            self.message_user(
+                request,
+                f"{skipped} completed investment(s) were left completed.",
+                messages.WARNING,
+            )
 
     mark_as_active.short_description = "Mark selected investments as active"
 
     def mark_as_completed(self, request, queryset):
-        from django.utils import timezone
-
-        updated = queryset.update(status="COMPLETED", date_completed=timezone.now())
+        # Credits the last earnings and returns deposits, like maturity does
+        updated = settlement.complete(queryset)
         self.message_user(request, f"{updated} investments marked as completed.")
 
     mark_as_completed.short_description = "Mark selected investments as completed"
 
     def mark_as_cancelled(self, request, queryset):
-        updated = queryset.update(status="CANCELLED")
+        updated = self._set_status(queryset, "CANCELLED")
         self.message_user(request, f"{updated} investments marked as cancelled.")
 
     mark_as_cancelled.short_description = "Mark selected investments as cancelled"
 
+    def get_urls(self):
+        urls = [
+            path(
+                "forecast/",
+                self.admin_site.admin_view(self.forecast_view),
+                name="hotmine_investment_forecast",
+            )
+        ]
+        return urls + super().get_urls()
+
+    def forecast_view(self, request):
+        """What the active book will owe over the coming days (hotmine/forecast.py)"""
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        result = forecast.forecast()
+        if request.GET.get("format") == "csv":
+            response = HttpResponse(content_type="text/csv")
+            response["Content-Disposition"] = (
+                f'attachment; filename="liabilities-{result.today}.csv"'
+            )
+            forecast.write_csv(result, response, per_plan=True)
+            return response
+
+        days = forecast.horizons()
+        plan_totals = [result.plan_totals(n) for n in days]
+        cumulative = result.cumulative()
+        top = cumulative[-1] or 1
+        context = {
+            **self.admin_site.each_context(request),
+            "opts": self.model._meta,
+            "title": "Liability forecast",
+            "forecast": result,
+            "horizons": [(n, result.totals(n)) for n in days],
+            "plans": [
+                (plan, [totals[index] for totals in plan_totals])
+                for index, plan in enumerate(result.plans)
+            ],
+            # Cumulative liability as an SVG polyline, 0-100 on both axes
+            "chart": " ".join(
+                f"{n * 100 / result.horizon:.2f},{100 - total * 100 / top:.2f}"
+                for n, total in enumerate(cumulative)
+            ),
+        }
+        return TemplateResponse(
+            request, "admin/hotmine/investment/forecast.html", context
+        )
+
 
 @admin.register(Amount)
-class AmountAdmin(admin.ModelAdmin):
+class AmountAdmin(ReplicaChangeListMixin, admin.ModelAdmin):
     list_display = ("user", "amount", "created_at", "updated_at")
     search_fields = ("user__username",)
     list_filter = ("created_at", "updated_at")
 
 
 @admin.register(Totalearnings)
-class TotalearningsAdmin(admin.ModelAdmin):
+class TotalearningsAdmin(ReplicaChangeListMixin, admin.ModelAdmin):
     list_display = ("user", "total_earnings", "created_at", "updated_at")
     search_fields = ("user__username",)
     list_filter = ("created_at", "updated_at")
 
 
 @admin.register(totalwithdraw)
-class TotalWithdrawAdmin(admin.ModelAdmin):
+class TotalWithdrawAdmin(ReplicaChangeListMixin, admin.ModelAdmin):
     list_display = ("user", "total_withdraw", "created_at", "updated_at")
     search_fields = ("user__username",)
     list_filter = ("created_at", "updated_at")
 
 
 @admin.register(WithdrawalRequest)
-class WithdrawalRequestAdmin(admin.ModelAdmin):
+class WithdrawalRequestAdmin(
+    OutboxStatusMixin, ReplicaChangeListMixin, admin.ModelAdmin
+):
+    outbox_event_prefix = "withdrawal"
+    outbox_payload = staticmethod(outbox.withdrawal_payload)
+
     list_display = (
         "user",
         "amount",
@@ -431,11 +702,31 @@ class WithdrawalRequestAdmin(admin.ModelAdmin):
 
     actions = ["approve_withdrawals", "reject_withdrawals", "disable_user_withdrawals"]
 
+    def _bulk_set_status(self, queryset, status):
+        # update() skips save() and its signals, so stamp the timestamps the
+        # live event stream relies on and notify it directly
+        queryset = queryset.filter(status__in=["pending", "processing"])
+        now = timezone.now()
+        with transaction.atomic():
+            changed = list(queryset.only("id", "user_id", "amount", "rejection_reason"))
+            updated = queryset.update(status=status, processed_at=now, updated_at=now)
+            outbox.enqueue_many(
+                (
+                    withdrawal.user_id,
+                    f"withdrawal.{status}",
+                    outbox.withdrawal_payload(withdrawal),
+                )
+                for withdrawal in changed
+            )
+        live.notify_users(
+            [withdrawal.user_id for withdrawal in changed],
+            [withdrawal.pk for withdrawal in changed],
+        )
+        return updated
+
     def approve_withdrawals(self, request, queryset):
         """Bulk action to approve withdrawal requests"""
-        updated = queryset.filter(status__in=["pending", "processing"]).update(
-            status="completed"
-        )
+        updated = self._bulk_set_status(queryset, "completed")
         self.message_user(
             request, f"Approved {updated} withdrawal request(s).", messages.SUCCESS
         )
@@ -444,9 +735,7 @@ class WithdrawalRequestAdmin(admin.ModelAdmin):
 
     def reject_withdrawals(self, request, queryset):
         """Bulk action to reject withdrawal requests"""
-        updated = queryset.filter(status__in=["pending", "processing"]).update(
-            status="rejected"
-        )
+        updated = self._bulk_set_status(queryset, "rejected")
         self.message_user(
             request, f"Rejected {updated} withdrawal request(s).", messages.WARNING
         )
@@ -482,3 +771,141 @@ class WithdrawalRequestAdmin(admin.ModelAdmin):
 admin.site.site_header = "HotmineAdmin"
 admin.site.site_title = "Hotmine Admin"
 admin.site.index_title = "Welcome HotmineAdmin"
+
+
+class ArchiveAdmin(ReplicaChangeListMixin, admin.ModelAdmin):
+    """Archived rows are history: browsable, never edited by hand"""
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ArchivedInvestment)
+class ArchivedInvestmentAdmin(ArchiveAdmin):
+    list_display = (
+        "id",
+        "user",
+        "investment_plan",
+        "amount",
+        "status",
+        "date_invested",
+    )
+    list_filter = ("status", "date_invested")
+    search_fields = ("user__username", "user__email")
+    list_select_related = ("user", "investment_plan")
+
+
+@admin.register(ArchivedWithdrawalRequest)
+class ArchivedWithdrawalRequestAdmin(ArchiveAdmin):
+    list_display = ("id", "user", "amount", "withdrawal_method", "status", "created_at")
+    list_filter = ("status", "withdrawal_method", "created_at")
+    search_fields = ("user__username", "user__email", "transaction_id")
+    list_select_related = ("user",)
+
+
+@admin.register(OutboxMessage)
+class OutboxMessageAdmin(admin.ModelAdmin):
+    """Queued notifications; only failed ones need a hand"""
+
+    list_display = ("id", "user", "event", "status", "attempts", "available_at")
+    list_filter = ("status", "event")
+    search_fields = ("user__username", "user__email")
+    list_select_related = ("user",)
+    readonly_fields = [field.name for field in OutboxMessage._meta.fields]
+    actions = ["retry_now"]
+
+    def has_add_permission(self, request):
+        return False
+
+    def retry_now(self, request, queryset):
+        updated = queryset.exclude(status="sent").update(
+            status="pending", attempts=0, available_at=timezone.now()
+        )
+        self.message_user(request, f"{updated} message(s) queued to send again.")
+
+    retry_now.short_description = "Retry selected messages now"
+
+
+@admin.register(JobLease)
+class JobLeaseAdmin(admin.ModelAdmin):
+    """The scheduler's jobs (hotmine/scheduler.py): timings, and a way to nudge one"""
+
+    list_display = (
+        "name",
+        "next_run_at",
+        "last_status",
+        "last_duration",
+        "average",
+        "max_duration",
+        "runs",
+        "failures",
+        "missed",
+        "owner",
+    )
+    readonly_fields = [field.name for field in JobLease._meta.fields]
+    actions = ["run_soon"]
+
+    def has_add_permission(self, request):
+        return False
+
+    def average(self, obj):
+        average = obj.average_duration
+        return None if average is None else round(average, 3)
+
+    average.short_description = "Avg duration"
+
+    def run_soon(self, request, queryset):
+        updated = queryset.update(next_run_at=timezone.now())
+        self.message_user(request, f"{updated} job(s) will run at the next check.")
+
+    run_soon.short_description = "Run selected jobs at the next check"
+
+
+# Request traces (hotmine/tracing.py), routed under admin/ by myproject/urls.py
+
+
+def traces_view(request):
+    """The latest kept request traces; ?o=slow for the slowest first"""
+    traces = tracing.recent()
+    if request.GET.get("o") == "slow":
+        traces.sort(key=lambda trace: trace["duration_ms"], reverse=True)
+    top = max((trace["duration_ms"] for trace in traces), default=0) or 1
+    for trace in traces:
+        trace["width"] = trace["duration_ms"] * 100 / top
+        trace["started"] = datetime.fromtimestamp(trace["start"] / 1e9, dt_timezone.utc)
+    context = {
+        **admin.site.each_context(request),
+        "title": "Request traces",
+        "traces": traces,
+        "tracing": tracing.enabled(),
+        "slowest_first": request.GET.get("o") == "slow",
+    }
+    return TemplateResponse(request, "admin/hotmine/traces.html", context)
+
+
+def trace_view(request, trace_id):
+    """One trace as a waterfall"""
+    trace = tracing.find(trace_id)
+    if trace is None:
+        raise Http404("No such trace")
+    rows = tracing.waterfall(trace)
+    # Queries and renders, and the time they took
+    totals = {}
+    for kind in ("sql", "template"):
+        spans = [row for row in rows if row["kind"] == kind]
+        totals[kind] = (len(spans), sum(row["ms"] for row in spans))
+    context = {
+        **admin.site.each_context(request),
+        "title": trace["name"],
+        "trace": trace,
+        "started": datetime.fromtimestamp(trace["start"] / 1e9, dt_timezone.utc),
+        "rows": rows,
+        "totals": totals,
+    }
+    return TemplateResponse(request, "admin/hotmine/trace.html", context)
@@ -0,0 +1,380 @@
+"""
+Read-only JSON API (v1) for the signed-in user's account numbers.
+
+The account pages are served as cached shells and fill in balances,
+investments and withdrawals from /api/v1/dashboard/ with a single request.
+Rows are read with values() so no model instances are built, and only the
+columns behind the requested fields are selected:
+
+    /api/v1/summary/?fields=amount,total_earnings
+    /api/v1/investments/?status=ACTIVE&fields=plan,amount,progress_percentage
+    /api/v1/withdrawals/?limit=5
+    /api/v1/dashboard/?fields=summary.amount,investments.plan
+    /api/v1/portfolio/?days=365
+
+orjson is used for encoding when installed, the standard json module otherwise.
+"""
+
+import json
+from decimal import Decimal
+from functools import wraps
+
+from django.contrib.auth.models import User
+from django.db.models import OuterRef, Subquery
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import require_http_methods
+
+from . import snapshots
+from .money import Money
+from .models import (
+    Amount,
+    Investment,
+    Totalearnings,
+    UserProfile,
+    WithdrawalRequest,
+    maturity_schedule,
+    totalwithdraw,
+)
+from .routers import replica
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+API_VERSION = 1
+MAX_LIMIT = 50
+CENT = Decimal("0.01")
+
+
+class FieldError(ValueError):
+    pass
+
+
+def _default(value):
+    # Money stays exact as a string; JS parses it for display
+    if isinstance(value, (Decimal, Money)):
+        return str(value)
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def dumps(data):
+    if orjson is not None:
+        return orjson.dumps(data, default=_default)
+    return json.dumps(data, default=_default, separators=(",", ":")).encode("utf-8")
+
+
+def api_response(data, status=200):
+    response = HttpResponse(dumps(data), content_type="application/json", status=status)
+    # Per-user data: never shared, always revalidated
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ("Cookie",))
+    return response
+
+
+def api_error(message, status):
+    return api_response({"error": message, "version": API_VERSION}, status=status)
+
+
+def api_view(view_func):
+    """
+    GET/HEAD only, 401 instead of a login redirect, and 400 for bad fields.
+    The data is read from a replica when one is usable.
+    """
+
+    @require_http_methods(["GET", "HEAD"])
+    @wraps(view_func)
+    def wrapped(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return api_error("Authentication required", 401)
+        try:
+            with replica():
+                data = view_func(request, *args, **kwargs)
+        except FieldError as e:
+            return api_error(str(e), 400)
+        return api_response({"version": API_VERSION, **data})
+
+    return wrapped
+
+
+def select_fields(requested, available):
+    """Validate a list of field names against the ones a resource offers"""
+    if not requested:
+        return list(available)
+    unknown = [name for name in requested if name not in available]
+    if unknown:
+        raise FieldError(
+            f"Unknown field(s): {', '.join(unknown)}. "
+            f"Available: {', '.join(available)}"
+        )
+    return requested
+
+
+def parse_fields(value):
+    return [name.strip() for name in (value or "").split(",") if name.strip()]
+
+
+def parse_limit(value, default):
+    try:
+        return max(1, min(int(value), MAX_LIMIT))
+    except (TypeError, ValueError):
+        return default
+
+
+# -- Summary ----------------------------------------------------------------
+
+
+def _first_value(model, column):
+    # Same row the pages used to show: .first() orders by pk
+    return Subquery(
+        model.objects.filter(user=OuterRef("pk")).order_by("pk").values(column)[:1]
+    )
+
+
+SUMMARY_FIELDS = {
+    "username": None,
+    "amount": lambda: _first_value(Amount, "amount"),
+    "total_earnings": lambda: _first_value(Totalearnings, "total_earnings"),
+    "total_withdraw": lambda: _first_value(totalwithdraw, "total_withdraw"),
+    "withdrawal_enabled": lambda: _first_value(UserProfile, "withdrawal_enabled"),
+}
+
+
+def get_summary(user, fields=None):
+    """Balances for one user in a single query"""
+    fields = select_fields(fields, SUMMARY_FIELDS)
+    # Prefixed, since names like "amount" clash with User's reverse relations
+    annotations = {
+        f"summary_{name}": SUMMARY_FIELDS[name]()
+        for name in fields
+        if SUMMARY_FIELDS[name]
+    }
+    values = (
+        User.objects.filter(pk=user.pk)
+        .annotate(**annotations)
+        .values(*(f"summary_{n}" if SUMMARY_FIELDS[n] else n for n in fields))[0]
+    )
+    row = {name.removeprefix("summary_"): value for name, value in values.items()}
+    for name in ("amount", "total_earnings", "total_withdraw"):
+        if name in row:
+            # total_earnings is Money (cents), the others Decimal
+            row[name] = Money.parse(row[name] or 0).to_decimal().quantize(CENT)
+    if "withdrawal_enabled" in row:
+        row["withdrawal_enabled"] = bool(row["withdrawal_enabled"])
+    return row
+
+
+# -- Investments --------------------------------------------------------------
+
+
+def _daily_earnings(row, today):
+    rate = row["investment_plan__daily_earnings_percentage"]
+    if rate is None or row["amount"] is None:
+        return None
+    return (rate / 100) * row["amount"]
+
+
+def _expected_total_earnings(row, today):
+    daily = _daily_earnings(row, today)
+    if daily is None:
+        return None
+    return daily * row["investment_plan__investment_duration_days"]
+
+
+def _expected_total_return(row, today):
+    earnings = _expected_total_earnings(row, today)
+    if earnings is None:
+        return None
+    if row["investment_plan__deposit_return"]:
+        return earnings + row["amount"]
+    return earnings
+
+
+def _schedule(row, today):
+    return maturity_schedule(
+        row["status"],
+        row["date_invested"],
+        row["matures_at"],
+        row["investment_plan__investment_duration_days"],
+        today,
+    )
+
+
+def _days_remaining(row, today):
+    return _schedule(row, today)[0]
+
+
+def _progress_percentage(row, today):
+    progress = _schedule(row, today)[1]
+    return None if progress is None else round(progress, 2)
+
+
+PLAN_TERMS = (
+    "amount",
+    "investment_plan__daily_earnings_percentage",
+    "investment_plan__investment_duration_days",
+)
+PLAN_SCHEDULE = (
+    "status",
+    "date_invested",
+    "matures_at",
+    "investment_plan__investment_duration_days",
+)
+
+# field: (columns it needs, computed from the row or None for a plain column)
+INVESTMENT_FIELDS = {
+    "id": (("id",), None),
+    "plan": (("investment_plan__title",), None),
+    "amount": (("amount",), None),
+    "status": (("status",), None),
+    "date_invested": (("date_invested",), None),
+    "date_completed": (("date_completed",), None),
+    "total_earnings": (("total_earnings",), None),
+    "daily_earnings": (PLAN_TERMS, _daily_earnings),
+    "expected_total_earnings": (PLAN_TERMS, _expected_total_earnings),
+    "expected_total_return": (
+        PLAN_TERMS + ("investment_plan__deposit_return",),
+        _expected_total_return,
+    ),
+    "days_remaining": (PLAN_SCHEDULE, _days_remaining),
+    "progress_percentage": (PLAN_SCHEDULE, _progress_percentage),
+}
+
+
+def get_investments(user, fields=None, status="ACTIVE", limit=MAX_LIMIT):
+    """A user's investments with their earnings metrics, newest first"""
+    fields = select_fields(fields, INVESTMENT_FIELDS)
+    needed = []
+    for name in fields:
+        for column in INVESTMENT_FIELDS[name][0]:
+            if column not in needed:
+                needed.append(column)
+
+    queryset = Investment.objects.filter(user=user)
+    if status and status != "all":
+        queryset = queryset.filter(status=status)
+    today = timezone.now().date()
+    results = []
+    for row in queryset.order_by("-date_invested").values(*needed)[:limit]:
+        item = {}
+        for name in fields:
+            columns, compute = INVESTMENT_FIELDS[name]
+            if compute is None:
+                item[name] = row[columns[0]]
+                continue
+            value = compute(row, today)
+            item[name] = value.quantize(CENT) if isinstance(value, Decimal) else value
+        results.append(item)
+    return results
+
+
+# -- Withdrawals --------------------------------------------------------------
+
+WITHDRAWAL_FIELDS = (
+    "id",
+    "amount",
+    "withdrawal_method",
+    "status",
+    "created_at",
+    "processed_at",
+    "transaction_id",
+)
+
+
+def get_withdrawals(user, fields=None, limit=5):
+    """A user's most recent withdrawal requests"""
+    fields = select_fields(fields, WITHDRAWAL_FIELDS)
+    return list(
+        WithdrawalRequest.objects.filter(user=user)
+        .order_by("-created_at")
+        .values(*fields)[:limit]
+    )
+
+
+# -- Portfolio ----------------------------------------------------------------
+
+MAX_PORTFOLIO_DAYS = 3660
+
+
+def get_portfolio(user, days=30):
+    """Chart points from the daily snapshots; each holds until the next"""
+    return [
+        dict(zip(("day", *snapshots.COLUMNS), row))
+        for row in snapshots.series(user, days)
+    ]
+
+
+# -- Views --------------------------------------------------------------------
+
+
+@api_view
+def summary(request):
+    fields = parse_fields(request.GET.get("fields"))
+    return {"summary": get_summary(request.user, fields)}
+
+
+@api_view
+def investments(request):
+    return {
+        "investments": get_investments(
+            request.user,
+            parse_fields(request.GET.get("fields")),
+            status=request.GET.get("status", "ACTIVE"),
+            limit=parse_limit(request.GET.get("limit"), MAX_LIMIT),
+        )
+    }
+
+
+@api_view
+def withdrawals(request):
+    return {
+        "withdrawals": get_withdrawals(
+            request.user,
+            parse_fields(request.GET.get("fields")),
+            limit=parse_limit(request.GET.get("limit"), 5),
+        )
+    }
+
+
+@api_view
+def portfolio(request):
+    try:
+        days = max(1, min(int(request.GET.get("days", 30)), MAX_PORTFOLIO_DAYS))
+    except (TypeError, ValueError):
+        days = 30
+    return {"days": days, "portfolio": get_portfolio(request.user, days)}
+
+
+SECTIONS = {
+    "summary": lambda user, fields: get_summary(user, fields),
+    "investments": lambda user, fields: get_investments(user, fields),
+    "withdrawals": lambda user, fields: get_withdrawals(user, fields),
+}
+
+
+@api_view
+def dashboard(request):
+    """
+    Everything the account pages show in one response. fields takes
+    section.field names; only the sections named are queried.
+    """
+    requested = {}
+    for name in parse_fields(request.GET.get("fields")):
+        section, _, field = name.partition(".")
+        if section not in SECTIONS:
+            raise FieldError(
+                f"Unknown section: {section}. Available: {', '.join(SECTIONS)}"
+            )
+        fields = requested.setdefault(section, [])
+        if field:
+            fields.append(field)
+    if not requested:
+        requested = {section: [] for section in SECTIONS}
+    return {
+        section: SECTIONS[section](request.user, fields)
+        for section, fields in requested.items()
+    }
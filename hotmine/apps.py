@@ -1,6 +1,18 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class HotmineConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "hotmine"
+
+    def ready(self):
+        # Register the plan catalog cache invalidation, live event, SQLite
+        # tuning and query tracing signals
+        from . import catalog, live, sqlite, tracing  # noqa: F401
+
+        # gunicorn.conf.py does the full warm-up; this is for other servers
+        if getattr(settings, "WARMUP_ON_READY", False):
+            from . import warmup
+
+            warmup.run(database=False)
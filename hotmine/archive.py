@@ -0,0 +1,325 @@
+"""
+Archival of finished investments and withdrawal requests.
+
+Completed/cancelled investments and completed/rejected/cancelled withdrawals
+older than ARCHIVE_AFTER_DAYS are moved, in small batches, from the hot
+tables into ArchivedInvestment and ArchivedWithdrawalRequest. The rows keep
+their ids. Every user-facing query scans the hot tables, so keeping finished
+rows out of them keeps those tables and their indexes small enough to stay
+in cache as the history grows.
+
+History pages read through both tables with the `history` manager:
+
+    Investment.history.filter(user=user).prefetch_related("investment_plan")
+
+which returns a ReadThrough: one ordered, sliceable sequence (a UNION ALL
+in SQL) of hot-model instances, with archived=True on the archived ones.
+
+Run by `manage.py archive_history`.
+
+Settings:
+    ARCHIVE_AFTER_DAYS    age, in days since a row finished, before it's archived
+    ARCHIVE_BATCH_SIZE    rows moved per transaction (default 500)
+    ARCHIVE_BATCH_SLEEP   seconds to pause between batches (default 0.2)
+"""
+
+import asyncio
+import time
+from datetime import timedelta
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.apps import apps
+from django.conf import settings
+from django.db import connections, models, router, transaction
+from django.db.models import BooleanField, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _attnames(model):
+    return [field.attname for field in model._meta.concrete_fields]
+
+
+class ReadThrough:
+    """
+    Rows of a hot model and its archive as one sequence of hot-model
+    instances. Supports what the history views, templates and Paginator use:
+    filter, order_by, prefetch_related, count, exists, slicing, iteration
+    and chunked iterator() for the streamed pages.
+    """
+
+    ordered = True
+
+    def __init__(
+        self,
+        model,
+        archive_model,
+        filters=(),
+        ordering=None,
+        prefetch=(),
+        bounds=(None, None),
+    ):
+        self.model = model
+        self.archive_model = archive_model
+        self.filters = filters
+        self.ordering = ordering or model._meta.ordering or ["-pk"]
+        self.prefetch = prefetch
+        self.bounds = bounds
+        self._result_cache = None
+
+    def _clone(self, **changes):
+        state = {
+            "filters": self.filters,
+            "ordering": self.ordering,
+            "prefetch": self.prefetch,
+            "bounds": self.bounds,
+            **changes,
+        }
+        return ReadThrough(self.model, self.archive_model, **state)
+
+    def filter(self, *args, **kwargs):
+        return self._clone(filters=self.filters + ((args, kwargs),))
+
+    def order_by(self, *fields):
+        return self._clone(ordering=list(fields))
+
+    def prefetch_related(self, *lookups):
+        return self._clone(prefetch=self.prefetch + lookups)
+
+    def _querysets(self):
+        hot = self.model._default_manager.all()
+        cold = self.archive_model._default_manager.all()
+        for args, kwargs in self.filters:
+            hot = hot.filter(*args, **kwargs)
+            cold = cold.filter(*args, **kwargs)
+        return hot, cold
+
+    def _union(self):
+        names = _attnames(self.model)
+        hot, cold = self._querysets()
+        flag = BooleanField()
+        # The halves can't carry their own (default) ordering into a UNION
+        union = (
+            hot.order_by()
+            .annotate(archived=Value(False, output_field=flag))
+            .values_list(*names, "archived")
+            .union(
+                cold.order_by()
+                .annotate(archived=Value(True, output_field=flag))
+                .values_list(*names, "archived"),
+                all=True,
+            )
+            .order_by(*self.ordering)
+        )
+        return union, names
+
+    def _objects(self, db, names, rows):
+        objects = []
+        for row in rows:
+            obj = self.model.from_db(db, names, row[:-1])
+            obj.archived = row[-1]
+            objects.append(obj)
+        if self.prefetch:
+            models.prefetch_related_objects(objects, *self.prefetch)
+        return objects
+
+    def _fetch(self):
+        start, stop = self.bounds
+        union, names = self._union()
+        return self._objects(union.db, names, union[start:stop])
+
+    def iterator(self, chunk_size=2000):
+        """
+        Yield the rows like QuerySet.iterator(): fetched chunk_size at a time
+        (from a server-side cursor where there is one), prefetching per
+        chunk, so memory doesn't grow with the row count
+        """
+        start, stop = self.bounds
+        union, names = self._union()
+        rows = union[start:stop].iterator(chunk_size)
+        while chunk := list(islice(rows, chunk_size)):
+            yield from self._objects(union.db, names, chunk)
+
+    def exists(self):
+        if self._result_cache is not None:
+            return bool(self._result_cache)
+        hot, cold = self._querysets()
+        return hot.exists() or cold.exists()
+
+    def count(self):
+        if self._result_cache is not None:
+            return len(self._result_cache)
+        hot, cold = self._querysets()
+        return hot.count() + cold.count()
+
+    def aggregate(self, **aggregates):
+        """Only for additive aggregates (Count, Sum): each table's are added"""
+        hot, cold = self._querysets()
+        return self._combine(hot.aggregate(**aggregates), cold.aggregate(**aggregates))
+
+    async def aaggregate(self, **aggregates):
+        hot, cold = self._querysets()
+        results = await asyncio.gather(
+            hot.aaggregate(**aggregates), cold.aaggregate(**aggregates)
+        )
+        return self._combine(*results)
+
+    @staticmethod
+    def _combine(first, second):
+        combined = {}
+        for name, value in first.items():
+            other = second[name]
+            combined[name] = value if other is None else (value or 0) + other
+        return combined
+
+    async def aslice(self, start=None, stop=None):
+        """The rows between start and stop, fetched from async code"""
+        return await sync_to_async(list)(self[start:stop])
+
+    def __iter__(self):
+        if self._result_cache is None:
+            self._result_cache = self._fetch()
+        return iter(self._result_cache)
+
+    def __len__(self):
+        return len(list(iter(self)))
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def __getitem__(self, key):
+        if self._result_cache is not None:
+            return self._result_cache[key]
+        if self.bounds != (None, None):
+            raise TypeError("Cannot slice a ReadThrough that is already sliced")
+        if isinstance(key, slice):
+            if key.step is not None:
+                raise ValueError("ReadThrough slices don't support a step")
+            # Lazy like a QuerySet slice, so Paginator doesn't query early
+            return self._clone(bounds=(key.start, key.stop))
+        return list(self._clone(bounds=(key, key + 1)))[0]
+
+
+class ReadThroughManager(models.Manager):
+    """
+    `history` manager for hot models with an archive: filter() and all()
+    return a ReadThrough over both tables. The model's default manager stays
+    a plain one, so admin, writes and related lookups only see hot rows.
+    """
+
+    def __init__(self, archive_model_name):
+        super().__init__()
+        self.archive_model_name = archive_model_name
+
+    def _read_through(self):
+        archive = apps.get_model(self.model._meta.app_label, self.archive_model_name)
+        return ReadThrough(self.model, archive)
+
+    def all(self):
+        return self._read_through()
+
+    def filter(self, *args, **kwargs):
+        return self._read_through().filter(*args, **kwargs)
+
+
+# -- Moving rows --------------------------------------------------------------
+
+
+def _archivable_investments(cutoff):
+    Investment = apps.get_model("hotmine", "Investment")
+    return (
+        Investment.objects.filter(status__in=["COMPLETED", "CANCELLED"])
+        .annotate(finished_at=Coalesce("date_completed", "date_invested"))
+        .filter(finished_at__lt=cutoff)
+    )
+
+
+def _archivable_withdrawals(cutoff):
+    WithdrawalRequest = apps.get_model("hotmine", "WithdrawalRequest")
+    return (
+        WithdrawalRequest.objects.filter(
+            status__in=["completed", "rejected", "cancelled"]
+        )
+        .annotate(finished_at=Coalesce("processed_at", "updated_at"))
+        .filter(finished_at__lt=cutoff)
+    )
+
+
+# name: (hot model, archive model, rows ready to archive before a cutoff)
+ARCHIVES = {
+    "investments": ("Investment", "ArchivedInvestment", _archivable_investments),
+    "withdrawals": (
+        "WithdrawalRequest",
+        "ArchivedWithdrawalRequest",
+        _archivable_withdrawals,
+    ),
+}
+
+
+def archive_batch(name, cutoff, batch_size):
+    """Move up to batch_size rows into the archive; returns how many moved"""
+    hot_name, archive_name, archivable = ARCHIVES[name]
+    hot_model = apps.get_model("hotmine", hot_name)
+    archive_model = apps.get_model("hotmine", archive_name)
+    db = router.db_for_write(hot_model)
+    names = _attnames(hot_model)
+
+    with transaction.atomic(using=db):
+        candidates = archivable(cutoff).using(db).order_by("pk")
+        if connections[db].features.has_select_for_update_skip_locked:
+            # Rows an admin is editing right now wait for the next run
+            candidates = candidates.select_for_update(skip_locked=True, of=("self",))
+        ids = list(candidates.values_list("pk", flat=True)[:batch_size])
+        if not ids:
+            return 0
+        now = timezone.now()
+        rows = hot_model.objects.using(db).filter(pk__in=ids).values(*names)
+        archive_model.objects.using(db).bulk_create(
+            [archive_model(archived_at=now, **row) for row in rows]
+        )
+        hot_model.objects.using(db).filter(pk__in=ids).delete()
+    return len(ids)
+
+
+def archive(name, days=None, batch_size=None, pause=None, max_batches=None):
+    """Archive everything ready for one table, a throttled batch at a time"""
+    days = _setting("ARCHIVE_AFTER_DAYS", 180) if days is None else days
+    batch_size = batch_size or _setting("ARCHIVE_BATCH_SIZE", 500)
+    pause = _setting("ARCHIVE_BATCH_SLEEP", 0.2) if pause is None else pause
+    cutoff = timezone.now() - timedelta(days=days)
+    moved = batches = 0
+    while max_batches is None or batches < max_batches:
+        count = archive_batch(name, cutoff, batch_size)
+        moved += count
+        batches += 1
+        if count < batch_size:
+            break
+        time.sleep(pause)
+    return moved
+
+
+def pending(name, days=None):
+    days = _setting("ARCHIVE_AFTER_DAYS", 180) if days is None else days
+    return ARCHIVES[name][2](timezone.now() - timedelta(days=days)).count()
+
+
+def table_sizes(name):
+    """{"hot": (rows, bytes or None), "archive": (...)} for one archive pair"""
+    sizes = {}
+    for side, model_name in zip(("hot", "archive"), ARCHIVES[name][:2]):
+        model = apps.get_model("hotmine", model_name)
+        connection = connections[router.db_for_read(model)]
+        size = None
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT pg_total_relation_size(%s)", [model._meta.db_table]
+                )
+                size = cursor.fetchone()[0]
+        sizes[side] = (model._default_manager.count(), size)
+    return sizes
@@ -0,0 +1,403 @@
+"""
+Static asset build stage: CSS purging, CSS/JS minification and per-page
+stylesheet bundles. Runs inside collectstatic (see hotmine/storage.py) on the
+files already copied to STATIC_ROOT, before they are hashed and compressed.
+
+Pages opt in with the {% stylesheets %} tag from hotmine/templatetags/assets.py:
+
+    {% stylesheets "dashboard" "hotmine/dashboard.css" "hotmine/bootstrap.css" %}
+
+The builder finds those tags in the templates, keeps only the CSS rules whose
+classes and ids appear in that page (plus any template extending it, the
+JavaScript it loads and the classes hotmine/forms.py gives its widgets), and
+writes hotmine/bundles/<page>.css.
+"""
+
+import posixpath
+import re
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+
+BUNDLE_DIR = "hotmine/bundles"
+TEMPLATE_DIR = Path(__file__).resolve().parent / "templates"
+FORMS_MODULE = Path(__file__).resolve().parent / "forms.py"
+
+STYLESHEETS_TAG = re.compile(r"{%\s*stylesheets\s+(.+?)\s*%}")
+STATIC_JS = re.compile(r"""{%\s*static\s+['"]([^'"]+\.js)['"]\s*%}""")
+EXTENDS_TAG = re.compile(r"""{%\s*extends\s+['"]([^'"]+)['"]\s*%}""")
+QUOTED = re.compile(r"""['"]([^'"]+)['"]""")
+TOKEN = re.compile(r"[A-Za-z_][\w-]*")
+DYNAMIC_PREFIX = re.compile(r"([A-Za-z_][\w-]*-)\{[{%]")
+WIDGET_CLASS = re.compile(r"""['"]class['"]\s*:\s*['"]([^'"]+)['"]""")
+
+# Classes bootstrap.bundle.js and our inline scripts toggle at runtime
+SAFELIST = {
+    "active",
+    "show",
+    "showing",
+    "hide",
+    "hiding",
+    "hidden",
+    "fade",
+    "collapse",
+    "collapsing",
+    "disabled",
+    "modal-open",
+    "modal-backdrop",
+    "modal-static",
+    "offcanvas-backdrop",
+    "was-validated",
+    "is-valid",
+    "is-invalid",
+}
+
+# Prefixes for classes that only appear in Python-rendered markup ({% price_ticker %})
+SAFELIST_PREFIXES = (
+    "bs-",
+    "tooltip",
+    "popover",
+    "carousel-item-",
+    "price-ticker",
+    "ticker-",
+)
+
+SELECTOR_CLASS = re.compile(r"\.(-?[A-Za-z_][\w-]*)")
+SELECTOR_ID = re.compile(r"#(-?[A-Za-z_][\w-]*)")
+NEGATION = re.compile(r":(?:not|where|has)\((?:[^()]|\([^()]*\))*\)")
+ATTRIBUTE = re.compile(r"\[[^\]]*\]")
+CSS_URL = re.compile(r"""url\(\s*(['"]?)([^'")]+)\1\s*\)""")
+URL_SUFFIX = re.compile(r"([^?#]*)(.*)")
+
+# At-rules whose body is more rules and can be purged recursively
+NESTED_AT_RULES = ("@media", "@supports", "@container", "@layer", "@document")
+
+
+# -- CSS --------------------------------------------------------------------
+
+
+def _css_chunks(css):
+    """Split CSS into ("code" | "string" | "comment", text) chunks"""
+    i, start, n = 0, 0, len(css)
+    while i < n:
+        c = css[i]
+        if c in "\"'":
+            if i > start:
+                yield "code", css[start:i]
+            j = i + 1
+            while j < n and css[j] != c:
+                j += 2 if css[j] == "\\" else 1
+            yield "string", css[i : j + 1]
+            i = start = j + 1
+        elif css.startswith("/*", i):
+            if i > start:
+                yield "code", css[start:i]
+            j = css.find("*/", i + 2)
+            j = n if j < 0 else j + 2
+            yield "comment", css[i:j]
+            i = start = j
+        else:
+            i += 1
+    if start < n:
+        yield "code", css[start:]
+
+
+def minify_css(css):
+    out = []
+    for kind, text in _css_chunks(css):
+        if kind == "comment":
+            continue
+        if kind == "code":
+            text = re.sub(r"\s+", " ", text)
+            text = re.sub(r"\s*([{};,>])\s*", r"\1", text)
+            text = re.sub(r":\s+", ":", text)
+        out.append(text)
+    return "".join(out).replace(";}", "}").strip()
+
+
+def _css_blocks(css):
+    """Top-level (prelude, body) pairs; body is None for ; statements"""
+    i, start, n = 0, 0, len(css)
+    while i < n:
+        c = css[i]
+        if c in "\"'":
+            i += 1
+            while i < n and css[i] != c:
+                i += 2 if css[i] == "\\" else 1
+            i += 1
+        elif c == ";":
+            yield css[start : i + 1].strip(), None
+            i = start = i + 1
+        elif c == "{":
+            depth, j = 1, i + 1
+            while j < n and depth:
+                if css[j] in "\"'":
+                    quote = css[j]
+                    j += 1
+                    while j < n and css[j] != quote:
+                        j += 2 if css[j] == "\\" else 1
+                elif css[j] == "{":
+                    depth += 1
+                elif css[j] == "}":
+                    depth -= 1
+                j += 1
+            yield css[start:i].strip(), css[i + 1 : j - 1]
+            i = start = j
+        else:
+            i += 1
+
+
+def _split_selectors(prelude):
+    parts, depth, start = [], 0, 0
+    for i, c in enumerate(prelude):
+        if c in "([":
+            depth += 1
+        elif c in ")]":
+            depth -= 1
+        elif c == "," and depth == 0:
+            parts.append(prelude[start:i])
+            start = i + 1
+    parts.append(prelude[start:])
+    return [part.strip() for part in parts if part.strip()]
+
+
+class UsedNames:
+    """The class names and ids a page can reference"""
+
+    def __init__(self, tokens, prefixes=()):
+        self.tokens = set(tokens) | SAFELIST
+        self.prefixes = tuple(prefixes) + SAFELIST_PREFIXES
+
+    def __contains__(self, name):
+        return name in self.tokens or name.startswith(self.prefixes)
+
+    def selector_used(self, selector):
+        stripped = ATTRIBUTE.sub("", NEGATION.sub("", selector))
+        names = SELECTOR_CLASS.findall(stripped) + SELECTOR_ID.findall(stripped)
+        return all(name in self for name in names)
+
+
+def purge_css(css, used):
+    """Drop the rules whose selectors reference classes or ids the page never uses"""
+    out = []
+    for prelude, body in _css_blocks(css):
+        if body is None:
+            out.append(prelude)
+        elif prelude.startswith(NESTED_AT_RULES):
+            inner = purge_css(body, used)
+            if inner:
+                out.append(f"{prelude}{{{inner}}}")
+        elif prelude.startswith("@"):
+            out.append(f"{prelude}{{{body}}}")
+        else:
+            selectors = [s for s in _split_selectors(prelude) if used.selector_used(s)]
+            if selectors:
+                out.append(f"{','.join(selectors)}{{{body}}}")
+    return "".join(out)
+
+
+def rebase_urls(css, source_name, target_name):
+    """Rewrite relative url() references when moving CSS to another directory"""
+    source_dir = posixpath.dirname(source_name)
+    target_dir = posixpath.dirname(target_name)
+
+    def rebase(match):
+        quote, url = match.groups()
+        if url.startswith(("data:", "http:", "https:", "//", "/", "#")):
+            return match.group(0)
+        path, suffix = URL_SUFFIX.match(url).groups()
+        absolute = posixpath.normpath(posixpath.join(source_dir, path))
+        relative = posixpath.relpath(absolute, target_dir)
+        return f"url({quote}{relative}{suffix}{quote})"
+
+    return CSS_URL.sub(rebase, css)
+
+
+# -- JavaScript ---------------------------------------------------------------
+
+# A "/" after one of these starts a regex literal rather than a division
+REGEX_PRECEDERS = set("(,=:[!&|?{};+-*%<>~^")
+REGEX_KEYWORD = re.compile(r"(?:^|[^\w$])(?:return|typeof|case|in|of|delete|void)$")
+
+
+def minify_js(source):
+    """
+    Conservative minifier: removes comments, indentation and blank lines but
+    never joins statements, so automatic semicolon insertion is unaffected.
+    Strings, template literals and regex literals are copied verbatim.
+    """
+    out, line = [], []
+    i, n = 0, len(source)
+    last = ""  # last significant character, for regex detection
+    raw = False  # current line starts inside a multi-line template literal
+
+    def flush(verbatim=False):
+        text = "".join(line)
+        if verbatim:
+            out.append(text)
+        elif raw:
+            out.append(text.rstrip())
+        elif text.strip():
+            out.append(text.strip())
+        line.clear()
+
+    while i < n:
+        c = source[i]
+        if c == "\n":
+            flush()
+            raw = False
+            i += 1
+            continue
+        if c in "\"'`":
+            j = i + 1
+            while j < n and source[j] != c:
+                if source[j] == "\\":
+                    j += 1
+                elif c != "`" and source[j] == "\n":
+                    break
+                j += 1
+            # Multi-line template literals keep their whitespace exactly
+            chunk = source[i : j + 1]
+            if "\n" in chunk:
+                pieces = chunk.split("\n")
+                line.append(pieces[0])
+                for piece in pieces[1:]:
+                    flush(verbatim=True)
+                    line.append(piece)
+                raw = True
+            else:
+                line.append(chunk)
+            last = c
+            i = j + 1
+            continue
+        if source.startswith("//", i):
+            j = source.find("\n", i)
+            i = n if j < 0 else j
+            continue
+        if source.startswith("/*", i):
+            j = source.find("*/", i + 2)
+            i = n if j < 0 else j + 2
+            line.append(" ")
+            continue
+        if c == "/":
+            prefix = "".join(line).rstrip()
+            if not prefix or last in REGEX_PRECEDERS or REGEX_KEYWORD.search(prefix):
+                j, in_class = i + 1, False
+                while j < n and source[j] != "\n":
+                    if source[j] == "\\":
+                        j += 1
+                    elif source[j] == "[":
+                        in_class = True
+                    elif source[j] == "]":
+                        in_class = False
+                    elif source[j] == "/" and not in_class:
+                        break
+                    j += 1
+                line.append(source[i : j + 1])
+                last = "/"
+                i = j + 1
+                continue
+        line.append(c)
+        if not c.isspace():
+            last = c
+        i += 1
+    flush()
+    return "\n".join(out) + "\n"
+
+
+# -- Build ------------------------------------------------------------------
+
+
+def _read_template(name):
+    path = TEMPLATE_DIR / name
+    return path.read_text(encoding="utf-8") if path.exists() else ""
+
+
+def find_page_bundles():
+    """{bundle name: (template names using it, stylesheet paths)} from the templates"""
+    templates = {
+        str(path.relative_to(TEMPLATE_DIR)): path.read_text(encoding="utf-8")
+        for path in TEMPLATE_DIR.rglob("*.html")
+    }
+    children = {}
+    for name, text in templates.items():
+        match = EXTENDS_TAG.search(text)
+        if match:
+            children.setdefault(match.group(1), []).append(name)
+
+    bundles = {}
+    for name, text in templates.items():
+        for match in STYLESHEETS_TAG.finditer(text):
+            args = QUOTED.findall(match.group(1))
+            if len(args) < 2:
+                continue
+            family, pending = [], [name]
+            while pending:
+                current = pending.pop()
+                family.append(current)
+                pending.extend(children.get(current, []))
+            bundles[args[0]] = (family, args[1:])
+    return bundles
+
+
+def form_classes():
+    """
+    The classes forms.py puts in widget attrs. Templates render those forms
+    with {{ form.field }}, so the names never appear in them; any page may
+    show any form.
+    """
+    text = FORMS_MODULE.read_text(encoding="utf-8") if FORMS_MODULE.exists() else ""
+    return [name for value in WIDGET_CLASS.findall(text) for name in value.split()]
+
+
+def used_names_for(template_names, storage):
+    text = "\n".join(_read_template(name) for name in template_names)
+    for script in set(STATIC_JS.findall(text)):
+        if storage.exists(script):
+            with storage.open(script) as f:
+                text += "\n" + f.read().decode("utf-8", "replace")
+    return UsedNames(TOKEN.findall(text) + form_classes(), DYNAMIC_PREFIX.findall(text))
+
+
+def _replace(storage, name, data):
+    if storage.exists(name):
+        storage.delete(name)
+    storage.save(name, ContentFile(data.encode("utf-8")))
+
+
+def build(storage, paths):
+    """
+    Minify hotmine CSS/JS in STATIC_ROOT in place and write the per-page
+    bundles. Returns {name: (storage, name)} for every file it wrote, so
+    collectstatic hashes and compresses these copies rather than re-reading
+    the originals from the app's static directory.
+    """
+    written = {}
+    for name in list(paths):
+        if not name.startswith("hotmine/") or name.startswith(BUNDLE_DIR):
+            continue
+        if ".min." in name or not name.endswith((".css", ".js")):
+            continue
+        with storage.open(name) as f:
+            original = f.read().decode("utf-8")
+        minified = minify_css(original) if name.endswith(".css") else minify_js(original)
+        if len(minified) < len(original):
+            _replace(storage, name, minified)
+            written[name] = (storage, name)
+
+    if not getattr(settings, "ASSET_BUNDLES", True):
+        return written
+    for bundle, (templates, stylesheets) in find_page_bundles().items():
+        used = used_names_for(templates, storage)
+        target = f"{BUNDLE_DIR}/{bundle}.css"
+        parts = []
+        for stylesheet in stylesheets:
+            if not storage.exists(stylesheet):
+                continue
+            with storage.open(stylesheet) as f:
+                css = minify_css(f.read().decode("utf-8"))
+            parts.append(purge_css(rebase_urls(css, stylesheet, target), used))
+        _replace(storage, target, "".join(parts))
+        written[target] = (storage, target)
+    return written
@@ -0,0 +1,216 @@
+"""
+Full-page caching for anonymous visitors, and for account page shells.
+
+Only requests without a session or messages cookie are served from cache, so
+nothing user-specific can leak into a cached page and the hit path never
+loads a session or touches the database. Pages containing a CSRF token are
+cached with a placeholder and get a fresh token for every visitor; those are
+marked private so a CDN won't share them, while token-free pages are public.
+
+Account pages whose HTML carries no user data (the numbers come from the
+JSON API, see hotmine/api.py) are cached once as a shell and served to every
+signed-in user.
+
+Pages are cached per path. The query string is left out of the key unless
+the view names the parameters its page depends on, so made-up query strings
+all get the one cached page instead of a fresh render and cache entry each.
+
+Both decorators wrap sync and async views alike.
+"""
+
+import re
+from functools import wraps
+from urllib.parse import urlencode
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.utils.cache import patch_cache_control, patch_vary_headers
+
+from .catalog import get_catalog_version
+
+CSRF_VALUE = re.compile(rb'(name="csrfmiddlewaretoken" value=")[^"]+(")')
+CSRF_PLACEHOLDER = b"__hotmine_csrf_token__"
+
+PAGE_KEY = "page:{prefix}:{version}:{path}"
+SHELL_KEY = "shell:{prefix}:{path}"
+
+
+def _is_anonymous_visit(request):
+    if request.method not in ("GET", "HEAD"):
+        return False
+    cookies = request.COOKIES
+    return (
+        settings.SESSION_COOKIE_NAME not in cookies
+        and getattr(settings, "MESSAGES_COOKIE_NAME", "messages") not in cookies
+    )
+
+
+def _page_key(request, query=()):
+    path = request.path
+    params = [(name, value) for name in query for value in request.GET.getlist(name)]
+    if params:
+        path = f"{path}?{urlencode(params)}"
+    return PAGE_KEY.format(
+        prefix=getattr(settings, "PAGE_CACHE_KEY_PREFIX", ""),
+        version=get_catalog_version(),
+        path=path,
+    )
+
+
+def _patch_headers(response, has_csrf, cdn_max_age):
+    patch_vary_headers(response, ("Cookie",))
+    if has_csrf or not cdn_max_age:
+        patch_cache_control(response, private=True, max_age=0)
+    else:
+        patch_cache_control(
+            response, public=True, max_age=cdn_max_age, s_maxage=cdn_max_age
+        )
+
+
+def _from_page_cache(request, entry, cdn_max_age):
+    content, content_type, has_csrf = entry
+    if has_csrf:
+        content = content.replace(CSRF_PLACEHOLDER, get_token(request).encode())
+    response = HttpResponse(content, content_type=content_type)
+    response["X-Page-Cache"] = "hit"
+    _patch_headers(response, has_csrf, cdn_max_age)
+    return response
+
+
+def _page_entry(response, cdn_max_age):
+    """The cache entry for a fresh anonymous response, or None if not cacheable"""
+    if response.status_code != 200 or response.streaming or response.cookies:
+        return None
+    content, count = CSRF_VALUE.subn(
+        rb"\g<1>" + CSRF_PLACEHOLDER + rb"\g<2>", response.content
+    )
+    has_csrf = count > 0
+    response["X-Page-Cache"] = "miss"
+    _patch_headers(response, has_csrf, cdn_max_age)
+    return content, response["Content-Type"], has_csrf
+
+
+def cache_anonymous_page(timeout, cdn_max_age=0, query=()):
+    """
+    Serve a view's GET response from cache for visitors without a session.
+    `query` names the query parameters the page changes with; any others
+    are ignored.
+    """
+
+    def decorator(view_func):
+        if iscoroutinefunction(view_func):
+
+            @wraps(view_func)
+            async def async_wrapped(request, *args, **kwargs):
+                if not _is_anonymous_visit(request):
+                    response = await view_func(request, *args, **kwargs)
+                    patch_cache_control(response, private=True)
+                    return response
+
+                # The key needs the catalog version, which may query
+                key = await sync_to_async(_page_key)(request, query)
+                entry = await cache.aget(key)
+                if entry is not None:
+                    return _from_page_cache(request, entry, cdn_max_age)
+                response = await view_func(request, *args, **kwargs)
+                entry = _page_entry(response, cdn_max_age)
+                if entry is not None:
+                    await cache.aset(key, entry, timeout)
+                return response
+
+            return async_wrapped
+
+        @wraps(view_func)
+        def wrapped(request, *args, **kwargs):
+            if not _is_anonymous_visit(request):
+                response = view_func(request, *args, **kwargs)
+                patch_cache_control(response, private=True)
+                return response
+
+            key = _page_key(request, query)
+            entry = cache.get(key)
+            if entry is not None:
+                return _from_page_cache(request, entry, cdn_max_age)
+            response = view_func(request, *args, **kwargs)
+            entry = _page_entry(response, cdn_max_age)
+            if entry is not None:
+                cache.set(key, entry, timeout)
+            return response
+
+        return wrapped
+
+    return decorator
+
+
+def _shell_key(request):
+    return SHELL_KEY.format(
+        prefix=getattr(settings, "PAGE_CACHE_KEY_PREFIX", ""),
+        path=request.path,
+    )
+
+
+def _from_shell_cache(entry):
+    content, content_type = entry
+    response = HttpResponse(content, content_type=content_type)
+    response["X-Page-Cache"] = "hit"
+    return response
+
+
+def _shell_entry(response):
+    if response.status_code != 200 or response.streaming:
+        return None
+    response["X-Page-Cache"] = "miss"
+    return response.content, response["Content-Type"]
+
+
+def cache_page_shell(timeout):
+    """
+    Serve a signed-in page from one cached render shared by all users. Only
+    for templates with no user data, CSRF token or messages in them.
+    """
+
+    def decorator(view_func):
+        if iscoroutinefunction(view_func):
+
+            @wraps(view_func)
+            async def async_wrapped(request, *args, **kwargs):
+                if request.method not in ("GET", "HEAD"):
+                    return await view_func(request, *args, **kwargs)
+
+                key = _shell_key(request)
+                entry = await cache.aget(key)
+                if entry is not None:
+                    response = _from_shell_cache(entry)
+                else:
+                    response = await view_func(request, *args, **kwargs)
+                    entry = _shell_entry(response)
+                    if entry is not None:
+                        await cache.aset(key, entry, timeout)
+                patch_cache_control(response, private=True)
+                return response
+
+            return async_wrapped
+
+        @wraps(view_func)
+        def wrapped(request, *args, **kwargs):
+            if request.method not in ("GET", "HEAD"):
+                return view_func(request, *args, **kwargs)
+
+            key = _shell_key(request)
+            entry = cache.get(key)
+            if entry is not None:
+                response = _from_shell_cache(entry)
+            else:
+                response = view_func(request, *args, **kwargs)
+                entry = _shell_entry(response)
+                if entry is not None:
+                    cache.set(key, entry, timeout)
+            patch_cache_control(response, private=True)
+            return response
+
+        return wrapped
+
+    return decorator
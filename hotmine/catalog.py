@@ -0,0 +1,117 @@
+"""
+Cached investment plan catalog.
+
+The active plans change only when an admin edits them, so they are cached
+under a catalog version. The version is derived from the plan and wallet
+tables and dropped from the cache whenever either changes, which also
+invalidates the {% cache %} fragments keyed on it.
+
+Each plan's counters (investors, amount invested, capacity left; see
+hotmine/planstats.py) change with every investment, so they're cached on
+their own, under a version of their own, and dropped whenever a change to
+them commits.
+"""
+
+from django.core.cache import cache
+from django.db.models import Count, Max
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import CryptoWallet, InvestmentPlan, InvestmentPlanStats
+
+VERSION_KEY = "plans:catalog-version"
+PLANS_KEY = "plans:active:{version}"
+STATS_KEY = "plans:stats"
+
+# With a per-process cache another worker's edit only becomes visible once
+# the version expires; with a shared cache the delete below is immediate.
+VERSION_TIMEOUT = 60
+PLANS_TIMEOUT = 60 * 60 * 24
+# Same for counters changed in another worker
+STATS_TIMEOUT = 60
+
+
+def _compute_version():
+    plans = InvestmentPlan.objects.aggregate(
+        count=Count("id"), latest=Max("updated_at")
+    )
+    wallets = CryptoWallet.objects.aggregate(
+        count=Count("id"), latest=Max("updated_at")
+    )
+    stamps = [
+        value.timestamp() if value else 0
+        for value in (plans["latest"], wallets["latest"])
+    ]
+    return f"{plans['count']}.{wallets['count']}.{int(max(stamps) * 1000)}"
+
+
+def get_catalog_version():
+    """Current plan catalog version, for cache keys and {% cache %} fragments"""
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        version = _compute_version()
+        cache.set(VERSION_KEY, version, VERSION_TIMEOUT)
+    return version
+
+
+def get_active_plans():
+    """Active plans in display order, with their wallets, served from cache"""
+    key = PLANS_KEY.format(version=get_catalog_version())
+    plans = cache.get(key)
+    if plans is None:
+        plans = list(
+            InvestmentPlan.objects.filter(is_active=True)
+            .select_related("crypto_wallet")
+            .order_by("sort_order", "title")
+        )
+        cache.set(key, plans, PLANS_TIMEOUT)
+    return plans
+
+
+def get_active_plan(plan_id):
+    """Look up one active plan from the cached catalog"""
+    for plan in get_active_plans():
+        if str(plan.id) == str(plan_id):
+            return plan
+    return None
+
+
+def get_plan_stats():
+    """
+    (version, {plan id: InvestmentPlanStats}) for every plan, served from
+    cache; the version changes whenever a counter does
+    """
+    cached = cache.get(STATS_KEY)
+    if cached is None:
+        stats = {row.plan_id: row for row in InvestmentPlanStats.objects.all()}
+        latest = max((row.updated_at for row in stats.values()), default=None)
+        version = int(latest.timestamp() * 1000) if latest else 0
+        cached = (version, stats)
+        cache.set(STATS_KEY, cached, STATS_TIMEOUT)
+    return cached
+
+
+def get_active_plans_with_stats():
+    """get_active_plans() with each plan's counters on plan.stats, and their version"""
+    version, stats = get_plan_stats()
+    plans = get_active_plans()
+    for plan in plans:
+        # Plans come out of the cache as copies, so this stays per request
+        plan.stats = stats.get(plan.pk) or InvestmentPlanStats(plan_id=plan.pk)
+    return plans, version
+
+
+def invalidate_catalog():
+    cache.delete(VERSION_KEY)
+
+
+def invalidate_stats():
+    cache.delete(STATS_KEY)
+
+
+@receiver(post_save, sender=InvestmentPlan)
+@receiver(post_delete, sender=InvestmentPlan)
+@receiver(post_save, sender=CryptoWallet)
+@receiver(post_delete, sender=CryptoWallet)
+def plan_catalog_changed(sender, **kwargs):
+    invalidate_catalog()
@@ -0,0 +1,301 @@
+"""
+Liability forecast over the active investment book.
+
+How much the platform will owe, per day, over the coming months: daily
+earnings still to accrue on active investments, deposits coming back at
+maturity (plans with deposit_return) and withdrawals waiting for approval.
+Day 0 holds what is owed already: earned days the settlement engine hasn't
+credited yet, matured deposits it hasn't returned and pending withdrawals.
+
+The book is read once (from a replica when there is one) into columns, one
+entry per investment: daily earnings, deposit returned, the day accrual
+resumes, the maturity day and the plan. The curves come from difference
+arrays, so the cost is one pass over the book plus one over the horizon,
+whatever the durations. With NumPy installed the columns are NumPy arrays
+and the passes are bincount/cumsum; without it they are array-module
+columns and a plain loop, which is fine for small books. Amounts are floats
+here: it's a forecast, rounded to cents on output.
+
+Shown on the admin's investment forecast page, exported by
+`manage.py forecast_liabilities`.
+
+Settings:
+    FORECAST_HORIZONS   day counts summarised on the admin page (default 30, 90, 365)
+"""
+
+import csv
+import random
+import time
+from array import array
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Investment, InvestmentPlan, WithdrawalRequest
+from .routers import replica
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+PENDING_WITHDRAWALS = ("pending", "processing")
+
+
+def horizons():
+    return tuple(getattr(settings, "FORECAST_HORIZONS", (30, 90, 365)))
+
+
+class Book:
+    """
+    The active investment book as columns. Day offsets are relative to
+    `today`: accrual covers the days after `start` up to and including
+    `end`, and the deposit comes back on day `end`.
+    """
+
+    def __init__(self, today, plans):
+        self.today = today
+        self.plans = plans  # titles, indexed by the plan column
+        self.daily = array("d")
+        self.deposit = array("d")
+        self.start = array("q")
+        self.end = array("q")
+        self.plan = array("q")
+        self.withdrawals = 0.0
+
+    def __len__(self):
+        return len(self.daily)
+
+    def add(self, plan, daily, deposit, start, end):
+        self.plan.append(plan)
+        self.daily.append(daily)
+        self.deposit.append(deposit)
+        self.start.append(start)
+        self.end.append(end)
+
+    @classmethod
+    def load(cls, today=None, chunk_size=10000):
+        """Read the active book, from a replica when one is usable"""
+        today = today or timezone.now().date()
+        with replica():
+            terms = {
+                pk: (index, title, rate, deposit_return, days)
+                for index, (pk, title, rate, deposit_return, days) in enumerate(
+                    InvestmentPlan.objects.order_by("pk").values_list(
+                        "pk",
+                        "title",
+                        "daily_earnings_percentage",
+                        "deposit_return",
+                        "investment_duration_days",
+                    )
+                )
+            }
+            book = cls(today, [terms[pk][1] or f"Plan {pk}" for pk in terms])
+            rows = (
+                Investment.objects.filter(
+                    status="ACTIVE", investment_plan__isnull=False
+                )
+                .values_list(
+                    "investment_plan_id",
+                    "amount",
+                    "date_invested",
+                    "matures_at",
+                    "last_accrued_on",
+                )
+                .order_by()
+                .iterator(chunk_size=chunk_size)
+            )
+            for plan_id, amount, invested, matures, accrued in rows:
+                index, _, rate, deposit_return, days = terms[plan_id]
+                amount = float(amount or 0)
+                invested = invested.date()
+                matures = matures.date() if matures else invested + timedelta(days)
+                book.add(
+                    index,
+                    amount * float(rate) / 100,
+                    amount if deposit_return else 0.0,
+                    ((accrued or invested) - today).days,
+                    (matures - today).days,
+                )
+            pending = WithdrawalRequest.objects.filter(
+                status__in=PENDING_WITHDRAWALS
+            ).values_list("amount", flat=True)
+            book.withdrawals = float(sum(amount or 0 for amount in pending))
+        return book
+
+    @classmethod
+    def synthetic(cls, size, plans=8, seed=0):
+        """A random book of `size` investments, for benchmarking"""
+        today = timezone.now().date()
+        book = cls(today, [f"Plan {n + 1}" for n in range(plans)])
+        rng = random.Random(seed)
+        terms = [
+            (rng.uniform(0.5, 5), rng.choice((7, 30, 90, 180, 365)))
+            for _ in range(plans)
+        ]
+        for _ in range(size):
+            plan = rng.randrange(plans)
+            rate, days = terms[plan]
+            amount = rng.uniform(100, 10000)
+            invested = -rng.randrange(days)
+            book.add(
+                plan,
+                amount * rate / 100,
+                amount if plan % 2 else 0.0,
+                invested + rng.randrange(2) - 1,
+                invested + days,
+            )
+        return book
+
+
+class Forecast:
+    """Per-day liability curves, index 0 being today's outstanding amounts"""
+
+    def __init__(self, book, horizon, accruals, deposits):
+        self.today = book.today
+        self.horizon = horizon
+        self.plans = book.plans
+        self.size = len(book)
+        # Per-day curves for each plan, in the order of self.plans
+        self.plan_accruals = accruals
+        self.plan_deposits = deposits
+        self.accruals = [sum(day) for day in zip(*accruals)] or [0.0] * (horizon + 1)
+        self.deposits = [sum(day) for day in zip(*deposits)] or [0.0] * (horizon + 1)
+        self.withdrawals = [book.withdrawals] + [0.0] * horizon
+
+    def day(self, n):
+        return self.today + timedelta(days=n)
+
+    def totals(self, days):
+        """Cumulative amounts owed from today through day `days`"""
+        days = min(days, self.horizon) + 1
+        accruals = sum(self.accruals[:days])
+        deposits = sum(self.deposits[:days])
+        withdrawals = sum(self.withdrawals[:days])
+        return {
+            "accruals": accruals,
+            "deposits": deposits,
+            "withdrawals": withdrawals,
+            "total": accruals + deposits + withdrawals,
+        }
+
+    def cumulative(self):
+        """Running total owed, day by day"""
+        running, curve = 0.0, []
+        for n in range(self.horizon + 1):
+            running += self.accruals[n] + self.deposits[n] + self.withdrawals[n]
+            curve.append(running)
+        return curve
+
+    def plan_totals(self, days):
+        """Accruals + deposits owed through day `days`, per plan"""
+        days = min(days, self.horizon) + 1
+        return [
+            sum(accruals[:days]) + sum(deposits[:days])
+            for accruals, deposits in zip(self.plan_accruals, self.plan_deposits)
+        ]
+
+    def rows(self, per_plan=False):
+        """CSV rows: a header, then one row per day"""
+        header = [
+            "date",
+            "accruals",
+            "deposit_returns",
+            "withdrawals",
+            "total",
+            "cumulative",
+        ]
+        if per_plan:
+            header += [f"{plan} accruals" for plan in self.plans]
+            header += [f"{plan} deposit_returns" for plan in self.plans]
+        yield header
+        cumulative = self.cumulative()
+        for n in range(self.horizon + 1):
+            values = [
+                self.accruals[n],
+                self.deposits[n],
+                self.withdrawals[n],
+                self.accruals[n] + self.deposits[n] + self.withdrawals[n],
+                cumulative[n],
+            ]
+            if per_plan:
+                values += [curve[n] for curve in self.plan_accruals]
+                values += [curve[n] for curve in self.plan_deposits]
+            yield [self.day(n).isoformat()] + [f"{value:.2f}" for value in values]
+
+
+def _curves_numpy(book, horizon):
+    plans = max(len(book.plans), 1)
+    width = horizon + 2
+    daily = np.frombuffer(book.daily, dtype=np.float64)
+    deposit = np.frombuffer(book.deposit, dtype=np.float64)
+    start = np.frombuffer(book.start, dtype=np.int64)
+    end = np.frombuffer(book.end, dtype=np.int64)
+    row = np.frombuffer(book.plan, dtype=np.int64) * width
+
+    def per_plan(positions, weights, rows=row):
+        counts = np.bincount(rows + positions, weights=weights, minlength=plans * width)
+        return counts.reshape(plans, width)
+
+    # Day d accrues when start < d <= end: +daily from start + 1, -daily
+    # after end, then a running sum. Days up to today go to day 0.
+    diff = per_plan(np.clip(start, 0, horizon) + 1, daily)
+    diff -= per_plan(np.clip(np.maximum(start, end), 0, horizon) + 1, daily)
+    accruals = np.cumsum(diff, axis=1)
+    backlog = np.clip(np.minimum(end, 0) - start, 0, None) * daily
+    accruals[:, 0] = per_plan(np.zeros_like(start), backlog)[:, 0]
+    due = end <= horizon
+    deposits = per_plan(np.clip(end[due], 0, None), deposit[due], row[due])
+    return accruals[:, : horizon + 1].tolist(), deposits[:, : horizon + 1].tolist()
+
+
+def _curves_python(book, horizon):
+    plans = max(len(book.plans), 1)
+    accruals = [[0.0] * (horizon + 2) for _ in range(plans)]
+    deposits = [[0.0] * (horizon + 2) for _ in range(plans)]
+    for plan, daily, deposit, start, end in zip(
+        book.plan, book.daily, book.deposit, book.start, book.end
+    ):
+        diff = accruals[plan]
+        diff[min(max(start, 0), horizon) + 1] += daily
+        diff[min(max(start, end, 0), horizon) + 1] -= daily
+        diff[0] += max(0, min(end, 0) - start) * daily
+        if end <= horizon:
+            deposits[plan][max(end, 0)] += deposit
+    for diff in accruals:
+        backlog, running = diff[0], 0.0
+        for n in range(1, horizon + 2):
+            running += diff[n]
+            diff[n] = running
+        diff[0] = backlog
+    return (
+        [curve[: horizon + 1] for curve in accruals],
+        [curve[: horizon + 1] for curve in deposits],
+    )
+
+
+def forecast(book=None, horizon=None):
+    """Liability curves for the next `horizon` days (default: longest horizon)"""
+    book = Book.load() if book is None else book
+    horizon = horizon or max(horizons())
+    curves = _curves_numpy if np is not None else _curves_python
+    accruals, deposits = curves(book, horizon)
+    return Forecast(
+        book, horizon, accruals[: len(book.plans)], deposits[: len(book.plans)]
+    )
+
+
+def write_csv(result, stream, per_plan=False):
+    writer = csv.writer(stream)
+    for row in result.rows(per_plan):
+        writer.writerow(row)
+
+
+def benchmark(size, horizon=None, seed=0):
+    """(seconds to build a synthetic book, seconds to forecast it)"""
+    started = time.perf_counter()
+    book = Book.synthetic(size, seed=seed)
+    built = time.perf_counter()
+    forecast(book, horizon)
+    return built - started, time.perf_counter() - built
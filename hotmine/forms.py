@@ -3,6 +3,7 @@ from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from .models import UserProfile
+from .accounts import email_in_use, get_user_by_email
 from django.contrib.auth.forms import SetPasswordForm
 from django.core.exceptions import ValidationError
 import re
@@ -48,7 +49,8 @@ class SignUpForm(UserCreationForm):
             "password2",
         )
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, request=None, **kwargs):
+        self.request = request
         super().__init__(*args, **kwargs)
         self.fields["username"].widget.attrs.update(
             {"class": "form-control", "placeholder": "Username"}
@@ -62,7 +64,7 @@ class SignUpForm(UserCreationForm):
 
     def clean_email(self):
         email = self.cleaned_data.get("email")
-        if User.objects.filter(email=email).exists():
+        if email_in_use(email, request=self.request):
             raise ValidationError("A user with this email already exists.")
         return email
 
@@ -118,11 +120,9 @@ class LoginForm(AuthenticationForm):
         username = self.cleaned_data.get("username")
         # Allow login with email
         if "@" in username:
-            try:
-                user = User.objects.get(email=username)
+            user = get_user_by_email(username, request=self.request)
+            if user is not None:
                 return user.username
-            except User.DoesNotExist:
-                pass
         return username
 
 
@@ -162,9 +162,10 @@ class UserUpdateForm(forms.ModelForm):
         model = User
         fields = ("first_name", "last_name", "username", "email")
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, request=None, **kwargs):
         # Extract the user instance if provided
         self.user = kwargs.get("instance")
+        self.request = request
         super().__init__(*args, **kwargs)
 
         # Update widget attributes
@@ -179,13 +180,8 @@ class UserUpdateForm(forms.ModelForm):
     def clean_email(self):
         email = self.cleaned_data.get("email")
         # Check if email is taken by another user (excluding current user)
-        if self.user:
-            existing_user = User.objects.filter(email=email).exclude(pk=self.user.pk)
-            if existing_user.exists():
-                raise ValidationError("A user with this email already exists.")
-        else:
-            if User.objects.filter(email=email).exists():
-                raise ValidationError("A user with this email already exists.")
+        if email_in_use(email, exclude_user=self.user, request=self.request):
+            raise ValidationError("A user with this email already exists.")
         return email
 
     def clean_username(self):
@@ -341,13 +337,17 @@ class EmailVerificationForm(forms.Form):
         help_text="Enter the same password as before, for verification.",
     )
 
+    def __init__(self, *args, request=None, **kwargs):
+        self.request = request
+        self.user = None
+        super().__init__(*args, **kwargs)
+
     def clean_email(self):
         email = self.cleaned_data.get("email")
 
         # Check if user with this email exists
-        try:
-            user = User.objects.get(email=email)
-        except User.DoesNotExist:
+        self.user = get_user_by_email(email, request=self.request)
+        if self.user is None:
             raise ValidationError("No account found with this email address.")
 
         return email
@@ -376,14 +376,13 @@ class EmailVerificationForm(forms.Form):
 
     def save(self, commit=True):
         """Save the new password for the user"""
-        email = self.cleaned_data.get("email")
         password = self.cleaned_data.get("new_password1")
 
-        try:
-            user = User.objects.get(email=email)
-            user.set_password(password)
-            if commit:
-                user.save()
-            return user
-        except User.DoesNotExist:
+        # Reuse the account resolved in clean_email instead of a second lookup
+        user = self.user
+        if user is None:
             return None
+        user.set_password(password)
+        if commit:
+            user.save()
+        return user
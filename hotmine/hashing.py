@@ -0,0 +1,51 @@
+"""
+A small dedicated thread pool for password hashing.
+
+PBKDF2 is deliberately slow CPU work. The async login view hands
+form.is_valid() (authenticate() and its hash) to this pool, so at most
+PASSWORD_HASH_WORKERS hashes run at once per process. A burst of logins
+queues here instead of taking over the threads that serve every other page.
+
+Settings:
+    PASSWORD_HASH_WORKERS  threads in the pool (default 2)
+"""
+
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(
+                max_workers=getattr(settings, "PASSWORD_HASH_WORKERS", 2),
+                thread_name_prefix="hotmine-hash",
+            )
+        return _pool
+
+
+def _call(func, args, kwargs):
+    # Pool threads live outside the request cycle, so they look after their
+    # own database connection like any other long-running worker
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def run(func, *args, **kwargs):
+    """Await func(*args, **kwargs) on the hashing pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_pool(), functools.partial(_call, func, args, kwargs)
+    )
@@ -0,0 +1,129 @@
+"""
+Image optimization for static assets, run inside collectstatic alongside the
+CSS/JS build stage (see hotmine/storage.py).
+
+For every PNG/JPG under hotmine/images the original is recompressed in place,
+narrower variants are written next to it (name.w640.png) and each size also
+gets a WebP copy (name.w640.webp, name.webp). The dimensions of everything
+produced are recorded in hotmine/images/variants.json, which the {% picture %}
+tag reads to emit <picture>/srcset markup with intrinsic sizes. All of these
+files go through the manifest storage, so they are content-hashed and served
+by WhiteNoise with far-future cache headers.
+
+Pillow is optional: without it the stage is skipped and {% picture %} falls
+back to a plain <img>.
+"""
+
+import io
+import json
+import logging
+import posixpath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+
+try:
+    from PIL import Image
+except ImportError:  # pragma: no cover - optional dependency
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+IMAGE_DIR = "hotmine/images"
+MANIFEST_NAME = f"{IMAGE_DIR}/variants.json"
+VARIANT_WIDTHS = (320, 640, 960, 1280)
+WEBP_QUALITY = 80
+JPEG_QUALITY = 82
+
+# Tiny icons gain nothing from variants
+MIN_VARIANT_WIDTH = 64
+
+
+def _encode(image, fmt):
+    buffer = io.BytesIO()
+    if fmt == "WEBP":
+        image.save(buffer, "WEBP", quality=WEBP_QUALITY, method=6)
+    elif fmt == "JPEG":
+        image.convert("RGB").save(
+            buffer, "JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True
+        )
+    else:
+        image.save(buffer, "PNG", optimize=True)
+    return buffer.getvalue()
+
+
+def _write(storage, name, data):
+    if storage.exists(name):
+        storage.delete(name)
+    storage.save(name, ContentFile(data))
+
+
+def _variant_name(name, width, ext=None):
+    root, original_ext = posixpath.splitext(name)
+    suffix = f".w{width}" if width else ""
+    return f"{root}{suffix}{ext or original_ext}"
+
+
+def optimize_image(storage, name):
+    """Recompress one image and write its variants; returns (written, entry)"""
+    with storage.open(name) as f:
+        original = f.read()
+    image = Image.open(io.BytesIO(original))
+    image.load()
+    # Some assets are PNGs with a .jpg name; keep whatever they really are
+    fmt = "JPEG" if image.format == "JPEG" else "PNG"
+    width, height = image.size
+    written = {}
+
+    recompressed = _encode(image, fmt)
+    if len(recompressed) < len(original):
+        _write(storage, name, recompressed)
+        written[name] = (storage, name)
+
+    entry = {"width": width, "height": height, "sources": []}
+    if width < MIN_VARIANT_WIDTH:
+        return written, entry
+
+    widths = [w for w in VARIANT_WIDTHS if w < width] + [width]
+    mime = f"image/{fmt.lower()}"
+    for target in widths:
+        resized = image
+        if target == width:
+            entry["sources"].append({"name": name, "width": width, "type": mime})
+        else:
+            resized = image.resize(
+                (target, max(1, round(height * target / width))), Image.LANCZOS
+            )
+            variant = _variant_name(name, target)
+            _write(storage, variant, _encode(resized, fmt))
+            written[variant] = (storage, variant)
+            entry["sources"].append({"name": variant, "width": target, "type": mime})
+        webp = _variant_name(name, target if target != width else None, ".webp")
+        _write(storage, webp, _encode(resized, "WEBP"))
+        written[webp] = (storage, webp)
+        entry["sources"].append({"name": webp, "width": target, "type": "image/webp"})
+    return written, entry
+
+
+def build(storage, paths):
+    """Optimize every image under IMAGE_DIR; returns {name: (storage, name)} written"""
+    if Image is None or not getattr(settings, "IMAGE_PIPELINE", True):
+        return {}
+
+    written, manifest = {}, {}
+    for name in sorted(paths):
+        if not name.startswith(IMAGE_DIR + "/"):
+            continue
+        if not name.lower().endswith((".png", ".jpg", ".jpeg")):
+            continue
+        try:
+            files, entry = optimize_image(storage, name)
+        except Exception:
+            logger.exception("Could not optimize %s", name)
+            continue
+        written.update(files)
+        manifest[name] = entry
+
+    _write(storage, MANIFEST_NAME, json.dumps(manifest, indent=1).encode("utf-8"))
+    written[MANIFEST_NAME] = (storage, MANIFEST_NAME)
+    return written
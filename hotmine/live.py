@@ -0,0 +1,392 @@
+"""
+Live account updates over server-sent events.
+
+Browsers on the account pages keep one EventSource open to /events/. When a
+user's balances or withdrawal requests change, every connection of that user
+gets a fresh "summary" event (the /api/v1/ summary shape) and, for
+withdrawals, a "withdrawal" event with the new status.
+
+Each process keeps a hub of connected users and one change channel:
+
+    PostgresChannel  LISTEN on a NOTIFY channel; saves send pg_notify with the
+                     user id once their transaction commits
+    PollingChannel   every LIVE_POLL_INTERVAL seconds, one query per table for
+                     rows of connected users changed since the last poll
+
+The connections are plain asyncio queues. Under ASGI, myproject/asgi.py
+routes /events/ straight to asgi_events() below: going through Django's
+handler would keep a thread-sensitive executor thread alive per open stream,
+while the bare endpoint costs a queue and a task, so one worker holds
+thousands of idle connections. Skipping the handler skips the middleware
+too, so asgi_events() checks the Host against ALLOWED_HOSTS itself and sends
+nosniff; see myproject/asgi.py for what it goes without.
+
+The Django view serves the same stream to ASGI servers that send every
+request through Django. Under WSGI (runserver included) Django collects an
+async streaming response whole before sending any of it, so an endless
+stream would never send a byte and hold its thread for good; the view
+answers 501 there instead, which is why LIVE_EVENTS is only switched on
+for ASGI deploys.
+
+Settings:
+    LIVE_EVENTS          serve the stream and have the pages connect to it
+    LIVE_CHANNEL         "auto" (postgres when on Postgres), "postgres" or "polling"
+    LIVE_POLL_INTERVAL   seconds between polls (default 2)
+    LIVE_HEARTBEAT       seconds between keep-alive comments (default 20)
+"""
+
+import asyncio
+import json
+import logging
+from datetime import timedelta
+
+from http.cookies import SimpleCookie
+from importlib import import_module
+from types import SimpleNamespace
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import aget_user
+from django.contrib.auth.models import User
+from django.core.handlers.asgi import ASGIRequest
+from django.db import close_old_connections, connection, connections, transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.http.request import split_domain_port, validate_host
+from django.utils import timezone
+from django.views.decorators.http import require_GET
+
+from . import api
+from .models import Amount, Totalearnings, WithdrawalRequest, totalwithdraw
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_CHANNEL = "hotmine_account_events"
+BALANCE_MODELS = (Amount, Totalearnings, totalwithdraw)
+# Per-connection backlog; a client that falls this far behind only needs the
+# latest summary anyway
+QUEUE_SIZE = 16
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+# -- Publishing -----------------------------------------------------------------
+
+
+def _pg_notify(payload):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_notify(%s, %s)", [NOTIFY_CHANNEL, payload])
+
+
+def notify_users(user_ids, withdrawal_ids=()):
+    """Tell connected clients these users changed, once the transaction commits"""
+    if connection.vendor != "postgresql" or not _setting("LIVE_EVENTS", False):
+        return  # the polling channel finds changes by updated_at
+    payload = json.dumps(
+        {"users": sorted(set(user_ids)), "withdrawals": sorted(set(withdrawal_ids))}
+    )
+    transaction.on_commit(lambda: _pg_notify(payload))
+
+
+@receiver(post_save, sender=Amount)
+@receiver(post_save, sender=Totalearnings)
+@receiver(post_save, sender=totalwithdraw)
+def balance_saved(sender, instance, **kwargs):
+    if instance.user_id:
+        notify_users([instance.user_id])
+
+
+@receiver(post_save, sender=WithdrawalRequest)
+def withdrawal_saved(sender, instance, **kwargs):
+    notify_users([instance.user_id], [instance.id])
+
+
+# -- Payloads -----------------------------------------------------------------
+
+WITHDRAWAL_FIELDS = ("id", "user_id", "amount", "status", "processed_at")
+STATUS_DISPLAY = dict(WithdrawalRequest.WITHDRAWAL_STATUS_CHOICES)
+
+
+def _load_changes(user_ids, withdrawal_ids):
+    """{user_id: [(event, data), ...]} for the users that changed"""
+    # Runs outside the request cycle, so drop connections the server closed
+    close_old_connections()
+    events = {}
+    for user_id in user_ids:
+        events[user_id] = [("summary", api.get_summary(User(pk=user_id)))]
+    for row in WithdrawalRequest.objects.filter(
+        id__in=withdrawal_ids, user_id__in=user_ids
+    ).values(*WITHDRAWAL_FIELDS):
+        row["status_display"] = STATUS_DISPLAY.get(row["status"], row["status"])
+        events[row.pop("user_id")].append(("withdrawal", row))
+    return events
+
+
+def format_event(event, data):
+    return f"event: {event}\ndata: {api.dumps(data).decode('utf-8')}\n\n"
+
+
+# -- Hub ----------------------------------------------------------------------
+
+
+class Hub:
+    """The connected users of this process and their event queues"""
+
+    def __init__(self):
+        self.queues = {}
+        self.task = None
+
+    def user_ids(self):
+        return list(self.queues)
+
+    def subscribe(self, user_id):
+        queue = asyncio.Queue(QUEUE_SIZE)
+        self.queues.setdefault(user_id, set()).add(queue)
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._run())
+        return queue
+
+    def unsubscribe(self, user_id, queue):
+        queues = self.queues.get(user_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self.queues[user_id]
+
+    async def publish(self, user_ids, withdrawal_ids=()):
+        user_ids = [u for u in set(user_ids) if u in self.queues]
+        if not user_ids:
+            return
+        changes = await sync_to_async(_load_changes, thread_sensitive=True)(
+            user_ids, list(withdrawal_ids)
+        )
+        for user_id, events in changes.items():
+            messages = "".join(format_event(e, d) for e, d in events)
+            for queue in list(self.queues.get(user_id, ())):
+                if queue.full():
+                    queue.get_nowait()
+                queue.put_nowait(messages)
+
+    async def _run(self):
+        channel = get_channel()
+        while True:
+            try:
+                await channel.listen(self)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Live event channel failed; restarting")
+                await asyncio.sleep(5)
+
+
+class PollingChannel:
+    """Finds changed rows of connected users by their updated_at"""
+
+    def __init__(self, interval=2):
+        self.interval = interval
+
+    def changes_since(self, user_ids, since):
+        close_old_connections()
+        users, withdrawals = set(), set()
+        for model in BALANCE_MODELS:
+            users.update(
+                model.objects.filter(
+                    user_id__in=user_ids, updated_at__gt=since
+                ).values_list("user_id", flat=True)
+            )
+        for withdrawal_id, user_id in WithdrawalRequest.objects.filter(
+            user_id__in=user_ids, updated_at__gt=since
+        ).values_list("id", "user_id"):
+            users.add(user_id)
+            withdrawals.add(withdrawal_id)
+        return users, withdrawals
+
+    async def listen(self, hub):
+        # A little overlap so rows committed during the previous poll aren't
+        # missed; a duplicate summary is harmless
+        since = timezone.now()
+        changes = sync_to_async(self.changes_since, thread_sensitive=True)
+        while True:
+            await asyncio.sleep(self.interval)
+            now = timezone.now()
+            user_ids = hub.user_ids()
+            if user_ids:
+                users, withdrawals = await changes(user_ids, since)
+                await hub.publish(users, withdrawals)
+            since = now - timedelta(seconds=self.interval / 2)
+
+
+class PostgresChannel:
+    """LISTENs on its own connection and wakes on NOTIFY via the event loop"""
+
+    def _connect(self):
+        import psycopg2
+        from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+
+        params = connections["default"].get_connection_params()
+        conn = psycopg2.connect(**params)
+        conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+        with conn.cursor() as cursor:
+            cursor.execute(f"LISTEN {NOTIFY_CHANNEL}")
+        return conn
+
+    async def listen(self, hub):
+        conn = await sync_to_async(self._connect, thread_sensitive=True)()
+        loop = asyncio.get_running_loop()
+        ready = asyncio.Event()
+        loop.add_reader(conn.fileno(), ready.set)
+        try:
+            while True:
+                await ready.wait()
+                ready.clear()
+                conn.poll()
+                users, withdrawals = set(), set()
+                while conn.notifies:
+                    payload = json.loads(conn.notifies.pop(0).payload)
+                    users.update(payload["users"])
+                    withdrawals.update(payload["withdrawals"])
+                if users:
+                    await hub.publish(users, withdrawals)
+        finally:
+            loop.remove_reader(conn.fileno())
+            conn.close()
+
+
+def get_channel():
+    name = _setting("LIVE_CHANNEL", "auto")
+    if name == "auto":
+        name = "postgres" if connection.vendor == "postgresql" else "polling"
+    if name == "postgres":
+        return PostgresChannel()
+    return PollingChannel(_setting("LIVE_POLL_INTERVAL", 2))
+
+
+hub = Hub()
+
+
+async def stream(user_id):
+    """The event stream for one connection: a snapshot, then changes"""
+    queue = hub.subscribe(user_id)
+    heartbeat = _setting("LIVE_HEARTBEAT", 20)
+    try:
+        snapshot = await sync_to_async(_load_changes, thread_sensitive=True)(
+            [user_id], []
+        )
+        yield f"retry: 5000\n{format_event('summary', snapshot[user_id][0][1])}"
+        while True:
+            try:
+                yield await asyncio.wait_for(queue.get(), heartbeat)
+            except asyncio.TimeoutError:
+                # Comment line: keeps proxies from closing an idle stream
+                yield ": ping\n\n"
+    finally:
+        hub.unsubscribe(user_id, queue)
+
+
+@require_GET
+async def events(request):
+    """Server-sent events for the signed-in user's account pages"""
+    if not _setting("LIVE_EVENTS", False):
+        raise Http404("Live events are off")
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(
+            "Live events need an ASGI server", status=501, content_type="text/plain"
+        )
+    user = await request.auser()
+    if not user.is_authenticated:
+        return HttpResponse(status=401)
+    response = StreamingHttpResponse(stream(user.pk), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    # Stop nginx-style proxies from buffering the stream
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+STREAM_HEADERS = [
+    (b"content-type", b"text/event-stream"),
+    (b"cache-control", b"no-cache"),
+    (b"x-accel-buffering", b"no"),
+    # What SecurityMiddleware would have added
+    (b"x-content-type-options", b"nosniff"),
+]
+
+
+def _allowed_host(scope):
+    """HttpRequest.get_host()'s ALLOWED_HOSTS check, for the bare endpoint"""
+    host = ""
+    for name, value in scope.get("headers", []):
+        if name == b"host":
+            host = value.decode("latin-1")
+            break
+    if not host and scope.get("server"):
+        host = scope["server"][0]
+    domain, _ = split_domain_port(host)
+    allowed_hosts = settings.ALLOWED_HOSTS
+    if settings.DEBUG and not allowed_hosts:
+        allowed_hosts = [".localhost", "127.0.0.1", "[::1]"]
+    return bool(domain) and validate_host(domain, allowed_hosts)
+
+
+async def _session_user_id(scope):
+    cookies = SimpleCookie()
+    for name, value in scope.get("headers", []):
+        if name == b"cookie":
+            cookies.load(value.decode("latin-1"))
+    morsel = cookies.get(settings.SESSION_COOKIE_NAME)
+    if morsel is None:
+        return None
+    engine = import_module(settings.SESSION_ENGINE)
+    # aget_user only needs request.session; it also checks the session hash,
+    # so streams stop authenticating after a password change like pages do
+    request = SimpleNamespace(session=engine.SessionStore(morsel.value))
+    user = await aget_user(request)
+    return user.pk if user.is_authenticated else None
+
+
+async def _send_plain(send, status, body):
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"text/plain")],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+async def asgi_events(scope, receive, send):
+    """/events/ as a bare ASGI app, bypassing Django's per-request thread"""
+    if not _allowed_host(scope):
+        return await _send_plain(send, 400, b"Bad Request")
+    if not _setting("LIVE_EVENTS", False):
+        return await _send_plain(send, 404, b"Live events are off")
+    if scope["method"] not in ("GET", "HEAD"):
+        return await _send_plain(send, 405, b"Method not allowed")
+    user_id = await _session_user_id(scope)
+    if user_id is None:
+        return await _send_plain(send, 401, b"Authentication required")
+
+    async def pump():
+        await send(
+            {"type": "http.response.start", "status": 200, "headers": STREAM_HEADERS}
+        )
+        async for chunk in stream(user_id):
+            body = chunk.encode()
+            await send({"type": "http.response.body", "body": body, "more_body": True})
+
+    async def disconnected():
+        while (await receive())["type"] != "http.disconnect":
+            pass
+
+    sender = asyncio.create_task(pump())
+    watcher = asyncio.create_task(disconnected())
+    try:
+        await asyncio.wait({sender, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        sender.cancel()
+        watcher.cancel()
+    if not sender.cancelled() and sender.done() and sender.exception():
+        logger.error("Live event stream failed", exc_info=sender.exception())
@@ -0,0 +1,356 @@
+"""
+Structured logging that stays off the request path.
+
+Every record goes to one QueueHandler on the root logger. On the calling
+thread it only gets its message merged with its args, the request's ID
+attached and a put_nowait onto a bounded queue; a listener thread takes
+records off in batches, formats them as one-line JSON and writes each batch
+to the sinks with a single write and flush. When the queue is full (the
+sinks can't keep up) records are dropped and counted rather than blocking
+the request, and the listener logs how many went missing.
+
+RequestLogMiddleware gives each request an ID, taken from the
+LOG_REQUEST_ID_HEADER request header when a proxy set a sane one, sends it
+back in X-Request-ID and puts it on every record logged while the request
+runs, so a request's lines can be found together. It also logs one line per
+request with its view, status and duration.
+
+Busy views can be sampled: LOG_SAMPLING maps URL names to the share of
+their requests whose INFO and DEBUG records are kept (the whole request's
+or none of them). Warnings and errors are always kept.
+
+Sinks are "stderr", "stdout" or a file path; with none, records are
+discarded.
+
+Settings:
+    LOG_LEVEL              root level (default INFO)
+    LOG_SINKS              where records go (default ["stderr"])
+    LOG_QUEUE_SIZE         records held before dropping (default 10000)
+    LOG_BATCH_SIZE         most records per write (default 500)
+    LOG_SAMPLING           {url name: share of requests logged}
+    LOG_REQUEST_ID_HEADER  request header with an incoming ID (default X-Request-ID)
+"""
+
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject, empty
+
+logger = logging.getLogger(__name__)
+requests_logger = logging.getLogger("hotmine.requests")
+
+REQUEST_ID_HEADER = "X-Request-ID"
+REQUEST_ID = re.compile(r"^[A-Za-z0-9._:-]{1,64}$")
+
+# Attributes every LogRecord has; anything else came in through extra=
+RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+# Ends the listener once the records before it are written
+_STOP = object()
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class RequestContext:
+    """What records logged during one request share"""
+
+    def __init__(self, request_id):
+        self.request_id = request_id
+        self.sampled = True
+
+
+_context = ContextVar("hotmine_log_context", default=None)
+
+
+def current_request_id():
+    context = _context.get()
+    return context.request_id if context else None
+
+
+# -- Records ------------------------------------------------------------------
+
+
+class RequestFilter(logging.Filter):
+    """Stamps records with the request ID and drops unsampled INFO/DEBUG"""
+
+    def filter(self, record):
+        context = _context.get()
+        if context is None:
+            # django.request logs errors after the middleware returned, with
+            # the request attached
+            request = getattr(record, "request", None)
+            record.request_id = getattr(request, "request_id", None)
+            return True
+        if not context.sampled and record.levelno < logging.WARNING:
+            return False
+        record.request_id = context.request_id
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One compact JSON object per record; extra= fields are kept"""
+
+    def format(self, record):
+        data = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(
+                timespec="milliseconds"
+            ),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            data["request_id"] = record.request_id
+        for name, value in vars(record).items():
+            if name not in RECORD_ATTRIBUTES and name != "request_id":
+                data[name] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data["exc"] = record.exc_text
+        if record.stack_info:
+            data["stack"] = record.stack_info
+        return json.dumps(data, default=str, separators=(",", ":"))
+
+
+# -- Sinks --------------------------------------------------------------------
+
+
+class BatchMixin:
+    def emit_batch(self, records):
+        lines = []
+        for record in records:
+            if record.levelno < self.level or not self.filter(record):
+                continue
+            try:
+                lines.append(self.format(record))
+            except Exception:
+                self.handleError(record)
+        if not lines:
+            return
+        try:
+            with self.lock:
+                self.stream.write("\n".join(lines) + "\n")
+                self.flush()
+        except Exception:
+            self.handleError(records[-1])
+
+
+class BatchStreamHandler(BatchMixin, logging.StreamHandler):
+    pass
+
+
+class BatchFileHandler(BatchMixin, logging.handlers.WatchedFileHandler):
+    def emit_batch(self, records):
+        # Reopens the file when logrotate moved it
+        self.reopenIfNeeded()
+        super().emit_batch(records)
+
+
+def sink(name):
+    if name in ("stderr", "stdout"):
+        handler = BatchStreamHandler(getattr(sys, name))
+    else:
+        handler = BatchFileHandler(name, encoding="utf-8")
+    handler.setFormatter(JsonFormatter())
+    return handler
+
+
+# -- Queue --------------------------------------------------------------------
+
+
+class Listener:
+    """Writes queued records to the sinks a batch at a time, on its own thread"""
+
+    def __init__(self, records, sinks, batch_size):
+        self.records = records
+        self.sinks = sinks
+        self.batch_size = batch_size
+        self.dropped = 0
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(
+            target=self.run, name="hotmine-log-listener", daemon=True
+        )
+        self.thread.start()
+
+    def stop(self):
+        if self.thread is not None and self.thread.is_alive():
+            self.records.put(_STOP)
+            self.thread.join(5)
+        self.thread = None
+
+    def run(self):
+        stopping = False
+        while not stopping:
+            batch = [self.records.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.records.get_nowait())
+                except queue.Empty:
+                    break
+            if _STOP in batch:
+                stopping = True
+                batch = [record for record in batch if record is not _STOP]
+            if self.dropped:
+                # Not atomic with the handler's increments; off by a few at worst
+                dropped, self.dropped = self.dropped, 0
+                batch.append(
+                    logging.makeLogRecord(
+                        {
+                            "name": __name__,
+                            "levelno": logging.WARNING,
+                            "levelname": "WARNING",
+                            "msg": "Log queue full, dropped %s record(s)",
+                            "args": (dropped,),
+                            "request_id": None,
+                        }
+                    )
+                )
+            self.write(batch)
+
+    def write(self, records):
+        for handler in self.sinks:
+            try:
+                handler.emit_batch(records)
+            except Exception:
+                # A broken sink mustn't take the listener down with it
+                pass
+
+
+class QueueHandler(logging.handlers.QueueHandler):
+    """
+    The root handler: enqueues records for a Listener, which it starts.
+    Configured from LOGGING in settings.py.
+    """
+
+    def __init__(self, sinks=("stderr",), queue_size=10000, batch_size=500):
+        super().__init__(queue.Queue(queue_size))
+        self.listener = Listener(self.queue, [sink(name) for name in sinks], batch_size)
+        self.listener.start()
+        atexit.register(self.listener.stop)
+        # A process forked from this one (a preloaded gunicorn master) has
+        # the queue but not the thread; give it both afresh
+        os.register_at_fork(after_in_child=self._restart)
+
+    def _restart(self):
+        self.queue = self.listener.records = queue.Queue(self.queue.maxsize)
+        self.listener.dropped = 0
+        self.listener.start()
+
+    def prepare(self, record):
+        # Only what has to happen on the caller's thread: args may change
+        # after the call returns, and a traceback holds its frames
+        record = copy.copy(record)
+        record.msg, record.args = record.getMessage(), None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.listener.dropped += 1
+
+    def close(self):
+        self.listener.stop()
+        super().close()
+
+
+# -- Requests -----------------------------------------------------------------
+
+
+def _user_id(request):
+    # Only a user something already loaded: loading it here would be a
+    # query, and from async code a blocked event loop
+    user = getattr(request, "user", None)
+    if isinstance(user, SimpleLazyObject):
+        user = None if user._wrapped is empty else user._wrapped
+    return getattr(user, "pk", None)
+
+
+def _request_id(request):
+    header = _setting("LOG_REQUEST_ID_HEADER", REQUEST_ID_HEADER)
+    incoming = request.headers.get(header, "")
+    return incoming if REQUEST_ID.match(incoming) else uuid.uuid4().hex
+
+
+class RequestLogMiddleware:
+    """
+    Gives the request an ID for its log records and the X-Request-ID
+    response header, samples its logging per view and logs it once done.
+    Goes first in MIDDLEWARE, so everything after it logs with the ID.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _start(self, request):
+        context = RequestContext(_request_id(request))
+        request.request_id = context.request_id
+        return _context.set(context), time.perf_counter()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        rate = _setting("LOG_SAMPLING", {}).get(request.resolver_match.url_name)
+        if rate is not None:
+            _context.get().sampled = random.random() < rate
+
+    def _finish(self, request, response, started):
+        match = getattr(request, "resolver_match", None)
+        requests_logger.info(
+            "%s %s %s",
+            request.method,
+            request.path,
+            response.status_code,
+            extra={
+                "view": match.view_name if match else None,
+                "status": response.status_code,
+                "ms": round((time.perf_counter() - started) * 1000, 1),
+                "user_id": _user_id(request),
+            },
+        )
+        response[REQUEST_ID_HEADER] = request.request_id
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token, started = self._start(request)
+        try:
+            response = self.get_response(request)
+            return self._finish(request, response, started)
+        finally:
+            _context.reset(token)
+
+    async def __acall__(self, request):
+        token, started = self._start(request)
+        try:
+            response = await self.get_response(request)
+            return self._finish(request, response, started)
+        finally:
+            _context.reset(token)
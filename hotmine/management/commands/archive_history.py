@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from hotmine import archive
+
+
+def _size(size):
+    return "" if size is None else f", {size / 1024 / 1024:.1f} MB"
+
+
+class Command(BaseCommand):
+    help = (
+        "Move finished investments and withdrawal requests older than "
+        "ARCHIVE_AFTER_DAYS into the archive tables, in throttled batches"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "tables",
+            nargs="*",
+            help="investments and/or withdrawals (default both)",
+        )
+        parser.add_argument("--days", type=int, help="Default ARCHIVE_AFTER_DAYS")
+        parser.add_argument("--batch-size", type=int, help="Default ARCHIVE_BATCH_SIZE")
+        parser.add_argument(
+            "--sleep", type=float, help="Seconds between batches (ARCHIVE_BATCH_SLEEP)"
+        )
+        parser.add_argument(
+            "--max-batches", type=int, help="Stop after this many batches per table"
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only count the rows that are ready to archive",
+        )
+
+    def handle(self, *args, **options):
+        unknown = set(options["tables"]) - set(archive.ARCHIVES)
+        if unknown:
+            raise CommandError(f"Unknown table(s): {', '.join(sorted(unknown))}")
+        for name in options["tables"] or archive.ARCHIVES:
+            if options["dry_run"]:
+                count = archive.pending(name, options["days"])
+                self.stdout.write(f"{name}: {count} row(s) ready to archive")
+                continue
+            moved = archive.archive(
+                name,
+                days=options["days"],
+                batch_size=options["batch_size"],
+                pause=options["sleep"],
+                max_batches=options["max_batches"],
+            )
+            sizes = archive.table_sizes(name)
+            hot_rows, hot_size = sizes["hot"]
+            archived_rows, archived_size = sizes["archive"]
+            self.stdout.write(
+                f"{name}: archived {moved} row(s); hot table {hot_rows} row(s)"
+                f"{_size(hot_size)}, archive {archived_rows} row(s)"
+                f"{_size(archived_size)}"
+            )
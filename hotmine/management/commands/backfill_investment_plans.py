@@ -0,0 +1,118 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from hotmine import planstats
+from hotmine.models import ArchivedInvestment, Investment, InvestmentPlan
+
+FIELDS = ("investment_plan", "wallet_address_used")
+
+
+def legacy_rows(model):
+    """Rows whose plan or wallet only exist in the legacy columns"""
+    return (
+        model.objects.filter(
+            Q(investment_plan__isnull=True, plan__gt="")
+            | Q(wallet_address_used__isnull=True, wallet_address__gt="")
+        )
+        .only("pk", "plan", "wallet_address", *FIELDS)
+        .order_by("pk")
+    )
+
+
+class PlanResolver:
+    """
+    Legacy plan name -> InvestmentPlan id, with the rule Investment.save()
+    used to apply: the first plan (by id) whose title contains the first
+    word of the name, ignoring case. Every name is resolved once.
+    """
+
+    def __init__(self):
+        self.plans = [
+            (pk, (title or "").lower())
+            for pk, title in InvestmentPlan.objects.order_by("pk").values_list(
+                "pk", "title"
+            )
+        ]
+        self.resolved = {}
+
+    def __call__(self, name):
+        if name not in self.resolved:
+            words = name.split()
+            word = words[0].lower() if words else None
+            self.resolved[name] = next(
+                (pk for pk, title in self.plans if word and word in title), None
+            )
+        return self.resolved[name]
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill investment_plan and wallet_address_used from the legacy plan and "
+        "wallet_address columns, in batches. Safe to stop and run again."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--after-id",
+            type=int,
+            default=0,
+            help="Resume after this investment id (printed after every batch)",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Resolve and count, but don't write anything",
+        )
+
+    def backfill(self, model, resolve, options):
+        last = options["after_id"]
+        updated = unresolved = 0
+        while True:
+            batch = list(
+                legacy_rows(model).filter(pk__gt=last)[: options["batch_size"]]
+            )
+            if not batch:
+                break
+            changed = []
+            for row in batch:
+                dirty = False
+                if row.investment_plan_id is None and row.plan:
+                    row.investment_plan_id = resolve(row.plan)
+                    if row.investment_plan_id is None:
+                        unresolved += 1
+                    else:
+                        dirty = True
+                if row.wallet_address_used is None and row.wallet_address:
+                    row.wallet_address_used = row.wallet_address
+                    dirty = True
+                if dirty:
+                    changed.append(row)
+            if changed and not options["dry_run"]:
+                with transaction.atomic():
+                    model.objects.bulk_update(changed, FIELDS)
+            updated += len(changed)
+            last = batch[-1].pk
+            self.stdout.write(
+                f"  {model._meta.verbose_name_plural}: {updated} updated, "
+                f"up to id {last}"
+            )
+        return updated, unresolved
+
+    def handle(self, *args, **options):
+        resolve = PlanResolver()
+        for model in (Investment, ArchivedInvestment):
+            updated, unresolved = self.backfill(model, resolve, options)
+            self.stdout.write(
+                f"{model._meta.verbose_name_plural}: {updated} row(s) "
+                f"{'to update' if options['dry_run'] else 'updated'}, "
+                f"{unresolved} legacy plan name(s) matched no plan"
+            )
+        unmatched = sorted(name for name, pk in resolve.resolved.items() if pk is None)
+        if unmatched:
+            self.stdout.write("No plan found for: " + ", ".join(unmatched))
+        if not options["dry_run"]:
+            # Investments that just got a plan count in its stats now
+            corrected = planstats.reconcile()
+            self.stdout.write(f"Plan stats corrected for {corrected} plan(s)")
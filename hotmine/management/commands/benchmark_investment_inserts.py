@@ -0,0 +1,75 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from hotmine.models import Investment, InvestmentPlan
+
+BENCHMARK_USER = "insert-benchmark"
+
+
+def insert_legacy(user, plan, amount):
+    """The write path before the backfill: legacy columns, plan lookup per save"""
+    wallet = plan.crypto_wallet.wallet_address
+    investment = Investment(
+        user=user, amount=amount, plan=plan.title, wallet_address=wallet
+    )
+    investment.investment_plan = InvestmentPlan.objects.filter(
+        title__icontains=plan.title.split()[0]
+    ).first()
+    investment.wallet_address_used = wallet
+    investment.save()
+
+
+def insert_current(user, plan, amount):
+    wallet = plan.crypto_wallet.wallet_address
+    Investment.objects.create(
+        user=user, investment_plan=plan, amount=amount, wallet_address_used=wallet
+    )
+
+
+MODES = {"legacy": insert_legacy, "current": insert_current}
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure investment insert throughput with and without the old "
+        "per-save plan lookup. Rows are written as a throwaway user and "
+        "deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=1000, help="Per mode")
+        parser.add_argument("--modes", default="legacy,current")
+
+    def handle(self, *args, **options):
+        modes = [m.strip() for m in options["modes"].split(",") if m.strip()]
+        unknown = set(modes) - set(MODES)
+        if unknown:
+            raise CommandError(f"Unknown mode(s): {', '.join(sorted(unknown))}")
+        plan = (
+            InvestmentPlan.objects.select_related("crypto_wallet")
+            .exclude(title=None)
+            .exclude(title="")
+            .first()
+        )
+        if plan is None:
+            raise CommandError("Needs at least one investment plan with a title")
+
+        user, _ = User.objects.get_or_create(username=BENCHMARK_USER)
+        try:
+            for mode in modes:
+                insert = MODES[mode]
+                started = time.perf_counter()
+                for n in range(options["rows"]):
+                    # Autocommit, one transaction per insert, like the view
+                    insert(user, plan, 100 + n)
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f"{mode}: {options['rows'] / elapsed:.0f} inserts/s "
+                    f"({elapsed / options['rows'] * 1000:.2f} ms each)"
+                )
+                Investment.objects.filter(user=user).delete()
+        finally:
+            # Cascades to anything left behind
+            user.delete()
@@ -0,0 +1,156 @@
+import random
+import time
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum
+
+from hotmine import money
+from hotmine.models import Totalearnings, totalwithdraw
+from hotmine.money import Money, percents, ratio
+
+CENT = Decimal("0.01")
+
+
+def synthetic(size, seed=0):
+    """(amount, daily rate, days) rows like the investment book's"""
+    rng = random.Random(seed)
+    rates = [Decimal(rng.randrange(1, 500)) / 100 for _ in range(8)]
+    return [
+        (
+            Decimal(rng.randrange(1000, 1000000)) / 100,
+            rng.choice(rates),
+            rng.randrange(1, 30),
+        )
+        for _ in range(size)
+    ]
+
+
+def sum_decimal(book):
+    return sum(book["amounts"], Decimal(0))
+
+
+def sum_cents(book):
+    return Money(sum(book["cents"]))
+
+
+def accrue_decimal(book):
+    # What settlement did before: Investment.daily_earnings, then quantize
+    return sum(
+        (
+            ((rate / 100) * amount * days).quantize(CENT)
+            for amount, rate, days in zip(book["amounts"], book["rates"], book["days"])
+        ),
+        Decimal(0),
+    )
+
+
+def accrue_cents(book):
+    # As settlement does now, with each plan's rate as an exact ratio
+    numerators = [
+        numerator * days for numerator, days in zip(book["numerators"], book["days"])
+    ]
+    return Money(sum(percents(book["cents"], numerators, book["denominators"])))
+
+
+def table_sum(model, column):
+    def run(_):
+        return model.objects.aggregate(total=Sum(column))["total"]
+
+    return run
+
+
+def table_read(model, column):
+    # Every value through the field's from_db_value, summed in Python
+    def run(_):
+        values = model.objects.values_list(column, flat=True).iterator(2000)
+        return Money.total(Money.parse(value) for value in values)
+
+    return run
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare Decimal with integer-cent Money on summing amounts and on "
+        "the settlement accrual loop, over synthetic rows, and optionally on "
+        "the balance tables"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=1000000)
+        parser.add_argument("--repeat", type=int, default=3, help="Best of")
+        parser.add_argument(
+            "--table-rows",
+            type=int,
+            default=0,
+            help="Also time the database: this many balance rows written to "
+            "Totalearnings (cents) and totalwithdraw (Decimal) in a "
+            "transaction that is rolled back",
+        )
+
+    def timed(self, function, rows, repeat):
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            result = function(rows)
+            took = time.perf_counter() - started
+            best = took if best is None else min(best, took)
+        return result, best
+
+    def handle(self, *args, **options):
+        rows = synthetic(options["rows"])
+        amounts, rates, days = (list(column) for column in zip(*rows))
+        ratios = {rate: ratio(rate) for rate in set(rates)}
+        # Columns as settlement builds them; cents as a MoneyField returns
+        # them, rates converted once per plan
+        book = {
+            "amounts": amounts,
+            "rates": rates,
+            "days": days,
+            "cents": [Money.parse(amount).cents for amount in amounts],
+            "numerators": [ratios[rate][0] for rate in rates],
+            "denominators": [ratios[rate][1] for rate in rates],
+        }
+        engine = "numpy" if money.np is not None else "python"
+        self.stdout.write(f"Money accrual engine: {engine}")
+        for name, with_decimal, with_money in (
+            ("sum", sum_decimal, sum_cents),
+            ("accrual", accrue_decimal, accrue_cents),
+        ):
+            expected, slow = self.timed(with_decimal, book, options["repeat"])
+            result, fast = self.timed(with_money, book, options["repeat"])
+            if result.to_decimal() != expected:
+                self.stderr.write(f"{name}: results differ ({expected} vs {result})")
+            self.stdout.write(
+                f"{name}: {options['rows']} rows, Decimal {slow:.3f}s, "
+                f"Money {fast:.3f}s ({slow / fast:.1f}x)"
+            )
+        if options["table_rows"]:
+            self.tables(amounts[: options["table_rows"]], options["repeat"])
+
+    def tables(self, amounts, repeat):
+        """Sum and read the same amounts from a Decimal and a cents column"""
+        with transaction.atomic():
+            user = User.objects.create(username="benchmark-money")
+            totalwithdraw.objects.bulk_create(
+                (totalwithdraw(user=user, total_withdraw=a) for a in amounts), 2000
+            )
+            Totalearnings.objects.bulk_create(
+                (Totalearnings(user=user, total_earnings=a) for a in amounts), 2000
+            )
+            for name, run in (("sql sum", table_sum), ("read", table_read)):
+                expected, slow = self.timed(
+                    run(totalwithdraw, "total_withdraw"), None, repeat
+                )
+                result, fast = self.timed(
+                    run(Totalearnings, "total_earnings"), None, repeat
+                )
+                if Money.parse(result) != Money.parse(expected):
+                    self.stderr.write(f"table {name}: results differ")
+                self.stdout.write(
+                    f"table {name}: {len(amounts)} rows, Decimal {slow:.3f}s, "
+                    f"Money {fast:.3f}s ({slow / fast:.1f}x)"
+                )
+            transaction.set_rollback(True)
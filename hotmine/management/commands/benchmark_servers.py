@@ -0,0 +1,150 @@
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from .loadtest_login import LoginClient
+
+DEFAULT_PATHS = "/dashboard/,/my-investments/,/withdrawal-history/,/plans/1/"
+
+SERVERS = {
+    "wsgi": ["myproject.wsgi:application"],
+    "asgi": ["myproject.asgi:application", "-k", "uvicorn_worker.UvicornWorker"],
+}
+
+
+def wait_until_up(url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(url + "/login/", timeout=2).close()
+            return
+        except urllib.error.HTTPError:
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise CommandError(f"Server at {url} did not come up")
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the account pages under WSGI (sync workers) and ASGI "
+        "(uvicorn workers) side by side, signed in as a real account"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--username", required=True)
+        parser.add_argument("--password", required=True)
+        parser.add_argument("--paths", default=DEFAULT_PATHS)
+        parser.add_argument("--requests", type=int, default=200, help="Per path")
+        parser.add_argument("--concurrency", type=int, default=16)
+        parser.add_argument(
+            "--wsgi-url", help="A running WSGI server; started with gunicorn if unset"
+        )
+        parser.add_argument(
+            "--asgi-url", help="A running ASGI server; started with gunicorn if unset"
+        )
+        parser.add_argument("--workers", type=int, default=2)
+        parser.add_argument("--port", type=int, default=8101)
+
+    def start_server(self, kind, port, workers):
+        command = [sys.executable, "-m", "gunicorn", *SERVERS[kind]]
+        command += ["--workers", str(workers), "--bind", f"127.0.0.1:{port}"]
+        process = subprocess.Popen(
+            command,
+            cwd=settings.BASE_DIR,
+            env=os.environ.copy(),
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        url = f"http://127.0.0.1:{port}"
+        try:
+            wait_until_up(url)
+        except CommandError:
+            process.terminate()
+            raise
+        return process, url
+
+    def run_path(self, client, url, count, concurrency):
+        timings, errors = [], {}
+        lock = threading.Lock()
+
+        def fetch(_):
+            started = time.perf_counter()
+            try:
+                with client.opener.open(url, timeout=60) as resp:
+                    resp.read()
+                    status = resp.status
+            except urllib.error.HTTPError as e:
+                status = e.code
+            except OSError:
+                status = "error"
+            elapsed = time.perf_counter() - started
+            with lock:
+                if status == 200:
+                    timings.append(elapsed)
+                else:
+                    errors[status] = errors.get(status, 0) + 1
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(fetch, range(count)))
+        return timings, errors, time.perf_counter() - started
+
+    def handle(self, *args, **options):
+        paths = [p.strip() for p in options["paths"].split(",") if p.strip()]
+        processes = []
+        results = {}
+        try:
+            for offset, kind in enumerate(SERVERS):
+                url = options[f"{kind}_url"]
+                if not url:
+                    process, url = self.start_server(
+                        kind, options["port"] + offset, options["workers"]
+                    )
+                    processes.append(process)
+                url = url.rstrip("/")
+
+                client = LoginClient(url)
+                status, _ = client.post_login(options["username"], options["password"])
+                if status != 302:
+                    raise CommandError(f"Could not sign in on {url} (HTTP {status})")
+
+                for path in paths:
+                    results[kind, path] = self.run_path(
+                        client, url + path, options["requests"], options["concurrency"]
+                    )
+        finally:
+            for process in processes:
+                process.terminate()
+                process.wait()
+
+        self.stdout.write(
+            f"{options['requests']} requests per path, "
+            f"concurrency {options['concurrency']}"
+        )
+        for path in paths:
+            self.stdout.write(path)
+            for kind in SERVERS:
+                timings, errors, total = results[kind, path]
+                line = f"  {kind}: {options['requests'] / total:.1f} req/s"
+                if timings:
+                    timings.sort()
+                    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+                    line += (
+                        f", median {statistics.median(timings) * 1000:.1f} ms"
+                        f", p95 {p95 * 1000:.1f} ms"
+                    )
+                if errors:
+                    line += ", errors " + ", ".join(
+                        f"{status}: {n}" for status, n in sorted(errors.items(), key=str)
+                    )
+                self.stdout.write(line)
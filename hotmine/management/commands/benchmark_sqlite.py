@@ -0,0 +1,124 @@
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from hotmine import sqlite
+
+ACCOUNTS = 100
+
+SCHEMA = [
+    "CREATE TABLE account (id INTEGER PRIMARY KEY, balance INTEGER NOT NULL)",
+    "CREATE TABLE ledger (id INTEGER PRIMARY KEY, account_id INTEGER NOT NULL, "
+    "amount INTEGER NOT NULL, created_at REAL NOT NULL)",
+]
+
+
+def connect(path, profile):
+    """A connection as Django opens one under the profile"""
+    # Python's own default busy timeout is 5 seconds
+    connection = sqlite3.connect(path, timeout=5, isolation_level=None)
+    if profile == "tuned":
+        for statement in sqlite.statements(sqlite.PRAGMAS):
+            connection.execute(statement)
+    return connection
+
+
+def writer(path, profile, seconds, barrier, results, number):
+    """Move money between accounts until time's up, like a deposit would"""
+    connection = connect(path, profile)
+    begin = "BEGIN IMMEDIATE" if profile == "tuned" else "BEGIN"
+    commits = errors = 0
+    barrier.wait()
+    deadline = time.perf_counter() + seconds
+    account = number
+    while time.perf_counter() < deadline:
+        account = account % ACCOUNTS + 1
+        try:
+            connection.execute(begin)
+            (balance,) = connection.execute(
+                "SELECT balance FROM account WHERE id = ?", (account,)
+            ).fetchone()
+            connection.execute(
+                "UPDATE account SET balance = ? WHERE id = ?", (balance + 1, account)
+            )
+            connection.execute(
+                "INSERT INTO ledger (account_id, amount, created_at) VALUES (?, 1, ?)",
+                (account, time.time()),
+            )
+            connection.execute("COMMIT")
+            commits += 1
+        except sqlite3.OperationalError as e:
+            if "locked" not in str(e) and "busy" not in str(e):
+                raise
+            errors += 1
+            if connection.in_transaction:
+                connection.execute("ROLLBACK")
+    connection.close()
+    results.put((commits, errors))
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare SQLite's defaults with the tuned profile (hotmine/sqlite.py) "
+        "under concurrent writer processes, on a throwaway database file"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processes", type=int, default=4)
+        parser.add_argument("--seconds", type=float, default=5, help="Per profile")
+        parser.add_argument("--profiles", default="default,tuned")
+
+    def run_profile(self, profile, directory, processes, seconds):
+        path = os.path.join(directory, f"{profile}.sqlite3")
+        connection = connect(path, profile)
+        for statement in SCHEMA:
+            connection.execute(statement)
+        connection.executemany(
+            "INSERT INTO account (id, balance) VALUES (?, 0)",
+            [(n,) for n in range(1, ACCOUNTS + 1)],
+        )
+        connection.close()
+
+        # Spawned, as gunicorn's workers are separate interpreters
+        context = multiprocessing.get_context("spawn")
+        barrier = context.Barrier(processes)
+        results = context.Queue()
+        workers = [
+            context.Process(
+                target=writer, args=(path, profile, seconds, barrier, results, n)
+            )
+            for n in range(processes)
+        ]
+        for worker in workers:
+            worker.start()
+        totals = [results.get() for _ in workers]
+        for worker in workers:
+            worker.join()
+
+        commits = sum(commits for commits, _ in totals)
+        errors = sum(errors for _, errors in totals)
+        connection = sqlite3.connect(path)
+        (balances,) = connection.execute("SELECT SUM(balance) FROM account").fetchone()
+        connection.close()
+        if balances != commits:
+            self.stderr.write(f"{profile}: {balances} credited for {commits} commits")
+        self.stdout.write(
+            f"{profile}: {commits / seconds:.0f} commits/s, "
+            f"{errors} lock error(s) ({errors / max(commits + errors, 1):.1%} "
+            f"of transactions), {processes} writers"
+        )
+
+    def handle(self, *args, **options):
+        profiles = [p.strip() for p in options["profiles"].split(",") if p.strip()]
+        unknown = set(profiles) - {"default", "tuned"}
+        if unknown:
+            raise CommandError(f"Unknown profile(s): {', '.join(sorted(unknown))}")
+        with tempfile.TemporaryDirectory() as directory:
+            for profile in profiles:
+                self.run_profile(
+                    profile, directory, options["processes"], options["seconds"]
+                )
@@ -0,0 +1,147 @@
+import os
+import re
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from .benchmark_servers import SERVERS
+
+# "import time: self [us] | cumulative | imported package" lines from -X importtime
+IMPORT_LINE = re.compile(r"import time:\s+\d+ \|\s+(\d+) \|( *)(\S+)")
+
+IMPORT_APP = (
+    "import django; django.setup(); "
+    "import myproject.{module}; import myproject.urls"
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure cold-start import time and time-to-first-response of a fresh "
+        "gunicorn worker, and fail if either is over budget"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--server", choices=SERVERS, default="asgi")
+        parser.add_argument("--path", default="/")
+        parser.add_argument(
+            "--host",
+            help="Host header for the requests (default: first ALLOWED_HOSTS)",
+        )
+        parser.add_argument("--port", type=int, default=8111)
+        parser.add_argument(
+            "--import-budget", type=float, default=3.0, help="Seconds (default 3)"
+        )
+        parser.add_argument(
+            "--response-budget", type=float, default=10.0, help="Seconds (default 10)"
+        )
+        parser.add_argument("--top", type=int, default=10, help="Slowest imports shown")
+        parser.add_argument(
+            "--no-warmup",
+            action="store_true",
+            help="Start the worker with WARMUP_ENABLED=False, for comparison",
+        )
+
+    def measure_imports(self, module):
+        """Wall time of a fresh interpreter loading the app, and its slowest imports"""
+        started = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", IMPORT_APP.format(module=module)],
+            cwd=settings.BASE_DIR,
+            capture_output=True,
+            text=True,
+        )
+        elapsed = time.perf_counter() - started
+        if result.returncode:
+            raise CommandError(f"Importing the app failed:\n{result.stderr[-2000:]}")
+        # Top-level imports only (nested ones are indented), by cumulative time
+        imports = [
+            (int(match.group(1)), match.group(3))
+            for match in map(IMPORT_LINE.match, result.stderr.splitlines())
+            if match and len(match.group(2)) == 1
+        ]
+        imports.sort(reverse=True)
+        return elapsed, imports
+
+    def first_response(self, kind, port, path, host, env):
+        """Seconds from spawning gunicorn to the first response, then a warm one"""
+        url = f"http://127.0.0.1:{port}{path}"
+        command = [sys.executable, "-m", "gunicorn", *SERVERS[kind]]
+        command += ["--workers", "1", "--bind", f"127.0.0.1:{port}"]
+
+        def fetch():
+            req = urllib.request.Request(url, headers={"Host": host} if host else {})
+            try:
+                with urllib.request.urlopen(req, timeout=30) as resp:
+                    resp.read()
+                    return resp.status
+            except urllib.error.HTTPError as e:
+                return e.code
+
+        started = time.perf_counter()
+        process = subprocess.Popen(
+            command,
+            cwd=settings.BASE_DIR,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            while True:
+                if process.poll() is not None:
+                    raise CommandError("gunicorn exited before answering")
+                if time.perf_counter() - started > 120:
+                    raise CommandError("No response within 120s")
+                try:
+                    status = fetch()
+                    break
+                except OSError:
+                    time.sleep(0.05)
+            cold = time.perf_counter() - started
+            warm_started = time.perf_counter()
+            fetch()
+            warm = time.perf_counter() - warm_started
+        finally:
+            process.terminate()
+            process.wait()
+        return status, cold, warm
+
+    def handle(self, *args, **options):
+        module = options["server"]
+        env = os.environ.copy()
+        if options["no_warmup"]:
+            env["WARMUP_ENABLED"] = "False"
+        host = options["host"]
+        if host is None and settings.ALLOWED_HOSTS:
+            host = settings.ALLOWED_HOSTS[0].lstrip(".")
+
+        import_time, imports = self.measure_imports(module)
+        self.stdout.write(
+            f"Import (django.setup + myproject.{module} + urls): {import_time:.2f}s"
+            f" (budget {options['import_budget']:.2f}s)"
+        )
+        for cumulative, name in imports[: options["top"]]:
+            self.stdout.write(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+        status, cold, warm = self.first_response(
+            module, options["port"], options["path"], host, env
+        )
+        self.stdout.write(
+            f"First response ({module}, HTTP {status}): {cold:.2f}s from spawn"
+            f" (budget {options['response_budget']:.2f}s)"
+        )
+        self.stdout.write(f"Next request: {warm * 1000:.1f} ms")
+
+        over = []
+        if import_time > options["import_budget"]:
+            over.append(f"import time {import_time:.2f}s")
+        if cold > options["response_budget"]:
+            over.append(f"time to first response {cold:.2f}s")
+        if over:
+            raise CommandError("Cold start over budget: " + ", ".join(over))
+        self.stdout.write(self.style.SUCCESS("Cold start within budget"))
@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from hotmine import routers
+
+
+class Command(BaseCommand):
+    help = "Show each read replica's lag and whether reads would be routed to it"
+
+    def handle(self, *args, **options):
+        replicas = routers.get_replicas()
+        if not replicas:
+            self.stdout.write("No replicas configured; every read uses the primary")
+            return
+        max_lag = getattr(settings, "REPLICA_MAX_LAG", 10)
+        behind = []
+        for alias in replicas:
+            try:
+                lag = routers.replica_lag(alias)
+            except Exception as e:
+                self.stdout.write(f"{alias:12} unreachable: {e}")
+                behind.append(alias)
+                continue
+            usable = lag <= max_lag
+            if not usable:
+                behind.append(alias)
+            self.stdout.write(
+                f"{alias:12} lag {lag:8.2f}s  "
+                f"{'in use' if usable else f'over {max_lag}s, reads fall back'}"
+            )
+        if len(behind) == len(replicas):
+            raise CommandError("No usable replica; all reads are on the primary")
@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from hotmine import outbox
+
+
+class Command(BaseCommand):
+    help = "Send queued user notifications, one digest email per user"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, help="Default OUTBOX_BATCH_SIZE")
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep dispatching every --interval seconds",
+        )
+        parser.add_argument("--interval", type=int, default=10)
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.monotonic()
+            # Drain what's due, batch by batch
+            while True:
+                counts = outbox.dispatch(options["batch_size"])
+                if any(counts.values()):
+                    self.stdout.write(
+                        f"{counts['sent']} sent, {counts['retried']} to retry, "
+                        f"{counts['failed']} failed"
+                    )
+                if not counts["sent"]:
+                    break
+            purged = outbox.purge()
+            if purged:
+                self.stdout.write(f"{purged} old message(s) purged")
+            if not options["loop"]:
+                return
+            time.sleep(max(0, options["interval"] - (time.monotonic() - started)))
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+
+from hotmine import forecast
+
+
+class Command(BaseCommand):
+    help = (
+        "Write the per-day liability forecast (earnings to accrue, deposit "
+        "returns, pending withdrawals) for the active investment book as CSV"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days", type=int, help="Horizon (default the longest FORECAST_HORIZONS)"
+        )
+        parser.add_argument(
+            "--per-plan", action="store_true", help="Add a column pair per plan"
+        )
+        parser.add_argument("--output", help="File to write (default stdout)")
+        parser.add_argument(
+            "--benchmark",
+            type=int,
+            metavar="N",
+            help="Time a forecast of N synthetic investments instead",
+        )
+
+    def handle(self, *args, **options):
+        if options["benchmark"]:
+            built, took = forecast.benchmark(options["benchmark"], options["days"])
+            engine = "numpy" if forecast.np is not None else "array"
+            self.stdout.write(
+                f"{options['benchmark']} investments ({engine}): book built in "
+                f"{built:.2f}s, forecast in {took:.2f}s"
+            )
+            return
+
+        result = forecast.forecast(horizon=options["days"])
+        if options["output"]:
+            with open(options["output"], "w", newline="") as stream:
+                forecast.write_csv(result, stream, options["per_plan"])
+            self.stderr.write(
+                f"{result.size} investments, {result.horizon} days -> {options['output']}"
+            )
+        else:
+            forecast.write_csv(result, self.stdout, options["per_plan"])
@@ -0,0 +1,154 @@
+import re
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import CookieJar
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+CSRF_INPUT = re.compile(r'name="csrfmiddlewaretoken" value="([^"]+)"')
+
+
+class LoginClient:
+    """One browser-like session: fetches the CSRF token, then posts logins"""
+
+    def __init__(self, base_url, forwarded_for=None):
+        self.login_url = base_url.rstrip("/") + "/login/"
+        self.forwarded_for = forwarded_for
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(CookieJar()),
+            NoRedirect,
+        )
+        self.token = None
+
+    def _request(self, data=None):
+        body = urllib.parse.urlencode(data).encode() if data else None
+        req = urllib.request.Request(self.login_url, data=body)
+        req.add_header("Referer", self.login_url)
+        if self.forwarded_for:
+            req.add_header("X-Forwarded-For", self.forwarded_for)
+        try:
+            with self.opener.open(req, timeout=60) as resp:
+                return resp.status, resp.read().decode("utf-8", "replace")
+        except urllib.error.HTTPError as e:
+            return e.code, e.read().decode("utf-8", "replace")
+
+    def post_login(self, username, password):
+        if self.token is None:
+            status, html = self._request()
+            match = CSRF_INPUT.search(html)
+            if not match:
+                raise CommandError(f"No CSRF token on login page (HTTP {status})")
+            self.token = match.group(1)
+        started = time.perf_counter()
+        status, _ = self._request(
+            {
+                "csrfmiddlewaretoken": self.token,
+                "username": username,
+                "password": password,
+            }
+        )
+        return status, time.perf_counter() - started
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Flood the login endpoint of a running server with bad credentials "
+        "while probing a real login, to show the rate limiter keeps workers "
+        "free. The attackers and the probe tell their addresses apart through "
+        "X-Forwarded-For, which the limiter only reads behind trusted proxies: "
+        "run the server and this command with RATELIMIT_TRUSTED_PROXIES=1 "
+        "(see hotmine/ratelimit.py), or every client shares one bucket"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="http://127.0.0.1:8000")
+        parser.add_argument("--attempts", type=int, default=500)
+        parser.add_argument("--concurrency", type=int, default=16)
+        parser.add_argument(
+            "--attackers",
+            type=int,
+            default=4,
+            help="Distinct X-Forwarded-For addresses the flood comes from",
+        )
+        parser.add_argument("--target", default="victim@example.com")
+        parser.add_argument("--username", help="Real account used for probing")
+        parser.add_argument("--password", help="Password of the probe account")
+        parser.add_argument("--probe-interval", type=float, default=0.5)
+
+    def handle(self, *args, **options):
+        if getattr(settings, "RATELIMIT_TRUSTED_PROXIES", 0) < 1:
+            raise CommandError(
+                "RATELIMIT_TRUSTED_PROXIES is 0, so the limiter ignores the "
+                "X-Forwarded-For addresses this test sends and the probe would "
+                "be limited with the attackers. Run the server and this command "
+                "with RATELIMIT_TRUSTED_PROXIES=1."
+            )
+        statuses = {}
+        lock = threading.Lock()
+        done = threading.Event()
+        clients = [
+            LoginClient(options["url"], forwarded_for=f"203.0.113.{i + 1}")
+            for i in range(options["attackers"])
+        ]
+
+        def attack(i):
+            status, elapsed = clients[i % len(clients)].post_login(
+                options["target"], f"wrong-password-{i}"
+            )
+            with lock:
+                statuses.setdefault(status, []).append(elapsed)
+
+        probes = []
+
+        def probe():
+            while not done.is_set():
+                # Fresh session each time, since a successful login redirects
+                # away from the login page
+                client = LoginClient(options["url"], forwarded_for="198.51.100.7")
+                status, elapsed = client.post_login(
+                    options["username"], options["password"]
+                )
+                probes.append((status, elapsed))
+                time.sleep(options["probe_interval"])
+
+        prober = None
+        if options["username"] and options["password"]:
+            prober = threading.Thread(target=probe, daemon=True)
+            prober.start()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options["concurrency"]) as pool:
+            list(pool.map(attack, range(options["attempts"])))
+        total = time.perf_counter() - started
+        done.set()
+        if prober:
+            prober.join()
+
+        self.stdout.write(
+            f"{options['attempts']} bad logins in {total:.2f}s "
+            f"({options['attempts'] / total:.1f} req/s)"
+        )
+        for status, timings in sorted(statuses.items()):
+            self.stdout.write(
+                f"  HTTP {status}: {len(timings)} responses, "
+                f"median {statistics.median(timings) * 1000:.1f} ms"
+            )
+        if probes:
+            ok = sum(1 for status, _ in probes if status == 302)
+            timings = [elapsed for _, elapsed in probes]
+            self.stdout.write(
+                f"Real-user probe: {ok}/{len(probes)} logins succeeded, "
+                f"median {statistics.median(timings) * 1000:.1f} ms, "
+                f"max {max(timings) * 1000:.1f} ms"
+            )
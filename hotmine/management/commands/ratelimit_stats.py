@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from hotmine import ratelimit
+
+
+class Command(BaseCommand):
+    help = "Show login/password-reset rate limiter counters from the shared cache"
+
+    def handle(self, *args, **options):
+        for name, value in ratelimit.get_metrics().items():
+            self.stdout.write(f"{name:32} {value}")
@@ -0,0 +1,64 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from hotmine import reconcile
+
+
+class Command(BaseCommand):
+    help = (
+        "Check Totalearnings and totalwithdraw against the investments and "
+        "completed withdrawals they summarise, and optionally fix them"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--kinds",
+            default=",".join(reconcile.CHECKS),
+            help="Comma-separated: " + ", ".join(reconcile.CHECKS),
+        )
+        parser.add_argument("--workers", type=int, help="Default RECONCILE_WORKERS")
+        parser.add_argument(
+            "--chunk-size", type=int, help="Default RECONCILE_CHUNK_SIZE"
+        )
+        parser.add_argument(
+            "--output", help="Write the mismatch report (CSV) here, not stdout"
+        )
+        parser.add_argument(
+            "--fix", action="store_true", help="Rewrite mismatched rows"
+        )
+        parser.add_argument(
+            "--primary", action="store_true", help="Don't read from a replica"
+        )
+
+    def handle(self, *args, **options):
+        kinds = [kind.strip() for kind in options["kinds"].split(",") if kind.strip()]
+        unknown = set(kinds) - set(reconcile.CHECKS)
+        if unknown:
+            raise CommandError(f"Unknown kind(s): {', '.join(sorted(unknown))}")
+
+        started = time.monotonic()
+        mismatches = list(
+            reconcile.run(
+                kinds,
+                workers=options["workers"],
+                chunk_size=options["chunk_size"],
+                use_replica=not options["primary"],
+            )
+        )
+        took = time.monotonic() - started
+        if options["output"]:
+            with open(options["output"], "w", newline="") as stream:
+                reconcile.write_report(mismatches, stream)
+        elif mismatches:
+            reconcile.write_report(mismatches, sys.stdout)
+
+        counts = {kind: 0 for kind in kinds}
+        for mismatch in mismatches:
+            counts[mismatch.kind] += 1
+        summary = ", ".join(f"{counts[kind]} {kind}" for kind in kinds)
+        self.stderr.write(f"Mismatches: {summary} ({took:.1f}s)")
+        if options["fix"] and mismatches:
+            fixed = reconcile.fix(mismatches)
+            self.stderr.write(f"{fixed} balance row(s) fixed")
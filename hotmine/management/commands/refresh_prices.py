@@ -0,0 +1,43 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from hotmine import prices
+
+
+class Command(BaseCommand):
+    help = "Fetch crypto prices from the configured feed into the shared cache"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep refreshing every --interval seconds",
+        )
+        parser.add_argument(
+            "--interval",
+            type=int,
+            default=None,
+            help="Seconds between refreshes (default PRICE_TTL)",
+        )
+
+    def handle(self, *args, **options):
+        interval = options["interval"] or getattr(settings, "PRICE_TTL", 60)
+        while True:
+            started = time.monotonic()
+            try:
+                snapshot = prices.refresh()
+            except Exception as e:
+                if not options["loop"]:
+                    raise CommandError(f"Price feed failed: {e}")
+                self.stderr.write(f"Price feed failed: {e}")
+            else:
+                quotes = ", ".join(
+                    f"{symbol} {quote['price']}"
+                    for symbol, quote in snapshot["prices"].items()
+                )
+                self.stdout.write(f"{len(snapshot['prices'])} prices: {quotes}")
+            if not options["loop"]:
+                return
+            time.sleep(max(0, interval - (time.monotonic() - started)))
@@ -0,0 +1,81 @@
+import signal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from hotmine import scheduler
+from hotmine.models import JobLease
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the periodic jobs (settlement, outbox, session and archive "
+        "clean-up), one instance per job across every running scheduler"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--jobs", help="Comma-separated job names (default: every enabled job)"
+        )
+        parser.add_argument(
+            "--once", action="store_true", help="Run what's due now, then exit"
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="With --once, run the jobs even if they aren't due",
+        )
+        parser.add_argument(
+            "--list", action="store_true", help="Show each job's schedule and timings"
+        )
+
+    def list_jobs(self):
+        leases = {lease.name: lease for lease in JobLease.objects.all()}
+        now = timezone.now()
+        for name, job in scheduler.JOBS.items():
+            lease = leases.get(name)
+            every = f"every {job.every}s" if job.every else "off"
+            if lease is None or not lease.runs:
+                self.stdout.write(f"{name}: {every}, never run")
+                continue
+            due = (lease.next_run_at - now).total_seconds()
+            average = lease.average_duration
+            self.stdout.write(
+                f"{name}: {every}, next in {max(due, 0):.0f}s, "
+                f"{lease.runs} run(s), {lease.failures} failed, "
+                f"{lease.missed} missed, last {lease.last_status or '-'} "
+                f"in {lease.last_duration or 0:.2f}s, "
+                f"avg {average or 0:.2f}s, max {lease.max_duration:.2f}s"
+                + (f", held by {lease.owner}" if lease.owner else "")
+            )
+
+    def handle(self, *args, **options):
+        if options["list"]:
+            return self.list_jobs()
+        names = None
+        if options["jobs"]:
+            names = [name.strip() for name in options["jobs"].split(",")]
+            unknown = set(names) - set(scheduler.JOBS)
+            if unknown:
+                raise CommandError(f"Unknown job(s): {', '.join(sorted(unknown))}")
+
+        runner = scheduler.Scheduler(names)
+        if not runner.jobs:
+            raise CommandError("No enabled jobs (see SCHEDULER_JOBS)")
+        if options["once"]:
+            scheduler.ensure_leases(runner.jobs)
+            for job in runner.jobs:
+                result = scheduler.run_job(job, force=options["force"])
+                if result is None:
+                    self.stdout.write(f"{job.name}: not due, or running elsewhere")
+                else:
+                    status, seconds = result
+                    self.stdout.write(f"{job.name}: {status} in {seconds:.2f}s")
+            return
+
+        signal.signal(signal.SIGTERM, lambda *args: runner.stop())
+        self.stdout.write("Scheduling " + ", ".join(job.name for job in runner.jobs))
+        try:
+            runner.loop()
+        except KeyboardInterrupt:
+            pass
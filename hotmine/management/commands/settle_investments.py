@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from hotmine import settlement
+
+
+class Command(BaseCommand):
+    help = (
+        "Credit daily earnings to active investments and complete the ones "
+        "that have matured, returning deposits"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, help="Default SETTLEMENT_BATCH_SIZE"
+        )
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep settling every --interval seconds",
+        )
+        parser.add_argument("--interval", type=int, default=300)
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.monotonic()
+            result = settlement.run(options["batch_size"])
+            self.stdout.write(
+                f"{result['filled']} maturity date(s) filled, "
+                f"{result['accrued']} investment(s) accrued, "
+                f"{result['settled']} settled, "
+                f"{result['snapshots']} portfolio snapshot(s) written"
+            )
+            if not options["loop"]:
+                return
+            time.sleep(max(0, options["interval"] - (time.monotonic() - started)))
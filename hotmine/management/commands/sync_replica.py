@@ -0,0 +1,57 @@
+import os
+import sqlite3
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from hotmine import routers
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy the SQLite primary into the SQLite replica files, standing in "
+        "for replication in the local two-database setup"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep copying every --interval seconds",
+        )
+        parser.add_argument("--interval", type=float, default=2)
+
+    def handle(self, *args, **options):
+        primary = connections[DEFAULT_DB_ALIAS].settings_dict
+        replicas = [
+            connections[alias].settings_dict
+            for alias in routers.get_replicas()
+            if connections[alias].vendor == "sqlite"
+        ]
+        if connections[DEFAULT_DB_ALIAS].vendor != "sqlite" or not replicas:
+            raise CommandError(
+                "Needs a SQLite primary and SQLite replicas (SQLITE_REPLICA=True)"
+            )
+
+        while True:
+            started = time.monotonic()
+            for replica in replicas:
+                target = str(replica["NAME"])
+                # Copy to a temporary file and swap it in, so readers never
+                # see a half-written replica
+                source = sqlite3.connect(str(primary["NAME"]))
+                copy = sqlite3.connect(target + ".tmp")
+                try:
+                    source.backup(copy)
+                    # The copy takes the primary's WAL mode; a replica is
+                    # swapped out whole, so it mustn't keep a -wal file
+                    copy.execute("PRAGMA journal_mode = DELETE")
+                finally:
+                    copy.close()
+                    source.close()
+                os.replace(target + ".tmp", target)
+            self.stdout.write(f"Copied primary to {len(replicas)} replica(s)")
+            if not options["loop"]:
+                return
+            time.sleep(max(0, options["interval"] - (time.monotonic() - started)))
@@ -0,0 +1,67 @@
+import string
+from collections import defaultdict
+
+from django.db import migrations
+
+# Only ASCII letters are folded, as SQLite's LOWER() does and as
+# hotmine.accounts.normalize_email() does; Postgres is held to the same by
+# lowering under the "C" collation
+INDEX = {
+    "postgresql": (
+        "CREATE UNIQUE INDEX hotmine_auth_user_email_lower_uniq "
+        "ON auth_user (NULLIF(LOWER(email COLLATE \"C\"), ''))"
+    ),
+    "default": (
+        "CREATE UNIQUE INDEX hotmine_auth_user_email_lower_uniq "
+        "ON auth_user (NULLIF(LOWER(email), ''))"
+    ),
+}
+
+ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+
+def check_duplicates(apps, schema_editor):
+    """
+    Stop before creating the index when accounts share an email that only
+    differs in case, naming them, so they can be merged or changed by hand
+    rather than failing halfway with the database's constraint error.
+    """
+    User = apps.get_model("auth", "User")
+    users = defaultdict(list)
+    for pk, email in User.objects.exclude(email="").values_list("pk", "email"):
+        users[email.translate(ASCII_LOWER)].append(pk)
+    duplicates = {email: pks for email, pks in users.items() if len(pks) > 1}
+    if duplicates:
+        clashes = "; ".join(
+            f"{email} (users {', '.join(map(str, pks))})"
+            for email, pks in sorted(duplicates.items())
+        )
+        raise RuntimeError(
+            "Can't make emails unique regardless of case, these accounts "
+            f"share one: {clashes}. Change or merge them and migrate again."
+        )
+
+
+def create_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    schema_editor.execute(INDEX.get(vendor, INDEX["default"]))
+
+
+def drop_index(apps, schema_editor):
+    schema_editor.execute("DROP INDEX hotmine_auth_user_email_lower_uniq")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("auth", "0012_alter_user_first_name_max_length"),
+        ("hotmine", "0010_alter_userprofile_withdrawal_enabled"),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicates, migrations.RunPython.noop),
+        # Unique, case-insensitive email identity for login/signup/password
+        # reset lookups. Blank emails (e.g. createsuperuser without one) map
+        # to NULL so they don't collide with each other.
+        migrations.RunPython(create_index, drop_index),
+    ]
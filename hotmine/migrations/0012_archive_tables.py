@@ -0,0 +1,164 @@
+# Generated by Django 5.2.4 on 2026-10-18 21:08
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("hotmine", "0011_auth_user_email_lower_index"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchivedInvestment",
+            fields=[
+                ("id", models.BigIntegerField(primary_key=True, serialize=False)),
+                (
+                    "amount",
+                    models.DecimalField(
+                        blank=True, decimal_places=2, max_digits=12, null=True
+                    ),
+                ),
+                (
+                    "wallet_address_used",
+                    models.CharField(blank=True, max_length=255, null=True),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        blank=True,
+                        choices=[
+                            ("PENDING", "Pending"),
+                            ("ACTIVE", "Active"),
+                            ("COMPLETED", "Completed"),
+                            ("CANCELLED", "Cancelled"),
+                        ],
+                        max_length=10,
+                        null=True,
+                    ),
+                ),
+                ("date_invested", models.DateTimeField()),
+                ("date_completed", models.DateTimeField(blank=True, null=True)),
+                (
+                    "total_earnings",
+                    models.DecimalField(
+                        blank=True, decimal_places=2, max_digits=12, null=True
+                    ),
+                ),
+                ("plan", models.CharField(blank=True, max_length=100, null=True)),
+                (
+                    "wallet_address",
+                    models.CharField(blank=True, max_length=255, null=True),
+                ),
+                ("archived_at", models.DateTimeField()),
+                (
+                    "investment_plan",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="hotmine.investmentplan",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Archived Investment",
+                "verbose_name_plural": "Archived Investments",
+                "ordering": ["-date_invested"],
+                "indexes": [
+                    models.Index(
+                        fields=["user", "-date_invested"],
+                        name="hotmine_arc_user_id_c4aede_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="ArchivedWithdrawalRequest",
+            fields=[
+                ("id", models.BigIntegerField(primary_key=True, serialize=False)),
+                ("amount", models.DecimalField(decimal_places=2, max_digits=12)),
+                (
+                    "withdrawal_method",
+                    models.CharField(
+                        choices=[
+                            ("bank", "Bank Transfer"),
+                            ("paypal", "PayPal"),
+                            ("crypto", "Cryptocurrency"),
+                            ("mobile_money", "Mobile Money"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("account_details", models.TextField()),
+                ("withdrawal_note", models.TextField(blank=True, null=True)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Pending"),
+                            ("processing", "Processing"),
+                            ("completed", "Completed"),
+                            ("rejected", "Rejected"),
+                            ("cancelled", "Cancelled"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("created_at", models.DateTimeField()),
+                ("updated_at", models.DateTimeField()),
+                ("processed_at", models.DateTimeField(blank=True, null=True)),
+                ("admin_note", models.TextField(blank=True, null=True)),
+                (
+                    "transaction_id",
+                    models.CharField(blank=True, max_length=100, null=True),
+                ),
+                ("rejection_reason", models.TextField(blank=True, null=True)),
+                ("archived_at", models.DateTimeField()),
+                (
+                    "processed_by",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Archived Withdrawal Request",
+                "verbose_name_plural": "Archived Withdrawal Requests",
+                "ordering": ["-created_at"],
+                "indexes": [
+                    models.Index(
+                        fields=["user", "-created_at"],
+                        name="hotmine_arc_user_id_376b15_idx",
+                    )
+                ],
+            },
+        ),
+    ]
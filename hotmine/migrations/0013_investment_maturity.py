@@ -0,0 +1,74 @@
+# Generated by Django 5.2.4 on 2026-10-18 21:13
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+from django.utils import timezone
+
+
+def fill_maturity(apps, schema_editor):
+    """
+    Maturity dates for open investments. Earnings before today were credited
+    by hand, so accrual starts from today rather than the investment date.
+    """
+    Investment = apps.get_model("hotmine", "Investment")
+    InvestmentPlan = apps.get_model("hotmine", "InvestmentPlan")
+    open_investments = Investment.objects.exclude(status__in=["COMPLETED", "CANCELLED"])
+    for plan_id, days in InvestmentPlan.objects.values_list(
+        "pk", "investment_duration_days"
+    ):
+        open_investments.filter(investment_plan_id=plan_id).update(
+            matures_at=F("date_invested") + timedelta(days=days)
+        )
+    open_investments.filter(status="ACTIVE").update(
+        last_accrued_on=timezone.now().date()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("hotmine", "0012_archive_tables"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="archivedinvestment",
+            name="last_accrued_on",
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="archivedinvestment",
+            name="matures_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="investment",
+            name="last_accrued_on",
+            field=models.DateField(
+                blank=True, help_text="Earnings are credited up to this day", null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="investment",
+            name="matures_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="investment",
+            index=models.Index(
+                fields=["status", "matures_at"], name="hotmine_inv_status_32387f_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="investment",
+            index=models.Index(
+                fields=["status", "last_accrued_on"],
+                name="hotmine_inv_status_fe98df_idx",
+            ),
+        ),
+        migrations.RunPython(fill_maturity, migrations.RunPython.noop),
+    ]
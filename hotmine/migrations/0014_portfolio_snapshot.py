@@ -0,0 +1,67 @@
+# Generated by Django 5.2.4 on 2026-10-18 21:19
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+import hotmine.money
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("hotmine", "0013_investment_maturity"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PortfolioSnapshot",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField()),
+                ("invested", hotmine.money.MoneyField(default=0)),
+                ("earned", hotmine.money.MoneyField(default=0)),
+                ("withdrawn", hotmine.money.MoneyField(default=0)),
+                ("balance", hotmine.money.MoneyField(default=0)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Portfolio Snapshot",
+                "verbose_name_plural": "Portfolio Snapshots",
+                "indexes": [
+                    models.Index(
+                        fields=[
+                            "user",
+                            "day",
+                            "invested",
+                            "earned",
+                            "withdrawn",
+                            "balance",
+                        ],
+                        name="hotmine_snapshot_covering",
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("user", "day"), name="hotmine_snapshot_user_day"
+                    )
+                ],
+            },
+        ),
+    ]
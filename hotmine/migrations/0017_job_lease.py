@@ -0,0 +1,51 @@
+# Generated by Django 5.2.4 on 2026-10-18 21:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("hotmine", "0015_outbox"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="JobLease",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=50, unique=True)),
+                ("next_run_at", models.DateTimeField()),
+                ("owner", models.CharField(blank=True, max_length=100)),
+                ("leased_until", models.DateTimeField(blank=True, null=True)),
+                ("last_started_at", models.DateTimeField(blank=True, null=True)),
+                ("last_finished_at", models.DateTimeField(blank=True, null=True)),
+                ("last_status", models.CharField(blank=True, max_length=10)),
+                ("last_error", models.TextField(blank=True)),
+                ("last_duration", models.FloatField(blank=True, null=True)),
+                ("max_duration", models.FloatField(default=0)),
+                ("total_duration", models.FloatField(default=0)),
+                ("runs", models.PositiveIntegerField(default=0)),
+                ("failures", models.PositiveIntegerField(default=0)),
+                (
+                    "missed",
+                    models.PositiveIntegerField(
+                        default=0, help_text="Runs skipped while no instance was up"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Scheduled Job",
+                "verbose_name_plural": "Scheduled Jobs",
+                "ordering": ["name"],
+            },
+        ),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 5.2.4 on 2026-10-18 21:47
+
+import django.db.models.deletion
+import hotmine.money
+from django.db import migrations, models
+
+from hotmine.planstats import totals
+
+
+def fill_stats(apps, schema_editor):
+    """Counters for the investments already there"""
+    db = schema_editor.connection.alias
+    Investment = apps.get_model("hotmine", "Investment")
+    InvestmentPlan = apps.get_model("hotmine", "InvestmentPlan")
+    InvestmentPlanStats = apps.get_model("hotmine", "InvestmentPlanStats")
+    counted = totals(Investment.objects.using(db))
+    InvestmentPlanStats.objects.using(db).bulk_create(
+        [
+            InvestmentPlanStats(plan_id=pk, **counted.get(pk, {}))
+            for pk in InvestmentPlan.objects.using(db).values_list("pk", flat=True)
+        ]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("hotmine", "0017_job_lease"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="InvestmentPlanStats",
+            fields=[
+                (
+                    "plan",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="stats",
+                        serialize=False,
+                        to="hotmine.investmentplan",
+                    ),
+                ),
+                ("investors", models.IntegerField(default=0)),
+                ("active_investments", models.IntegerField(default=0)),
+                (
+                    "aum",
+                    hotmine.money.MoneyField(
+                        default=0, help_text="Amount in active investments"
+                    ),
+                ),
+                ("pending_investments", models.IntegerField(default=0)),
+                (
+                    "pending_amount",
+                    hotmine.money.MoneyField(
+                        default=0, help_text="Amount awaiting payment"
+                    ),
+                ),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("reconciled_at", models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                "verbose_name": "Investment Plan Stats",
+                "verbose_name_plural": "Investment Plan Stats",
+            },
+        ),
+        migrations.AddField(
+            model_name="investmentplan",
+            name="capacity",
+            field=models.DecimalField(
+                blank=True,
+                decimal_places=2,
+                help_text="Most the plan takes in across active and pending investments; blank for no limit",
+                max_digits=12,
+                null=True,
+            ),
+        ),
+        migrations.RunPython(fill_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Total earnings move from a decimal column to integer cents (hotmine/money.py)
+
+from django.db import migrations
+
+import hotmine.money
+from hotmine.money import decimal_to_cents
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("hotmine", "0018_plan_stats"),
+    ]
+
+    operations = decimal_to_cents(
+        "totalearnings",
+        "total_earnings",
+        hotmine.money.MoneyField(null=True, blank=True),
+    )
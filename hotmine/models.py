@@ -1,11 +1,16 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
+from datetime import timedelta
 from decimal import Decimal
 
+from . import outbox
+from .money import ZERO, Money, MoneyField
+from .archive import ReadThroughManager
+
 
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, null=True, blank=True)
@@ -106,6 +111,14 @@ class InvestmentPlan(models.Model):
         null=True,
         blank=True,
     )
+    capacity = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        null=True,
+        blank=True,
+        help_text="Most the plan takes in across active and pending "
+        "investments; blank for no limit",
+    )
     is_active = models.BooleanField(default=True)
     sort_order = models.PositiveIntegerField(
         default=0,
@@ -156,6 +169,26 @@ class InvestmentPlan(models.Model):
         verbose_name_plural = "Investment Plans"
 
 
+def maturity_schedule(status, date_invested, matures_at, duration, today):
+    """
+    (days remaining, progress percentage) of an investment, counted to
+    matures_at as settlement does; the model and the API both use this
+    """
+    if status == "COMPLETED":
+        return 0, 100
+    if matures_at is None:
+        if duration is None:
+            return None, None
+        # Not filled in yet: what save() and settlement would set
+        matures_at = date_invested + timedelta(days=duration)
+    start, end = date_invested.date(), matures_at.date()
+    remaining = max(0, (end - today).days)
+    total = (end - start).days
+    if total <= 0:
+        return remaining, 100
+    return remaining, min(100, max(0, (today - start).days) * 100 / total)
+
+
 class Investment(models.Model):
     STATUS_CHOICES = [
         ("PENDING", "Pending"),
@@ -187,11 +220,20 @@ class Investment(models.Model):
     total_earnings = models.DecimalField(
         max_digits=12, decimal_places=2, default=0, null=True, blank=True
     )
+    # Kept up to date by the settlement engine (hotmine/settlement.py)
+    matures_at = models.DateTimeField(null=True, blank=True)
+    last_accrued_on = models.DateField(
+        null=True, blank=True, help_text="Earnings are credited up to this day"
+    )
 
     # Legacy fields
     plan = models.CharField(max_length=100, blank=True, null=True)
     wallet_address = models.CharField(max_length=255, blank=True, null=True)
 
+    objects = models.Manager()
+    # Hot and archived rows together, for the history pages (hotmine/archive.py)
+    history = ReadThroughManager("ArchivedInvestment")
+
     def __str__(self):
         if self.user and self.investment_plan:
             return (
@@ -221,43 +263,47 @@ class Investment(models.Model):
 
     @property
     def days_remaining(self):
-        from django.utils import timezone
-
         if not self.investment_plan:
             return None
-        if self.status == "COMPLETED":
-            return 0
-        days_elapsed = (timezone.now().date() - self.date_invested.date()).days
-        return max(0, self.investment_plan.investment_duration_days - days_elapsed)
+        return maturity_schedule(
+            self.status,
+            self.date_invested,
+            self.matures_at,
+            self.investment_plan.investment_duration_days,
+            timezone.now().date(),
+        )[0]
 
     @property
     def progress_percentage(self):
-        from django.utils import timezone
-
         if not self.investment_plan:
             return None
-        if self.status == "COMPLETED":
-            return 100
-        days_elapsed = (timezone.now().date() - self.date_invested.date()).days
-        total_days = self.investment_plan.investment_duration_days
-        return min(100, (days_elapsed / total_days) * 100)
+        return maturity_schedule(
+            self.status,
+            self.date_invested,
+            self.matures_at,
+            self.investment_plan.investment_duration_days,
+            timezone.now().date(),
+        )[1]
 
     def save(self, *args, **kwargs):
-        if self.plan and not self.investment_plan_id:
-            try:
-                plan = InvestmentPlan.objects.filter(
-                    title__icontains=self.plan.split()[0]
-                ).first()
-                if plan:
-                    self.investment_plan = plan
-            except:
-                pass
+        if self.matures_at is None and self.investment_plan_id:
+            started = self.date_invested or timezone.now()
+            self.matures_at = started + timedelta(
+                days=self.investment_plan.investment_duration_days
+            )
+        # Legacy `plan` names are resolved once by `manage.py
+        # backfill_investment_plans`, not with a lookup on every save
         if self.wallet_address and not self.wallet_address_used:
             self.wallet_address_used = self.wallet_address
         super().save(*args, **kwargs)
 
     class Meta:
         ordering = ["-date_invested"]
+        # Range scans for the settlement engine
+        indexes = [
+            models.Index(fields=["status", "matures_at"]),
+            models.Index(fields=["status", "last_accrued_on"]),
+        ]
         verbose_name = "Investment"
         verbose_name_plural = "Investments"
 
@@ -274,9 +320,8 @@ class Amount(models.Model):
 
 class Totalearnings(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
-    total_earnings = models.DecimalField(
-        max_digits=12, decimal_places=2, null=True, blank=True
-    )
+    # Cents (hotmine/money.py): settlement credits it on every accrual
+    total_earnings = MoneyField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -350,6 +395,10 @@ class WithdrawalRequest(models.Model):
     transaction_id = models.CharField(max_length=100, blank=True, null=True)
     rejection_reason = models.TextField(blank=True, null=True)
 
+    objects = models.Manager()
+    # Hot and archived rows together, for the history pages (hotmine/archive.py)
+    history = ReadThroughManager("ArchivedWithdrawalRequest")
+
     class Meta:
         ordering = ["-created_at"]
         verbose_name = "Withdrawal Request"
@@ -370,7 +419,11 @@ class WithdrawalRequest(models.Model):
         self.processed_by = processed_by
         if transaction_id:
             self.transaction_id = transaction_id
-        self.save()
+        with transaction.atomic():
+            self.save()
+            outbox.enqueue(
+                self.user_id, "withdrawal.completed", outbox.withdrawal_payload(self)
+            )
 
     def mark_as_rejected(self, reason, processed_by=None):
         """Mark withdrawal as rejected"""
@@ -378,4 +431,236 @@ class WithdrawalRequest(models.Model):
         self.rejection_reason = reason
         self.processed_at = timezone.now()
         self.processed_by = processed_by
-        self.save()
+        with transaction.atomic():
+            self.save()
+            outbox.enqueue(
+                self.user_id, "withdrawal.rejected", outbox.withdrawal_payload(self)
+            )
+
+
+# Archive tables. Same columns as the hot tables plus archived_at; rows are
+# moved here by `manage.py archive_history` and keep their original ids.
+
+
+class ArchivedInvestment(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, null=True, blank=True, related_name="+"
+    )
+    investment_plan = models.ForeignKey(
+        InvestmentPlan,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="+",
+    )
+    amount = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    wallet_address_used = models.CharField(max_length=255, null=True, blank=True)
+    status = models.CharField(
+        max_length=10, choices=Investment.STATUS_CHOICES, null=True, blank=True
+    )
+    date_invested = models.DateTimeField()
+    date_completed = models.DateTimeField(null=True, blank=True)
+    total_earnings = models.DecimalField(
+        max_digits=12, decimal_places=2, null=True, blank=True
+    )
+    plan = models.CharField(max_length=100, blank=True, null=True)
+    wallet_address = models.CharField(max_length=255, blank=True, null=True)
+    matures_at = models.DateTimeField(null=True, blank=True)
+    last_accrued_on = models.DateField(null=True, blank=True)
+    archived_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"Archived investment {self.id}"
+
+    class Meta:
+        ordering = ["-date_invested"]
+        indexes = [models.Index(fields=["user", "-date_invested"])]
+        verbose_name = "Archived Investment"
+        verbose_name_plural = "Archived Investments"
+
+
+class ArchivedWithdrawalRequest(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    withdrawal_method = models.CharField(
+        max_length=20, choices=WithdrawalRequest.WITHDRAWAL_METHOD_CHOICES
+    )
+    account_details = models.TextField()
+    withdrawal_note = models.TextField(blank=True, null=True)
+    status = models.CharField(
+        max_length=20, choices=WithdrawalRequest.WITHDRAWAL_STATUS_CHOICES
+    )
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    processed_at = models.DateTimeField(blank=True, null=True)
+    admin_note = models.TextField(blank=True, null=True)
+    processed_by = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, blank=True, related_name="+"
+    )
+    transaction_id = models.CharField(max_length=100, blank=True, null=True)
+    rejection_reason = models.TextField(blank=True, null=True)
+    archived_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"Archived withdrawal {self.id} - ${self.amount} - {self.status}"
+
+    class Meta:
+        ordering = ["-created_at"]
+        indexes = [models.Index(fields=["user", "-created_at"])]
+        verbose_name = "Archived Withdrawal Request"
+        verbose_name_plural = "Archived Withdrawal Requests"
+
+
+class InvestmentPlanStats(models.Model):
+    """
+    A plan's investor count, money under management and room left, moved
+    by the changes that affect them (hotmine/planstats.py)
+    """
+
+    plan = models.OneToOneField(
+        InvestmentPlan, on_delete=models.CASCADE, primary_key=True, related_name="stats"
+    )
+    # Users with an active investment in the plan
+    investors = models.IntegerField(default=0)
+    active_investments = models.IntegerField(default=0)
+    aum = MoneyField(default=0, help_text="Amount in active investments")
+    pending_investments = models.IntegerField(default=0)
+    pending_amount = MoneyField(default=0, help_text="Amount awaiting payment")
+    updated_at = models.DateTimeField(auto_now=True)
+    reconciled_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Stats for {self.plan}"
+
+    @property
+    def committed(self):
+        """What counts against the plan's capacity"""
+        return self.aum + self.pending_amount
+
+    @property
+    def capacity_left(self):
+        if self.plan.capacity is None:
+            return None
+        return max(Money.parse(self.plan.capacity) - self.committed, ZERO)
+
+    @property
+    def capacity_used_percentage(self):
+        if self.plan.capacity is None:
+            return None
+        capacity = Money.parse(self.plan.capacity)
+        if not capacity:
+            return 100
+        return min(100, self.committed.cents * 100 / capacity.cents)
+
+    class Meta:
+        verbose_name = "Investment Plan Stats"
+        verbose_name_plural = "Investment Plan Stats"
+
+
+class PortfolioSnapshot(models.Model):
+    """A user's numbers at the end of a day, for charts (hotmine/snapshots.py)"""
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    day = models.DateField()
+    # Cents (hotmine/money.py), summed and compared as ints
+    invested = MoneyField(default=0)
+    earned = MoneyField(default=0)
+    withdrawn = MoneyField(default=0)
+    balance = MoneyField(default=0)
+
+    def __str__(self):
+        return f"Snapshot {self.user_id} {self.day}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "day"], name="hotmine_snapshot_user_day"
+            )
+        ]
+        # Every column a chart reads, so range reads never touch the table
+        indexes = [
+            models.Index(
+                fields=["user", "day", "invested", "earned", "withdrawn", "balance"],
+                name="hotmine_snapshot_covering",
+            )
+        ]
+        verbose_name = "Portfolio Snapshot"
+        verbose_name_plural = "Portfolio Snapshots"
+
+
+class OutboxMessage(models.Model):
+    """
+    A notification to deliver, written in the same transaction as the
+    change it reports and sent later by the dispatcher (hotmine/outbox.py)
+    """
+
+    STATUS_CHOICES = [
+        ("pending", "Pending"),
+        ("sent", "Sent"),
+        ("failed", "Failed"),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    event = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="pending")
+    attempts = models.PositiveIntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    def __str__(self):
+        return f"{self.event} for {self.user_id} ({self.status})"
+
+    class Meta:
+        ordering = ["-created_at"]
+        # The dispatcher's queue: due pending messages, oldest first
+        indexes = [
+            models.Index(
+                fields=["available_at"],
+                condition=models.Q(status="pending"),
+                name="hotmine_outbox_due",
+            )
+        ]
+        verbose_name = "Outbox Message"
+        verbose_name_plural = "Outbox Messages"
+
+
+class JobLease(models.Model):
+    """
+    One scheduled job's next run, who holds it while it runs and how its
+    runs went (hotmine/scheduler.py)
+    """
+
+    name = models.CharField(max_length=50, unique=True)
+    next_run_at = models.DateTimeField()
+    owner = models.CharField(max_length=100, blank=True)
+    leased_until = models.DateTimeField(null=True, blank=True)
+    last_started_at = models.DateTimeField(null=True, blank=True)
+    last_finished_at = models.DateTimeField(null=True, blank=True)
+    last_status = models.CharField(max_length=10, blank=True)
+    last_error = models.TextField(blank=True)
+    # Seconds
+    last_duration = models.FloatField(null=True, blank=True)
+    max_duration = models.FloatField(default=0)
+    total_duration = models.FloatField(default=0)
+    runs = models.PositiveIntegerField(default=0)
+    failures = models.PositiveIntegerField(default=0)
+    missed = models.PositiveIntegerField(
+        default=0, help_text="Runs skipped while no instance was up"
+    )
+
+    def __str__(self):
+        return self.name
+
+    @property
+    def average_duration(self):
+        return self.total_duration / self.runs if self.runs else None
+
+    class Meta:
+        ordering = ["name"]
+        verbose_name = "Scheduled Job"
+        verbose_name_plural = "Scheduled Jobs"
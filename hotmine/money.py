@@ -0,0 +1,279 @@
+"""
+Money as a whole number of cents.
+
+Money wraps an int, so sums, comparisons and accrual loops are integer
+arithmetic instead of Decimal contexts, and can't pick up float error the
+way a float() somewhere in a view can. Rounding happens only where the code
+asks for it (percent(), parse()), half-even by default like Decimal's
+quantize(), which is what the Decimal code it replaces did.
+
+MoneyField stores Money in a 64-bit integer column (cents, so up to about
+92 trillion dollars) and hands back Money. decimal_to_cents() gives the
+migration operations that turn an existing DecimalField column into a
+MoneyField, copying values across; see migration 0019 for Totalearnings.
+
+percents() is the batch form of Money.percent() for accrual loops,
+vectorised with NumPy when it's installed. `manage.py benchmark_money`
+compares both with Decimal on aggregation and accrual.
+"""
+
+from decimal import ROUND_HALF_EVEN, ROUND_HALF_UP, Decimal, InvalidOperation
+from functools import total_ordering
+
+from django import forms
+from django.db import migrations, models
+from django.db.models import F
+from django.db.models.functions import Cast, Round
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+CENTS = 100
+# Products past this could overflow int64 in the NumPy path
+INT64_SAFE = 2**62
+
+
+def _divide(numerator, denominator, rounding=ROUND_HALF_EVEN):
+    """numerator / denominator rounded to an int, denominator > 0"""
+    quotient, remainder = divmod(numerator, denominator)
+    if 2 * remainder > denominator:
+        quotient += 1
+    elif 2 * remainder == denominator:
+        if rounding == ROUND_HALF_UP:
+            # Away from zero; floor division already went down for negatives
+            quotient += numerator >= 0
+        else:
+            quotient += quotient % 2
+    return quotient
+
+
+def ratio(rate):
+    """An exact (numerator, denominator) for a rate given as Decimal/str/int"""
+    if isinstance(rate, tuple):
+        return rate
+    if isinstance(rate, float):
+        rate = str(rate)
+    try:
+        return Decimal(rate).as_integer_ratio()
+    except (InvalidOperation, ValueError, TypeError) as e:
+        raise ValueError(f"Invalid rate: {rate!r}") from e
+
+
+def percents(cents, numerators, denominators, rounding=ROUND_HALF_EVEN):
+    """
+    numerator/denominator percent of each amount, in cents, for parallel
+    lists of ints (see ratio()). With NumPy installed the lists become
+    arrays and it's one vectorised divide; without it, or when the numbers
+    could overflow 64 bits, a plain loop.
+    """
+    if not cents:
+        return []
+    biggest = max(
+        max(map(abs, cents)) * max(map(abs, numerators)),
+        2 * CENTS * max(denominators),
+    )
+    if np is None or biggest >= INT64_SAFE or len(cents) < 64:
+        return [
+            _divide(amount * numerator, denominator * CENTS, rounding)
+            for amount, numerator, denominator in zip(cents, numerators, denominators)
+        ]
+    products = np.array(cents, dtype=np.int64) * np.array(numerators, dtype=np.int64)
+    divisors = np.array(denominators, dtype=np.int64) * CENTS
+    quotient, remainder = np.divmod(products, divisors)
+    half = 2 * remainder == divisors
+    if rounding == ROUND_HALF_UP:
+        half &= products >= 0
+    else:
+        half &= quotient % 2 == 1
+    quotient += (2 * remainder > divisors) | half
+    return quotient.tolist()
+
+
+@total_ordering
+class Money:
+    """An exact amount of money in cents"""
+
+    __slots__ = ("cents",)
+
+    def __init__(self, cents=0):
+        if not isinstance(cents, int) or isinstance(cents, bool):
+            raise TypeError(f"Money takes whole cents, not {type(cents).__name__}")
+        self.cents = cents
+
+    @classmethod
+    def parse(cls, value, rounding=ROUND_HALF_EVEN):
+        """Money from an amount in dollars: Decimal, str, int or float"""
+        if isinstance(value, Money):
+            return value
+        if isinstance(value, float):
+            value = str(value)
+        try:
+            amount = Decimal(value).scaleb(2)
+            return cls(int(amount.quantize(Decimal(1), rounding=rounding)))
+        except (InvalidOperation, ValueError, TypeError, OverflowError) as e:
+            raise ValueError(f"Invalid amount: {value!r}") from e
+
+    @classmethod
+    def total(cls, amounts):
+        """Sum of Money values, without a Money per step"""
+        return cls(sum(amount.cents for amount in amounts))
+
+    def to_decimal(self):
+        return Decimal(self.cents).scaleb(-2)
+
+    def percent(self, rate, rounding=ROUND_HALF_EVEN):
+        """rate percent of this amount, rounded to a cent"""
+        numerator, denominator = ratio(rate)
+        return Money(_divide(self.cents * numerator, denominator * CENTS, rounding))
+
+    def __str__(self):
+        sign = "-" if self.cents < 0 else ""
+        dollars, cents = divmod(abs(self.cents), CENTS)
+        return f"{sign}{dollars}.{cents:02d}"
+
+    def __repr__(self):
+        return f"Money('{self}')"
+
+    def __format__(self, spec):
+        return format(self.to_decimal(), spec)
+
+    def __float__(self):
+        return self.cents / CENTS
+
+    def __bool__(self):
+        return bool(self.cents)
+
+    def __hash__(self):
+        return hash(("Money", self.cents))
+
+    def __eq__(self, other):
+        if isinstance(other, Money):
+            return self.cents == other.cents
+        return NotImplemented
+
+    def __lt__(self, other):
+        if isinstance(other, Money):
+            return self.cents < other.cents
+        return NotImplemented
+
+    def __add__(self, other):
+        if isinstance(other, Money):
+            return Money(self.cents + other.cents)
+        # sum() starts from 0
+        if other == 0 and isinstance(other, int):
+            return self
+        return NotImplemented
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        if isinstance(other, Money):
+            return Money(self.cents - other.cents)
+        return NotImplemented
+
+    def __neg__(self):
+        return Money(-self.cents)
+
+    def __abs__(self):
+        return Money(abs(self.cents))
+
+    def __mul__(self, other):
+        # Only whole multiples stay exact; use percent() for rates
+        if isinstance(other, int) and not isinstance(other, bool):
+            return Money(self.cents * other)
+        return NotImplemented
+
+    __rmul__ = __mul__
+
+
+ZERO = Money(0)
+
+
+class MoneyFormField(forms.DecimalField):
+    """Dollars in the form, Money out of clean()"""
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault("decimal_places", 2)
+        super().__init__(**kwargs)
+
+    def prepare_value(self, value):
+        if isinstance(value, Money):
+            return value.to_decimal()
+        return value
+
+    def to_python(self, value):
+        value = super().to_python(value)
+        return None if value is None else Money.parse(value)
+
+
+class MoneyField(models.BigIntegerField):
+    """
+    Money stored as integer cents. Ints (and int strings, as in fixtures)
+    are cents; Decimals and floats are dollars.
+    """
+
+    description = "Amount of money in cents"
+
+    def from_db_value(self, value, expression, connection):
+        return None if value is None else Money(int(value))
+
+    def to_python(self, value):
+        if value is None or isinstance(value, Money):
+            return value
+        if isinstance(value, int):
+            return Money(value)
+        if isinstance(value, str) and value.lstrip("-").isdigit():
+            return Money(int(value))
+        return Money.parse(value)
+
+    def get_prep_value(self, value):
+        if value is None or hasattr(value, "resolve_expression"):
+            return value
+        return self.to_python(value).cents
+
+    def value_to_string(self, obj):
+        value = self.value_from_object(obj)
+        return "" if value is None else str(self.get_prep_value(value))
+
+    def run_validators(self, value):
+        # The range checks are on the column, in cents
+        if isinstance(value, Money):
+            value = value.cents
+        super().run_validators(value)
+
+    def formfield(self, **kwargs):
+        # Skip the integer field's min/max, which are in cents
+        return models.Field.formfield(self, **{"form_class": MoneyFormField, **kwargs})
+
+
+def decimal_to_cents(model_name, name, field):
+    """
+    Migration operations turning DecimalField `name` into the MoneyField
+    `field`: add a cents column, copy the rounded values over in one UPDATE
+    (reversible), drop the decimal column and take its name. Drop indexes
+    covering the column before these and add them back after.
+    """
+    temporary = f"{name}_cents"
+
+    def forward(apps, schema_editor):
+        model = apps.get_model("hotmine", model_name)
+        model.objects.using(schema_editor.connection.alias).update(
+            **{temporary: Cast(Round(F(name) * CENTS), models.BigIntegerField())}
+        )
+
+    def backward(apps, schema_editor):
+        model = apps.get_model("hotmine", model_name)
+        # Through a float so SQLite doesn't do integer division; exact for
+        # any amount of cents below 2**53
+        model.objects.using(schema_editor.connection.alias).update(
+            **{name: Cast(F(temporary), models.FloatField()) / CENTS}
+        )
+
+    return [
+        migrations.AddField(model_name, temporary, field),
+        migrations.RunPython(forward, backward),
+        migrations.RemoveField(model_name, name),
+        migrations.RenameField(model_name, temporary, name),
+    ]
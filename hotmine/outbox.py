@@ -0,0 +1,236 @@
+"""
+Transactional outbox for user notifications.
+
+Status changes that users should hear about (withdrawals completed or
+rejected, investments activated, completed or cancelled) add an
+OutboxMessage in the same transaction as the change, so a message exists
+exactly when the change committed, and nothing is sent while an admin
+action or a request is still running.
+
+`manage.py dispatch_outbox` delivers them. Each pass claims a batch of due
+messages (SKIP LOCKED on Postgres) by pushing them OUTBOX_LEASE_SECONDS into
+the future, then sends one digest email per user covering all of that
+user's messages in the batch, through the configured EMAIL_BACKEND (the
+file backend locally, locmem in tests). A failed send is retried with
+exponential backoff; after OUTBOX_MAX_ATTEMPTS the messages are marked
+failed and kept for the admin. Sent messages are purged after
+OUTBOX_KEEP_DAYS.
+
+Settings:
+    OUTBOX_BATCH_SIZE      messages claimed per pass (default 100)
+    OUTBOX_MAX_ATTEMPTS    sends before a message is marked failed (default 6)
+    OUTBOX_RETRY_SECONDS   first retry delay, doubled each attempt (default 60)
+    OUTBOX_RETRY_MAX       longest retry delay (default 3600)
+    OUTBOX_LEASE_SECONDS   how long a claimed message is hidden (default 300)
+    OUTBOX_KEEP_DAYS       days sent messages are kept (default 30)
+"""
+
+import logging
+import random
+from collections import defaultdict
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.core import mail
+from django.db import connections, router, transaction
+from django.db.models import F
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# event: (subject, line); lines are formatted with the payload
+EVENTS = {
+    "withdrawal.completed": (
+        "Withdrawal completed",
+        "Your withdrawal of ${amount} has been completed.",
+    ),
+    "withdrawal.rejected": (
+        "Withdrawal rejected",
+        "Your withdrawal of ${amount} was rejected. {reason}",
+    ),
+    "investment.active": (
+        "Investment active",
+        "Your ${amount} investment in {plan} is now active.",
+    ),
+    "investment.completed": (
+        "Investment completed",
+        "Your ${amount} investment in {plan} has completed.",
+    ),
+    "investment.cancelled": (
+        "Investment cancelled",
+        "Your ${amount} investment in {plan} was cancelled.",
+    ),
+}
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _model():
+    return apps.get_model("hotmine", "OutboxMessage")
+
+
+# -- Writing ------------------------------------------------------------------
+
+
+def withdrawal_payload(withdrawal):
+    return {
+        "id": withdrawal.pk,
+        "amount": f"{withdrawal.amount or 0:.2f}",
+        "reason": withdrawal.rejection_reason or "",
+    }
+
+
+def investment_payload(pk, amount, plan):
+    return {"id": pk, "amount": f"{amount or 0:.2f}", "plan": plan or "your plan"}
+
+
+def enqueue_many(messages):
+    """
+    Add (user_id, event, payload) messages. Call it inside the transaction
+    that makes the change, so both commit or neither does.
+    """
+    Message = _model()
+    rows = [
+        Message(user_id=user_id, event=event, payload=payload)
+        for user_id, event, payload in messages
+        if user_id and event in EVENTS
+    ]
+    Message.objects.bulk_create(rows)
+    return len(rows)
+
+
+def enqueue(user_id, event, payload):
+    return enqueue_many([(user_id, event, payload)])
+
+
+# -- Dispatching --------------------------------------------------------------
+
+
+def backoff(attempts):
+    """Seconds before retry number `attempts`, with a little jitter"""
+    delay = _setting("OUTBOX_RETRY_SECONDS", 60) * 2 ** max(attempts - 1, 0)
+    delay = min(delay, _setting("OUTBOX_RETRY_MAX", 3600))
+    return delay * random.uniform(0.9, 1.1)
+
+
+def claim(batch_size=None, now=None):
+    """Take a batch of due messages for this dispatcher"""
+    Message = _model()
+    now = now or timezone.now()
+    db = router.db_for_write(Message)
+    with transaction.atomic(using=db):
+        due = Message.objects.filter(status="pending", available_at__lte=now)
+        if connections[db].features.has_select_for_update_skip_locked:
+            due = due.select_for_update(skip_locked=True)
+        ids = list(
+            due.order_by("available_at").values_list("pk", flat=True)[
+                : batch_size or _setting("OUTBOX_BATCH_SIZE", 100)
+            ]
+        )
+        # Hidden from other dispatchers until sent, or until the lease runs
+        # out if this one dies
+        lease = timedelta(seconds=_setting("OUTBOX_LEASE_SECONDS", 300))
+        Message.objects.filter(pk__in=ids).update(
+            attempts=F("attempts") + 1, available_at=now + lease
+        )
+    return list(
+        Message.objects.using(db)
+        .filter(pk__in=ids)
+        .select_related("user")
+        .order_by("created_at")
+    )
+
+
+def render_digest(user, messages):
+    """One email covering all of a user's messages"""
+    lines = []
+    for message in messages:
+        _, line = EVENTS[message.event]
+        lines.append(line.format(**message.payload).strip())
+    if len(messages) == 1:
+        subject = EVENTS[messages[0].event][0]
+    else:
+        subject = f"{len(messages)} updates on your HotMine account"
+    body = render_to_string("hotmine/email/digest.txt", {"user": user, "lines": lines})
+    return mail.EmailMessage(subject, body, to=[user.email])
+
+
+def _retry(messages, error, now):
+    """Schedule another attempt, or give up on messages out of attempts"""
+    Message = _model()
+    by_attempts = defaultdict(list)
+    for message in messages:
+        by_attempts[message.attempts].append(message.pk)
+    failed = 0
+    for attempts, ids in by_attempts.items():
+        if attempts >= _setting("OUTBOX_MAX_ATTEMPTS", 6):
+            failed += Message.objects.filter(pk__in=ids).update(
+                status="failed", last_error=error
+            )
+        else:
+            Message.objects.filter(pk__in=ids).update(
+                available_at=now + timedelta(seconds=backoff(attempts)),
+                last_error=error,
+            )
+    return failed
+
+
+def dispatch(batch_size=None):
+    """Deliver one batch; returns counts of messages sent, retried and failed"""
+    Message = _model()
+    now = timezone.now()
+    messages = claim(batch_size, now)
+    counts = {"sent": 0, "retried": 0, "failed": 0}
+    if not messages:
+        return counts
+
+    by_user = defaultdict(list)
+    for message in messages:
+        by_user[message.user].append(message)
+
+    connection = mail.get_connection()
+    try:
+        connection.open()
+    except Exception as e:
+        logger.warning("Outbox: email backend unavailable: %s", e)
+        failed = _retry(messages, str(e), now)
+        counts.update(retried=len(messages) - failed, failed=failed)
+        return counts
+
+    try:
+        for user, group in by_user.items():
+            ids = [message.pk for message in group]
+            if not user.email:
+                # Nothing to retry
+                counts["failed"] += Message.objects.filter(pk__in=ids).update(
+                    status="failed", last_error="User has no email address"
+                )
+                continue
+            try:
+                email = render_digest(user, group)
+                email.connection = connection
+                email.send()
+            except Exception as e:
+                logger.warning("Outbox: sending to user %s failed: %s", user.pk, e)
+                failed = _retry(group, str(e), now)
+                counts["failed"] += failed
+                counts["retried"] += len(group) - failed
+                continue
+            counts["sent"] += Message.objects.filter(pk__in=ids).update(
+                status="sent", sent_at=timezone.now(), last_error=""
+            )
+    finally:
+        connection.close()
+    return counts
+
+
+def purge(days=None):
+    """Delete sent messages older than OUTBOX_KEEP_DAYS"""
+    days = _setting("OUTBOX_KEEP_DAYS", 30) if days is None else days
+    cutoff = timezone.now() - timedelta(days=days)
+    deleted, _ = _model().objects.filter(status="sent", sent_at__lt=cutoff).delete()
+    return deleted
@@ -0,0 +1,214 @@
+"""
+Per-plan counters for the packages and invest pages.
+
+The plan cards show how many investors a plan has, how much it manages and
+how much room its capacity has left. Counting that live would be a
+COUNT/SUM over Investment on every page load, so each plan has an
+InvestmentPlanStats row instead:
+
+    investors            users with an active investment in the plan
+    active_investments   active investments, with their amount in aum
+    pending_investments  investments awaiting payment, in pending_amount
+
+Whatever creates investments or changes their status, plan or amount
+hands the changes to record() in the same transaction, as (before, after)
+Rows. It moves the counters with F() increments, one UPDATE per plan
+touched, so concurrent changes add up instead of overwriting each other.
+Pending amounts count against capacity too, so a plan can't be
+oversubscribed by investments still waiting for payment; has_room() checks
+a new investment against it.
+
+Changes that don't come through here (the shell, bulk SQL, the legacy
+backfill) make the counters drift, so reconcile() recomputes them from
+Investment in one grouped query and corrects what's off. The scheduler
+runs it hourly. The pages read the counters from the plan catalog cache
+(hotmine/catalog.py), which drops them when a change commits.
+"""
+
+import logging
+from collections import defaultdict, namedtuple
+
+from django.db import connections, router, transaction
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+
+from .catalog import invalidate_stats
+from .money import Money
+from .models import Investment, InvestmentPlan, InvestmentPlanStats
+
+logger = logging.getLogger(__name__)
+
+# status: (count column, amount column); other statuses aren't counted
+COUNTED = {
+    "ACTIVE": ("active_investments", "aum"),
+    "PENDING": ("pending_investments", "pending_amount"),
+}
+COLUMNS = ["investors"] + [column for pair in COUNTED.values() for column in pair]
+AMOUNTS = [amount for _, amount in COUNTED.values()]
+
+# What the counters need to know about one investment
+FIELDS = ("investment_plan_id", "user_id", "amount", "status")
+Row = namedtuple("Row", "plan_id user_id amount status")
+
+
+def row(investment):
+    return Row(*(getattr(investment, field) for field in FIELDS))
+
+
+def rows(queryset):
+    """{pk: Row} for the investments in queryset"""
+    return {pk: Row(*values) for pk, *values in queryset.values_list("pk", *FIELDS)}
+
+
+def _investor_changes(active, db):
+    """
+    Change in investors per plan, from the change in each user's active
+    investments there; read after the changes were made
+    """
+    active = {pair: change for pair, change in active.items() if change}
+    if not active:
+        return {}
+    now = defaultdict(int)
+    counts = (
+        Investment.objects.using(db)
+        .filter(
+            status="ACTIVE",
+            investment_plan_id__in={plan_id for plan_id, _ in active},
+            user_id__in={user_id for _, user_id in active},
+        )
+        .values("investment_plan_id", "user_id")
+        .annotate(count=Count("pk"))
+        .values_list("investment_plan_id", "user_id", "count")
+        .order_by()
+    )
+    for plan_id, user_id, count in counts:
+        now[plan_id, user_id] = count
+    investors = defaultdict(int)
+    for (plan_id, user_id), change in active.items():
+        after = now[plan_id, user_id]
+        investors[plan_id] += (after > 0) - (after - change > 0)
+    return investors
+
+
+def record(changes):
+    """
+    Move the counters for (before, after) pairs of Rows; before is None
+    for a new investment, after None for a deleted one. Call it inside the
+    transaction that made the changes, after making them.
+    """
+    deltas = defaultdict(lambda: defaultdict(int))
+    active = defaultdict(int)
+    for before, after in changes:
+        for state, sign in ((before, -1), (after, 1)):
+            if state is None or state.plan_id is None or state.status not in COUNTED:
+                continue
+            count, amount = COUNTED[state.status]
+            deltas[state.plan_id][count] += sign
+            deltas[state.plan_id][amount] += sign * Money.parse(state.amount or 0).cents
+            if state.status == "ACTIVE" and state.user_id:
+                active[state.plan_id, state.user_id] += sign
+
+    db = router.db_for_write(InvestmentPlanStats)
+    for plan_id, change in _investor_changes(active, db).items():
+        deltas[plan_id]["investors"] += change
+    deltas = {
+        plan_id: {column: change for column, change in delta.items() if change}
+        for plan_id, delta in deltas.items()
+    }
+    deltas = {plan_id: delta for plan_id, delta in deltas.items() if delta}
+    if not deltas:
+        return 0
+    InvestmentPlanStats.objects.bulk_create(
+        [InvestmentPlanStats(plan_id=plan_id) for plan_id in deltas],
+        ignore_conflicts=True,
+    )
+    now = timezone.now()
+    for plan_id, delta in deltas.items():
+        InvestmentPlanStats.objects.filter(plan_id=plan_id).update(
+            **{column: F(column) + change for column, change in delta.items()},
+            updated_at=now,
+        )
+    transaction.on_commit(invalidate_stats, using=db)
+    return len(deltas)
+
+
+def has_room(plan, amount):
+    """
+    Whether Money `amount` fits under the plan's capacity. Locks the plan's
+    counters until the transaction ends (on Postgres), so two investments
+    can't both take the last of it.
+    """
+    if plan.capacity is None:
+        return True
+    db = router.db_for_write(InvestmentPlanStats)
+    stats = InvestmentPlanStats.objects.using(db).filter(plan=plan)
+    if connections[db].features.has_select_for_update:
+        stats = stats.select_for_update()
+    stats = stats.first() or InvestmentPlanStats(plan=plan)
+    return stats.committed + amount <= Money.parse(plan.capacity)
+
+
+def totals(investments):
+    """{plan_id: {column: value}} counted from an Investment queryset"""
+    active, pending = Q(status="ACTIVE"), Q(status="PENDING")
+    counted = (
+        investments.filter(investment_plan__isnull=False, status__in=COUNTED)
+        .values("investment_plan_id")
+        .annotate(
+            investors=Count("user", distinct=True, filter=active),
+            active_investments=Count("pk", filter=active),
+            aum=Sum("amount", filter=active),
+            pending_investments=Count("pk", filter=pending),
+            pending_amount=Sum("amount", filter=pending),
+        )
+        .order_by()
+    )
+    result = {}
+    for values in counted:
+        plan_id = values.pop("investment_plan_id")
+        for column in AMOUNTS:
+            values[column] = Money.parse(values[column] or 0)
+        result[plan_id] = values
+    return result
+
+
+def reconcile():
+    """Correct counters that drifted from Investment; returns plans corrected"""
+    db = router.db_for_write(InvestmentPlanStats)
+    now = timezone.now()
+    with transaction.atomic(using=db):
+        InvestmentPlanStats.objects.bulk_create(
+            [
+                InvestmentPlanStats(plan_id=pk)
+                for pk in InvestmentPlan.objects.using(db).values_list("pk", flat=True)
+            ],
+            ignore_conflicts=True,
+        )
+        # Locked before counting, so a change committing meanwhile either is
+        # in the count or has its increment applied on top of it
+        stats = InvestmentPlanStats.objects.using(db).all()
+        if connections[db].features.has_select_for_update:
+            stats = stats.select_for_update()
+        stats = list(stats)
+        expected = totals(Investment.objects.using(db))
+        drifted = []
+        for plan_stats in stats:
+            values = expected.get(plan_stats.plan_id, {})
+            wrong = {}
+            for column in COLUMNS:
+                value = values.get(column, Money() if column in AMOUNTS else 0)
+                if getattr(plan_stats, column) != value:
+                    wrong[column] = (getattr(plan_stats, column), value)
+                    setattr(plan_stats, column, value)
+            if wrong:
+                logger.warning(
+                    "Plan stats for plan %s were off: %s", plan_stats.plan_id, wrong
+                )
+                plan_stats.updated_at = now
+                drifted.append(plan_stats)
+            plan_stats.reconciled_at = now
+        InvestmentPlanStats.objects.bulk_update(
+            stats, COLUMNS + ["updated_at", "reconciled_at"]
+        )
+        transaction.on_commit(invalidate_stats, using=db)
+    return len(drifted)
@@ -0,0 +1,250 @@
+"""
+Server-side crypto prices for the CryptoWallet symbols.
+
+Prices come from a pluggable feed (CoinGecko by default, a JSON file for
+tests and local work) and are kept in the shared cache, so every page view
+reads one small cached snapshot instead of each browser calling the third
+party itself. Each symbol also keeps a fixed-size ring buffer of recent
+prices for the sparklines.
+
+Requests only ever read the snapshot, stale or not; the feed is never
+called on a request's thread. With a shared cache it's refreshed on a
+schedule by the scheduler's refresh_prices job or `manage.py refresh_prices
+--loop`. Without one (a per-process cache nothing else fills) the price
+endpoint finding it stale starts a refresh on a background thread instead,
+and carries on with the stale snapshot. A lock lets one refresh per TTL
+start; when the feed fails the lock is left to expire, so a dead feed is
+retried at most once per TTL. The warm-up fills an empty snapshot at start.
+
+Settings:
+    PRICE_FEED                dotted path of the feed class
+    PRICE_FEED_OPTIONS        keyword arguments for the feed
+    PRICE_TTL                 seconds a snapshot counts as fresh (default 60)
+    PRICE_HISTORY_SIZE        points kept per symbol (default 288)
+    PRICE_CACHE               cache alias (default "default")
+    PRICE_BACKGROUND_REFRESH  refresh stale snapshots off the request thread
+                              (default True; off when a scheduler does it)
+"""
+
+import json
+import logging
+import threading
+import time
+import urllib.parse
+import urllib.request
+from abc import ABC, abstractmethod
+from array import array
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+from .models import CryptoWallet
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_KEY = "prices:snapshot"
+HISTORY_KEY = "prices:history"
+LOCK_KEY = "prices:refreshing"
+DEFAULT_PRICE_FILE = Path(__file__).resolve().parent / "data" / "prices.json"
+
+SYMBOLS = [symbol for symbol, _ in CryptoWallet.WALLET_TYPES]
+NAMES = dict(CryptoWallet.WALLET_TYPES)
+
+COINGECKO_IDS = {
+    "BTC": "bitcoin",
+    "ETH": "ethereum",
+    "BNB": "binancecoin",
+    "USDT": "tether",
+    "LTC": "litecoin",
+    "ADA": "cardano",
+    "DOT": "polkadot",
+    "SOL": "solana",
+}
+
+
+class PriceFeed(ABC):
+    """Feeds return {symbol: {"price": float, "change_24h": float or None}}"""
+
+    @abstractmethod
+    def fetch(self, symbols):
+        pass
+
+
+class CoinGeckoFeed(PriceFeed):
+    url = "https://api.coingecko.com/api/v3/simple/price"
+
+    def __init__(self, timeout=5, api_key=None):
+        self.timeout = timeout
+        self.api_key = api_key
+
+    def fetch(self, symbols):
+        ids = {COINGECKO_IDS[s]: s for s in symbols if s in COINGECKO_IDS}
+        query = urllib.parse.urlencode(
+            {
+                "ids": ",".join(ids),
+                "vs_currencies": "usd",
+                "include_24hr_change": "true",
+            }
+        )
+        req = urllib.request.Request(f"{self.url}?{query}")
+        req.add_header("Accept", "application/json")
+        if self.api_key:
+            req.add_header("x-cg-demo-api-key", self.api_key)
+        with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+            data = json.loads(resp.read().decode("utf-8"))
+        return {
+            ids[coin]: {
+                "price": values["usd"],
+                "change_24h": values.get("usd_24h_change"),
+            }
+            for coin, values in data.items()
+            if coin in ids and "usd" in values
+        }
+
+
+class FileFeed(PriceFeed):
+    """Reads prices from a JSON file: {"BTC": 64000.5} or {"BTC": {"price": ...}}"""
+
+    def __init__(self, path=None):
+        self.path = Path(path or DEFAULT_PRICE_FILE)
+
+    def fetch(self, symbols):
+        data = json.loads(self.path.read_text(encoding="utf-8"))
+        prices = {}
+        for symbol in symbols:
+            value = data.get(symbol)
+            if value is None:
+                continue
+            if not isinstance(value, dict):
+                value = {"price": value}
+            prices[symbol] = {
+                "price": float(value["price"]),
+                "change_24h": value.get("change_24h"),
+            }
+        return prices
+
+
+class PriceHistory:
+    """Fixed-size ring buffer of (timestamp, price) pairs packed into arrays"""
+
+    def __init__(self, size):
+        self.size = size
+        self.times = array("d", [0.0] * size)
+        self.prices = array("d", [0.0] * size)
+        self.start = 0
+        self.count = 0
+
+    def append(self, timestamp, price):
+        index = (self.start + self.count) % self.size
+        self.times[index] = timestamp
+        self.prices[index] = price
+        if self.count < self.size:
+            self.count += 1
+        else:
+            self.start = (self.start + 1) % self.size
+
+    def points(self):
+        for i in range(self.count):
+            index = (self.start + i) % self.size
+            yield self.times[index], self.prices[index]
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def get_cache():
+    return caches[_setting("PRICE_CACHE", "default")]
+
+
+def get_feed():
+    feed = _setting("PRICE_FEED", "hotmine.prices.CoinGeckoFeed")
+    return import_string(feed)(**_setting("PRICE_FEED_OPTIONS", {}))
+
+
+def refresh(feed=None):
+    """Fetch every symbol from the feed and store a new snapshot; returns it"""
+    cache = get_cache()
+    feed = feed or get_feed()
+    prices = feed.fetch(SYMBOLS)
+    now = time.time()
+
+    size = _setting("PRICE_HISTORY_SIZE", 288)
+    history = cache.get(HISTORY_KEY) or {}
+    for symbol, quote in prices.items():
+        ring = history.get(symbol)
+        if ring is None or ring.size != size:
+            ring = history[symbol] = PriceHistory(size)
+        ring.append(now, quote["price"])
+
+    snapshot = {"updated": now, "prices": prices}
+    # Kept without expiry: a stale snapshot beats no prices when the feed is down
+    cache.set_many({SNAPSHOT_KEY: snapshot, HISTORY_KEY: history}, None)
+    return snapshot
+
+
+def _stale(snapshot):
+    ttl = _setting("PRICE_TTL", 60)
+    return not snapshot or time.time() - snapshot["updated"] >= ttl
+
+
+def _lock():
+    return get_cache().add(LOCK_KEY, 1, timeout=_setting("PRICE_TTL", 60))
+
+
+def _refresh_locked():
+    try:
+        refresh()
+    except Exception:
+        logger.exception("Price feed refresh failed")
+        return
+    get_cache().delete(LOCK_KEY)
+
+
+def refresh_if_stale():
+    """Refresh a stale or missing snapshot, on this thread; returns the snapshot"""
+    if _stale(get_cache().get(SNAPSHOT_KEY)) and _lock():
+        _refresh_locked()
+    return get_cache().get(SNAPSHOT_KEY)
+
+
+def get_snapshot(refresh_stale=True):
+    """
+    The latest snapshot, or None if prices have never been fetched. With
+    refresh_stale, a stale one is refreshed in the background for later
+    requests.
+    """
+    snapshot = get_cache().get(SNAPSHOT_KEY)
+    if (
+        refresh_stale
+        and _stale(snapshot)
+        and _setting("PRICE_BACKGROUND_REFRESH", True)
+        and _lock()
+    ):
+        threading.Thread(
+            target=_refresh_locked, name="hotmine-price-refresh", daemon=True
+        ).start()
+    return snapshot
+
+
+def get_history(symbols, points=None):
+    """{symbol: [[timestamp, price], ...]} oldest first"""
+    history = get_cache().get(HISTORY_KEY) or {}
+    series = {}
+    for symbol in symbols:
+        ring = history.get(symbol)
+        if ring is None:
+            continue
+        data = [[int(t), p] for t, p in ring.points()]
+        series[symbol] = data[-points:] if points else data
+    return series
+
+
+def parse_symbols(value):
+    """Validated symbols from a comma separated query value; all when empty"""
+    if not value:
+        return list(SYMBOLS)
+    wanted = {s.strip().upper() for s in value.split(",")}
+    return [s for s in SYMBOLS if s in wanted]
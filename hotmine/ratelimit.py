@@ -0,0 +1,253 @@
+"""
+Rate limiting for credential endpoints (login, password reset).
+
+Attempts are counted per client IP and per account with a sliding window
+kept in a shared Django cache, so a burst of bad logins is rejected before
+the form ever reaches authenticate() and its PBKDF2 hash. If the cache is
+unreachable the limiter degrades to an in-process window instead of failing
+open.
+
+Settings:
+    RATELIMIT_ENABLED       turn limiting off entirely (default True)
+    RATELIMIT_BACKEND       dotted path of the limiter class
+    RATELIMIT_CACHE         cache alias holding the counters (default "default")
+    RATELIMIT_RULES         {scope: [(key, limit, window_seconds), ...]}
+    RATELIMIT_TRUSTED_PROXIES  proxies in front of the app that append to
+                               X-Forwarded-For (default 0: use REMOTE_ADDR)
+"""
+
+import hashlib
+import logging
+import threading
+import time
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RULES = {
+    "login": [("ip", 30, 60), ("account", 10, 300)],
+    "password_reset": [("ip", 10, 300), ("account", 5, 900)],
+}
+
+METRICS_PREFIX = "rl:metrics:"
+METRIC_NAMES = ("checked", "allowed", "rejected", "backend_errors")
+
+
+@dataclass
+class Decision:
+    allowed: bool
+    scope: str
+    key: str = ""
+    retry_after: int = 0
+
+
+class LocalWindow:
+    """Thread-safe in-process sliding window, used as the fallback store"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {}
+
+    def incr(self, bucket, window):
+        now = time.monotonic()
+        with self._lock:
+            # Drop expired buckets opportunistically so memory stays bounded
+            if len(self._counts) > 10000:
+                self._counts = {
+                    k: v for k, v in self._counts.items() if v[1] > now
+                }
+            count, expires = self._counts.get(bucket, (0, now + window * 2))
+            if expires <= now:
+                count, expires = 0, now + window * 2
+            self._counts[bucket] = (count + 1, expires)
+            return count + 1
+
+    def get(self, bucket):
+        with self._lock:
+            entry = self._counts.get(bucket)
+        if entry is None or entry[1] <= time.monotonic():
+            return 0
+        return entry[0]
+
+    def delete(self, bucket):
+        with self._lock:
+            self._counts.pop(bucket, None)
+
+
+class SlidingWindowLimiter:
+    """
+    Approximate sliding window: the current fixed window's count plus the
+    previous window's count weighted by how much of it still overlaps.
+    Two counters per key, one atomic incr per check.
+    """
+
+    def __init__(self, cache_alias="default"):
+        self.cache_alias = cache_alias
+        self.local = LocalWindow()
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def _incr(self, bucket, window):
+        try:
+            cache = self.cache
+            cache.add(bucket, 0, timeout=window * 2)
+            return cache.incr(bucket)
+        except Exception:
+            record_metric("backend_errors")
+            return self.local.incr(bucket, window)
+
+    def _get(self, bucket):
+        try:
+            return self.cache.get(bucket, 0)
+        except Exception:
+            return self.local.get(bucket)
+
+    def hit(self, ident, limit, window):
+        """Count one attempt; return seconds to wait if over the limit, else 0"""
+        now = time.time()
+        current = int(now // window)
+        elapsed = now - current * window
+        count = self._incr(f"rl:{ident}:{current}", window)
+        previous = self._get(f"rl:{ident}:{current - 1}")
+        weighted = previous * (window - elapsed) / window + count
+        if weighted > limit:
+            return max(1, int(window - elapsed))
+        return 0
+
+    def reset(self, ident, window):
+        current = int(time.time() // window)
+        buckets = [f"rl:{ident}:{current}", f"rl:{ident}:{current - 1}"]
+        try:
+            self.cache.delete_many(buckets)
+        except Exception:
+            pass
+        for bucket in buckets:
+            self.local.delete(bucket)
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_limiter():
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                backend = getattr(
+                    settings,
+                    "RATELIMIT_BACKEND",
+                    "hotmine.ratelimit.SlidingWindowLimiter",
+                )
+                _limiter = import_string(backend)(
+                    cache_alias=getattr(settings, "RATELIMIT_CACHE", "default")
+                )
+    return _limiter
+
+
+def get_rules(scope):
+    rules = getattr(settings, "RATELIMIT_RULES", DEFAULT_RULES)
+    return rules.get(scope, [])
+
+
+def client_ip(request):
+    """
+    The address the request came from. Each trusted proxy appends the
+    address it was connected from to X-Forwarded-For, so the client is
+    that many entries from the right; entries further left were sent by
+    the client and can be anything, a fresh bucket per attempt.
+    """
+    proxies = getattr(settings, "RATELIMIT_TRUSTED_PROXIES", 0)
+    if proxies:
+        forwarded = [
+            address.strip()
+            for address in request.META.get("HTTP_X_FORWARDED_FOR", "").split(",")
+            if address.strip()
+        ]
+        if len(forwarded) >= proxies:
+            return forwarded[-proxies]
+    return request.META.get("REMOTE_ADDR", "")
+
+
+def _ident(scope, key, value):
+    digest = hashlib.sha1(value.encode("utf-8")).hexdigest()[:20]
+    return f"{scope}:{key}:{digest}"
+
+
+def _identities(request, scope, account):
+    values = {"ip": client_ip(request)}
+    if account:
+        values["account"] = account.strip().lower()
+    for key, limit, window in get_rules(scope):
+        value = values.get(key)
+        if value:
+            yield key, _ident(scope, key, value), limit, window
+
+
+def check(request, scope, account=None):
+    """Count an attempt against every rule for scope and decide if it may proceed"""
+    if not getattr(settings, "RATELIMIT_ENABLED", True):
+        return Decision(allowed=True, scope=scope)
+
+    limiter = get_limiter()
+    record_metric("checked")
+    for key, ident, limit, window in _identities(request, scope, account):
+        retry_after = limiter.hit(ident, limit, window)
+        if retry_after:
+            record_metric("rejected")
+            record_metric(f"rejected:{scope}:{key}")
+            logger.warning(
+                "Rate limit hit for %s by %s (retry in %ss)", scope, key, retry_after
+            )
+            return Decision(
+                allowed=False, scope=scope, key=key, retry_after=retry_after
+            )
+    record_metric("allowed")
+    return Decision(allowed=True, scope=scope)
+
+
+def reset(request, scope, account=None):
+    """Clear the account counters after a successful attempt"""
+    limiter = get_limiter()
+    for key, ident, limit, window in _identities(request, scope, account):
+        if key == "account":
+            limiter.reset(ident, window)
+
+
+# Metrics are kept both per process and in the limiter cache, so a shared
+# cache (Redis) gives fleet-wide totals and locmem still gives per-worker ones.
+_local_metrics = {}
+_metrics_lock = threading.Lock()
+
+
+def record_metric(name):
+    with _metrics_lock:
+        _local_metrics[name] = _local_metrics.get(name, 0) + 1
+    try:
+        cache = caches[getattr(settings, "RATELIMIT_CACHE", "default")]
+        cache.add(METRICS_PREFIX + name, 0, timeout=None)
+        cache.incr(METRICS_PREFIX + name)
+    except Exception:
+        pass
+
+
+def get_metrics():
+    """Counters from the shared cache, falling back to this process's own"""
+    names = list(METRIC_NAMES)
+    for scope, rules in getattr(settings, "RATELIMIT_RULES", DEFAULT_RULES).items():
+        names.extend(f"rejected:{scope}:{key}" for key, _, _ in rules)
+    try:
+        cache = caches[getattr(settings, "RATELIMIT_CACHE", "default")]
+        stored = cache.get_many([METRICS_PREFIX + name for name in names])
+        shared = {name: stored.get(METRICS_PREFIX + name, 0) for name in names}
+    except Exception:
+        shared = {}
+    with _metrics_lock:
+        local = dict(_local_metrics)
+    return {name: shared.get(name) or local.get(name, 0) for name in names}
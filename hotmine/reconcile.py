@@ -0,0 +1,238 @@
+"""
+Reconciliation of balance rows against the records they summarise.
+
+Admins edit the balance rows by hand, so they can drift from what they
+should hold:
+
+    earnings     Totalearnings: total_earnings summed over the user's
+                 investments, archived ones included
+    withdrawals  totalwithdraw: amounts of the user's completed
+                 withdrawals, archived ones included
+
+Only each user's first row counts, as on the pages. Users are split into
+chunks of RECONCILE_CHUNK_SIZE consecutive ids, and each chunk is checked
+with a few grouped aggregates over an id range, so no query grows with the
+number of users. Chunks run across a pool of RECONCILE_WORKERS processes,
+reading from a replica when one is usable. Amounts are compared in cents
+(hotmine/money.py).
+
+fix() rewrites mismatched rows on the primary. It locks them, recomputes
+the totals there (a replica can be behind) and writes them in bulk, moving
+updated_at so the next portfolio snapshot picks the change up.
+
+Run by `manage.py reconcile_balances`.
+
+Settings:
+    RECONCILE_CHUNK_SIZE   users per chunk (default 5000)
+    RECONCILE_WORKERS      worker processes (default: the CPU count)
+"""
+
+import csv
+import logging
+import multiprocessing
+import os
+from collections import defaultdict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from itertools import repeat
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connections, router, transaction
+from django.db.models import Min, Sum
+from django.utils import timezone
+
+from . import live
+from .money import Money
+from .models import (
+    ArchivedInvestment,
+    ArchivedWithdrawalRequest,
+    Investment,
+    Totalearnings,
+    WithdrawalRequest,
+    totalwithdraw,
+)
+from .routers import replica
+
+logger = logging.getLogger(__name__)
+
+# kind: (balance model, column, [(source model, column, filters), ...])
+CHECKS = {
+    "earnings": (
+        Totalearnings,
+        "total_earnings",
+        [
+            (Investment, "total_earnings", {}),
+            (ArchivedInvestment, "total_earnings", {}),
+        ],
+    ),
+    "withdrawals": (
+        totalwithdraw,
+        "total_withdraw",
+        [
+            (WithdrawalRequest, "amount", {"status": "completed"}),
+            (ArchivedWithdrawalRequest, "amount", {"status": "completed"}),
+        ],
+    ),
+}
+
+# Amounts in cents; stored is None when the user has no balance row
+Mismatch = namedtuple("Mismatch", "user_id kind stored expected")
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _cents(value):
+    return Money.parse(value or 0).cents
+
+
+def expected_totals(kind, users):
+    """{user_id: cents} the balance should hold, for users matching `users`"""
+    totals = defaultdict(int)
+    for model, column, filters in CHECKS[kind][2]:
+        rows = (
+            model.objects.filter(**users, **filters)
+            .values("user_id")
+            .annotate(total=Sum(column))
+            .values_list("user_id", "total")
+            .order_by()
+        )
+        for user_id, total in rows:
+            totals[user_id] += _cents(total)
+    return totals
+
+
+def first_rows(kind, users):
+    """The balance rows that count, for users matching `users`"""
+    model, _, _ = CHECKS[kind]
+    first = (
+        model.objects.filter(**users)
+        .values("user_id")
+        .annotate(first=Min("pk"))
+        .values("first")
+    )
+    return model.objects.filter(pk__in=first)
+
+
+def check(kind, users):
+    """Mismatches of one kind for users matching `users`"""
+    _, column, _ = CHECKS[kind]
+    expected = expected_totals(kind, users)
+    stored = {
+        user_id: _cents(value)
+        for user_id, value in first_rows(kind, users).values_list("user_id", column)
+    }
+    return [
+        Mismatch(user_id, kind, stored.get(user_id), expected.get(user_id, 0))
+        for user_id in sorted(expected.keys() | stored.keys())
+        if stored.get(user_id, 0) != expected.get(user_id, 0)
+    ]
+
+
+def check_chunk(bounds, kinds, use_replica=True):
+    """Mismatches for users with first <= id < last (last None: no end)"""
+    first, last = bounds
+    users = {"user_id__gte": first}
+    if last is not None:
+        users["user_id__lt"] = last
+    with replica() if use_replica else nullcontext():
+        return [mismatch for kind in kinds for mismatch in check(kind, users)]
+
+
+def chunks(chunk_size=None, use_replica=True):
+    """[(first id, next chunk's first id), ...] covering every user"""
+    chunk_size = chunk_size or _setting("RECONCILE_CHUNK_SIZE", 5000)
+    with replica() if use_replica else nullcontext():
+        ids = User.objects.order_by("pk").values_list("pk", flat=True)
+        starts = [pk for n, pk in enumerate(ids.iterator(10000)) if n % chunk_size == 0]
+    return list(zip(starts, starts[1:] + [None]))
+
+
+def run(kinds=None, workers=None, chunk_size=None, use_replica=True):
+    """Yield every mismatch, chunk by chunk in user id order"""
+    kinds = list(kinds or CHECKS)
+    bounds = chunks(chunk_size, use_replica)
+    workers = workers or _setting("RECONCILE_WORKERS", None) or os.cpu_count() or 1
+    workers = min(workers, len(bounds))
+    if workers <= 1:
+        for chunk in bounds:
+            yield from check_chunk(chunk, kinds, use_replica)
+        return
+    # Spawn rather than fork, so no worker inherits an open connection.
+    # Workers start from a bare interpreter, so the initializer has to be
+    # importable before Django is set up: django.setup itself.
+    connections.close_all()
+    with ProcessPoolExecutor(
+        workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=django.setup,
+    ) as pool:
+        for mismatches in pool.map(
+            check_chunk, bounds, repeat(kinds), repeat(use_replica)
+        ):
+            yield from mismatches
+
+
+def write_report(mismatches, stream):
+    """CSV of mismatches; returns how many were written"""
+    writer = csv.writer(stream)
+    writer.writerow(["user_id", "kind", "stored", "expected", "difference"])
+    written = 0
+    for mismatch in mismatches:
+        stored = mismatch.stored or 0
+        writer.writerow(
+            [
+                mismatch.user_id,
+                mismatch.kind,
+                "" if mismatch.stored is None else Money(stored),
+                Money(mismatch.expected),
+                Money(mismatch.expected - stored),
+            ]
+        )
+        written += 1
+    return written
+
+
+def _fix_users(kind, user_ids, now):
+    model, column, _ = CHECKS[kind]
+    db = router.db_for_write(model)
+    with transaction.atomic(using=db):
+        rows = first_rows(kind, {"user_id__in": user_ids})
+        if connections[db].features.has_select_for_update:
+            rows = rows.select_for_update()
+        rows = {row.user_id: row for row in rows.only("pk", "user_id", column)}
+        expected = expected_totals(kind, {"user_id__in": user_ids})
+        changed = []
+        for user_id, row in rows.items():
+            amount = Money(expected.get(user_id, 0))
+            if _cents(getattr(row, column)) != amount.cents:
+                setattr(row, column, amount.to_decimal())
+                row.updated_at = now
+                changed.append(row)
+        model.objects.bulk_update(changed, [column, "updated_at"])
+        created = model.objects.bulk_create(
+            [
+                model(user_id=user_id, **{column: Money(cents).to_decimal()})
+                for user_id, cents in expected.items()
+                if user_id not in rows and cents
+            ]
+        )
+    live.notify_users([row.user_id for row in changed + created])
+    return len(changed) + len(created)
+
+
+def fix(mismatches, batch_size=500):
+    """Rewrite the balance rows behind `mismatches`; returns rows written"""
+    by_kind = defaultdict(list)
+    for mismatch in mismatches:
+        by_kind[mismatch.kind].append(mismatch.user_id)
+    now = timezone.now()
+    fixed = 0
+    for kind, user_ids in by_kind.items():
+        for start in range(0, len(user_ids), batch_size):
+            fixed += _fix_users(kind, user_ids[start : start + batch_size], now)
+    logger.info("Reconciliation fixed %s balance row(s)", fixed)
+    return fixed
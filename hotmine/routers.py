@@ -0,0 +1,256 @@
+"""
+Read replica routing.
+
+Replica aliases are listed in REPLICA_DATABASES. Reads only go to a replica
+inside a replica() block (or a view wrapped in use_replica), which the
+read-only pages, the account API, admin changelists and reporting commands
+use. Everything else, and every write, stays on the primary.
+
+Reads are pinned to the primary when:
+
+    the request isn't GET/HEAD, or already wrote something
+    the browser wrote within the last REPLICA_PIN_SECONDS (a cookie set by
+    ReplicaPinMiddleware), so people see their own changes right away
+    no replica is within REPLICA_MAX_LAG seconds of the primary
+
+Replica lag is checked at most every REPLICA_CHECK_INTERVAL seconds per
+process. On Postgres it comes from the WAL replay position. For the local
+two-SQLite setup (SQLITE_REPLICA=True) it is the age of the replica file,
+which `manage.py sync_replica` copies from the primary.
+
+Settings:
+    REPLICA_DATABASES       aliases in DATABASES that are replicas
+    REPLICA_MAX_LAG         seconds of lag before falling back (default 10)
+    REPLICA_CHECK_INTERVAL  seconds between lag checks (default 5)
+    REPLICA_PIN_SECONDS     read-your-writes window after a write (default 15)
+"""
+
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+logger = logging.getLogger(__name__)
+
+PIN_COOKIE = "hotmine_primary"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+# Time since the last replayed transaction, or 0 when the replica has
+# replayed everything it received (an idle primary isn't lag)
+POSTGRES_LAG_SQL = """
+    SELECT CASE
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+"""
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def get_replicas():
+    return [
+        alias
+        for alias in _setting("REPLICA_DATABASES", [])
+        if alias in settings.DATABASES
+    ]
+
+
+class Route:
+    """Routing state for one request or replica() block; shared by reference
+    so writes seen in a sync_to_async thread pin the whole request"""
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.replica = False
+        self.wrote = False
+
+
+_route = ContextVar("hotmine_db_route", default=None)
+
+
+# -- Lag ----------------------------------------------------------------------
+
+
+def replica_lag(alias):
+    """Seconds the replica is behind the primary"""
+    connection = connections[alias]
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute(POSTGRES_LAG_SQL)
+            lag = cursor.fetchone()[0]
+        return float(lag or 0)
+    if connection.vendor == "sqlite":
+        synced = os.path.getmtime(connection.settings_dict["NAME"])
+        return max(0.0, time.time() - synced)
+    return 0.0
+
+
+class ReplicaHealth:
+    """Per-process cache of which replicas are usable"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._checked = {}
+
+    def is_usable(self, alias):
+        now = time.monotonic()
+        with self._lock:
+            checked = self._checked.get(alias)
+            if checked and now - checked[0] < _setting("REPLICA_CHECK_INTERVAL", 5):
+                return checked[1]
+        try:
+            usable = replica_lag(alias) <= _setting("REPLICA_MAX_LAG", 10)
+        except Exception as e:
+            logger.warning("Replica %s lag check failed: %s", alias, e)
+            usable = False
+        with self._lock:
+            self._checked[alias] = (now, usable)
+        return usable
+
+
+health = ReplicaHealth()
+
+
+def pick_replica():
+    """A usable replica alias, or None to read from the primary"""
+    usable = [alias for alias in get_replicas() if health.is_usable(alias)]
+    return random.choice(usable) if usable else None
+
+
+# -- Scoping ------------------------------------------------------------------
+
+
+@contextmanager
+def replica():
+    """Let reads in this block go to a replica when it's safe"""
+    route = _route.get()
+    token = None
+    if route is None:
+        route = Route()
+        token = _route.set(route)
+    previous = route.replica
+    route.replica = True
+    try:
+        yield route
+    finally:
+        route.replica = previous
+        if token is not None:
+            _route.reset(token)
+
+
+def current_route():
+    """The routing state in effect here, to carry into code that runs later"""
+    return _route.get()
+
+
+@contextmanager
+def route_as(route):
+    """
+    Route this block as `route`, e.g. a streamed response's rows, which are
+    read after the view returned and the middleware reset its route
+    """
+    token = _route.set(route)
+    try:
+        yield route
+    finally:
+        _route.reset(token)
+
+
+def use_replica(view_func):
+    """Run a read-only view (sync or async) inside replica()"""
+    if iscoroutinefunction(view_func):
+
+        @wraps(view_func)
+        async def async_wrapped(request, *args, **kwargs):
+            with replica():
+                return await view_func(request, *args, **kwargs)
+
+        return async_wrapped
+
+    @wraps(view_func)
+    def wrapped(request, *args, **kwargs):
+        with replica():
+            return view_func(request, *args, **kwargs)
+
+    return wrapped
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        route = _route.get()
+        if route is None or not route.replica or route.pinned:
+            return None
+        return pick_replica()
+
+    def db_for_write(self, model, **hints):
+        route = _route.get()
+        if route is not None:
+            route.pinned = route.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db not in get_replicas()
+
+
+class ReplicaPinMiddleware:
+    """
+    Scope routing to the request: unsafe methods and browsers that wrote
+    recently read from the primary, and a write sets the pin cookie.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _start(self, request):
+        pinned = request.method not in SAFE_METHODS or PIN_COOKIE in request.COOKIES
+        route = Route(pinned=pinned)
+        return route, _route.set(route)
+
+    def _pin(self, request, response, route):
+        if route.wrote and get_replicas():
+            response.set_cookie(
+                PIN_COOKIE,
+                "1",
+                max_age=_setting("REPLICA_PIN_SECONDS", 15),
+                secure=request.is_secure(),
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        route, token = self._start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _route.reset(token)
+        return self._pin(request, response, route)
+
+    async def __acall__(self, request):
+        route, token = self._start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _route.reset(token)
+        return self._pin(request, response, route)
@@ -0,0 +1,295 @@
+"""
+In-process periodic jobs, with a database lease per job.
+
+There's no cron on the free plan and no separate worker, so the jobs run
+inside the web workers: gunicorn.conf.py starts a scheduler thread in every
+worker when SCHEDULER_EMBEDDED is on, and `manage.py run_scheduler` runs
+the same loop on its own wherever that's possible. However many are
+running, each due job runs in exactly one of them, because a run starts by
+taking the job's JobLease row with a single conditional UPDATE (due, and
+not leased or the lease expired); whoever's UPDATE matched the row runs it,
+everyone else moves on. A holder that dies releases the job when
+SCHEDULER_LEASE_SECONDS run out.
+
+The next run is scheduled from the start of this one plus the interval and
+a random jitter (up to a tenth of the interval, at most a minute), so jobs
+of the same interval don't all hit the database together. When nothing was
+running at the due time (the free plan sleeps when idle), the first
+scheduler up runs the job once to catch up and counts the runs it skipped
+as missed; the jobs all do "everything outstanding" per run, so one run
+covers the gap.
+
+Each run records its duration, status and error on the row (last, max and
+total durations, runs, failures) for the admin's scheduled jobs page and
+`manage.py run_scheduler --list`.
+
+Settings:
+    SCHEDULER_EMBEDDED       start a scheduler in each gunicorn worker (default False)
+    SCHEDULER_JOBS           {job name: seconds between runs}, 0 turns a job off
+    SCHEDULER_LEASE_SECONDS  how long a run may hold its job (default 900)
+    SCHEDULER_TICK           longest sleep between checks, seconds (default 15)
+"""
+
+import logging
+import os
+import random
+import socket
+import threading
+import time
+from datetime import timedelta
+from importlib import import_module
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import F, Q, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import JobLease
+
+logger = logging.getLogger(__name__)
+
+# This process, as recorded on the leases it holds
+OWNER = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class Job:
+    def __init__(self, name, function, every):
+        self.name = name
+        self.function = function
+        self.default_every = every
+
+    @property
+    def every(self):
+        """Seconds between runs, 0 when turned off"""
+        return _setting("SCHEDULER_JOBS", {}).get(self.name, self.default_every)
+
+    @property
+    def jitter(self):
+        return min(self.every / 10, 60)
+
+    def next_run(self, started):
+        return started + timedelta(seconds=self.every + random.uniform(0, self.jitter))
+
+
+JOBS = {}
+
+
+def job(name, every):
+    """Register a function as a scheduled job, every `every` seconds by default"""
+
+    def register(function):
+        JOBS[name] = Job(name, function, every)
+        return function
+
+    return register
+
+
+# -- Jobs ---------------------------------------------------------------------
+
+
+@job("settle", every=300)
+def settle():
+    from . import settlement
+
+    return settlement.run()
+
+
+@job("dispatch_outbox", every=30)
+def dispatch_outbox():
+    from . import outbox
+
+    sent = 0
+    while True:
+        counts = outbox.dispatch()
+        sent += counts["sent"]
+        if not counts["sent"]:
+            break
+    return {"sent": sent, "purged": outbox.purge()}
+
+
+@job("clear_sessions", every=86400)
+def clear_sessions():
+    engine = import_module(settings.SESSION_ENGINE)
+    engine.SessionStore.clear_expired()
+
+
+@job("archive_history", every=86400)
+def archive_history():
+    from . import archive
+
+    return {name: archive.archive(name) for name in archive.ARCHIVES}
+
+
+@job("reconcile_plan_stats", every=3600)
+def reconcile_plan_stats():
+    from . import planstats
+
+    return {"corrected": planstats.reconcile()}
+
+
+@job("refresh_prices", every=0)
+def refresh_prices():
+    # Off unless configured: only useful with a shared cache
+    from . import prices
+
+    prices.refresh()
+
+
+def enabled_jobs(names=None):
+    return [
+        job
+        for name, job in JOBS.items()
+        if job.every and (names is None or name in names)
+    ]
+
+
+# -- Leases -------------------------------------------------------------------
+
+
+def ensure_leases(jobs, now=None):
+    """Create missing lease rows, due within each job's jitter"""
+    now = now or timezone.now()
+    JobLease.objects.bulk_create(
+        [
+            JobLease(
+                name=job.name,
+                next_run_at=now + timedelta(seconds=random.uniform(0, job.jitter)),
+            )
+            for job in jobs
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def acquire(job, now, force=False):
+    """Take the job's lease; returns its row when this process should run it"""
+    free = Q(leased_until__isnull=True) | Q(leased_until__lt=now)
+    rows = JobLease.objects.filter(free, name=job.name)
+    if not force:
+        rows = rows.filter(next_run_at__lte=now)
+    lease = timedelta(seconds=_setting("SCHEDULER_LEASE_SECONDS", 900))
+    if not rows.update(owner=OWNER, leased_until=now + lease, last_started_at=now):
+        return None
+    return JobLease.objects.get(name=job.name)
+
+
+def release(job, lease, started, duration, error=None):
+    """Record the run and schedule the next one"""
+    missed = 0
+    if job.every and lease.next_run_at < started:
+        missed = int((started - lease.next_run_at).total_seconds() // job.every)
+    updated = JobLease.objects.filter(name=job.name, owner=OWNER).update(
+        owner="",
+        leased_until=None,
+        next_run_at=job.next_run(started),
+        last_finished_at=timezone.now(),
+        last_status="failed" if error else "ok",
+        last_error=error or "",
+        last_duration=duration,
+        max_duration=Greatest(F("max_duration"), Value(duration)),
+        total_duration=F("total_duration") + duration,
+        runs=F("runs") + 1,
+        failures=F("failures") + (1 if error else 0),
+        missed=F("missed") + missed,
+    )
+    if not updated:
+        logger.warning(
+            "Scheduler: %s ran past its lease and another instance took it", job.name
+        )
+
+
+def run_job(job, now=None, force=False):
+    """
+    Run one job if it's due and nobody else holds it; returns
+    (status, seconds), or None when it didn't run here
+    """
+    now = now or timezone.now()
+    lease = acquire(job, now, force)
+    if lease is None:
+        return None
+    started = time.perf_counter()
+    error = None
+    try:
+        result = job.function()
+    except Exception as e:
+        logger.exception("Scheduler: %s failed", job.name)
+        error = f"{type(e).__name__}: {e}"
+    duration = time.perf_counter() - started
+    if not error:
+        logger.info("Scheduler: %s finished in %.2fs: %s", job.name, duration, result)
+    release(job, lease, now, duration, error)
+    return ("failed" if error else "ok", duration)
+
+
+# -- Loop ---------------------------------------------------------------------
+
+
+class Scheduler:
+    def __init__(self, names=None):
+        self.jobs = enabled_jobs(names)
+        self.stopped = threading.Event()
+
+    def run_due(self):
+        """Run every due job this instance can lease; returns {name: (status, seconds)}"""
+        ran = {}
+        for job in self.jobs:
+            close_old_connections()
+            result = run_job(job)
+            if result:
+                ran[job.name] = result
+        close_old_connections()
+        return ran
+
+    def wait(self):
+        """Seconds until the next job is due, capped at SCHEDULER_TICK"""
+        tick = _setting("SCHEDULER_TICK", 15)
+        upcoming = (
+            JobLease.objects.filter(name__in=[job.name for job in self.jobs])
+            .order_by("next_run_at")
+            .values_list("next_run_at", flat=True)
+            .first()
+        )
+        if upcoming is None:
+            return tick
+        return min(max((upcoming - timezone.now()).total_seconds(), 1), tick)
+
+    def loop(self):
+        if not self.jobs:
+            return
+        ready = False
+        while not self.stopped.is_set():
+            try:
+                if not ready:
+                    ensure_leases(self.jobs)
+                    ready = True
+                self.run_due()
+                pause = self.wait()
+            except Exception:
+                # e.g. the database is down or not migrated yet
+                logger.exception("Scheduler: tick failed")
+                pause = _setting("SCHEDULER_TICK", 15)
+            finally:
+                close_old_connections()
+            self.stopped.wait(pause)
+
+    def stop(self):
+        self.stopped.set()
+
+
+_embedded = None
+
+
+def start():
+    """Start the scheduler on a daemon thread, once per process"""
+    global _embedded
+    if _embedded is None:
+        _embedded = Scheduler()
+        threading.Thread(
+            target=_embedded.loop, name="hotmine-scheduler", daemon=True
+        ).start()
+    return _embedded
@@ -0,0 +1,307 @@
+"""
+Earnings accrual and maturity settlement for investments.
+
+Every active investment earns daily_earnings_percentage of its amount per
+day. accrue() credits the days since last_accrued_on (or the day it was
+invested) up to today or its maturity day, whichever is first, to the
+investment's total_earnings and the user's Totalearnings. settle() then
+finds active investments whose matures_at has passed, with a range scan on
+(status, matures_at), marks them completed and, for plans with
+deposit_return, credits the amount back to the user's balance (Amount).
+
+Work is done in batches, one transaction each, with a handful of set-based
+statements per batch rather than a save() per row. Batches lock their rows
+with SKIP LOCKED on Postgres (SQLite has one writer at a time), so runs can
+overlap without crediting anything twice. Each batch moves last_accrued_on
+and status forward in the same transaction as its credits, so a re-run, or
+a run after a crash, only does what's left. The admin's "mark as completed"
+goes through complete(), so deposits come back the same way; it can also
+complete PENDING investments, which were never paid for, so those get no
+deposit back. Completions
+queue a notification in the outbox (hotmine/outbox.py) and move the plan
+counters (hotmine/planstats.py) in the same transaction.
+
+Run by `manage.py settle_investments`.
+
+Settings:
+    SETTLEMENT_BATCH_SIZE   investments per transaction (default 500)
+"""
+
+import logging
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Case, F, Min, Q, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import live, outbox, planstats, snapshots
+from .money import Money, percents, ratio
+from .models import Amount, Investment, InvestmentPlan, Totalearnings
+
+logger = logging.getLogger(__name__)
+
+SETTLE_FROM = ("ACTIVE",)
+# What the admin may complete by hand
+COMPLETE_FROM = ("PENDING", "ACTIVE")
+# Whose deposit comes back on completion: PENDING ones were never paid
+RETURN_FROM = ("ACTIVE",)
+
+
+def _batch_size(batch_size=None):
+    return batch_size or getattr(settings, "SETTLEMENT_BATCH_SIZE", 500)
+
+
+def _locked(queryset, db):
+    """Lock the rows a batch works on, skipping ones another run holds"""
+    if connections[db].features.has_select_for_update_skip_locked:
+        return queryset.select_for_update(skip_locked=True, of=("self",))
+    # SQLite: one writer at a time, and a run that read stale rows fails to
+    # write instead of applying them twice
+    return queryset
+
+
+def _credit(model, field, totals, now):
+    """Add {user_id: amount} to each user's first row of a balance model"""
+    totals = {user_id: total for user_id, total in totals.items() if total}
+    if not totals:
+        return
+    first_rows = dict(
+        model.objects.filter(user_id__in=totals)
+        .values("user_id")
+        .annotate(first=Min("pk"))
+        .values_list("user_id", "first")
+    )
+    if first_rows:
+        # The column's own type: Decimals for DecimalFields, cents for MoneyFields
+        money = model._meta.get_field(field)
+        model.objects.filter(pk__in=first_rows.values()).update(
+            **{
+                field: Coalesce(F(field), Value(0, output_field=money))
+                + Case(
+                    *(
+                        When(pk=pk, then=Value(totals[user_id], output_field=money))
+                        for user_id, pk in first_rows.items()
+                    ),
+                    output_field=money,
+                ),
+                "updated_at": now,
+            }
+        )
+    model.objects.bulk_create(
+        [
+            model(user_id=user_id, **{field: total})
+            for user_id, total in totals.items()
+            if user_id not in first_rows
+        ]
+    )
+    live.notify_users(totals)
+
+
+def fill_maturity():
+    """Set matures_at where it's missing (older rows, plans set later)"""
+    filled = 0
+    missing = Investment.objects.filter(
+        matures_at__isnull=True, investment_plan__isnull=False
+    ).exclude(status__in=["COMPLETED", "CANCELLED"])
+    plans = InvestmentPlan.objects.filter(
+        pk__in=missing.values("investment_plan")
+    ).values_list("pk", "investment_duration_days")
+    for plan_id, days in plans:
+        filled += missing.filter(investment_plan_id=plan_id).update(
+            matures_at=F("date_invested") + timedelta(days=days)
+        )
+    return filled
+
+
+def _accrual_rows(queryset, today):
+    """(investment, days to credit, through) for each row that earned something"""
+    for investment in queryset:
+        through = today
+        if investment.matures_at:
+            through = min(through, investment.matures_at.date())
+        start = investment.last_accrued_on or investment.date_invested.date()
+        days = (through - start).days
+        if days > 0:
+            yield investment, days, through
+
+
+def _accrue_batch(queryset, today, now):
+    """Credit earned days for the given active investments; returns rows credited"""
+    rows = list(_accrual_rows(queryset, today))
+    if not rows:
+        return 0
+    # In cents (hotmine/money.py): one rounding per investment, int sums
+    rates, cents, numerators, denominators = {}, [], [], []
+    for investment, days, _ in rows:
+        plan_id = investment.investment_plan_id
+        if plan_id not in rates:
+            rates[plan_id] = ratio(investment.investment_plan.daily_earnings_percentage)
+        numerator, denominator = rates[plan_id]
+        cents.append(Money.parse(investment.amount or 0).cents)
+        numerators.append(numerator * days)
+        denominators.append(denominator)
+    earned_cents = percents(cents, numerators, denominators)
+    earnings = defaultdict(int)
+    for (investment, _, through), earned in zip(rows, earned_cents):
+        total = Money.parse(investment.total_earnings or 0) + Money(earned)
+        investment.total_earnings = total.to_decimal()
+        investment.last_accrued_on = through
+        if investment.user_id:
+            earnings[investment.user_id] += earned
+    credited = [investment for investment, _, _ in rows]
+    Investment.objects.bulk_update(credited, ["total_earnings", "last_accrued_on"])
+    _credit(
+        Totalearnings,
+        "total_earnings",
+        {user_id: Money(total) for user_id, total in earnings.items()},
+        now,
+    )
+    return len(credited)
+
+
+def _active_for_accrual(today):
+    return (
+        Investment.objects.filter(status="ACTIVE", investment_plan__isnull=False)
+        .filter(Q(last_accrued_on__lt=today) | Q(last_accrued_on__isnull=True))
+        .select_related("investment_plan")
+        .only(
+            "pk",
+            "user_id",
+            "amount",
+            "total_earnings",
+            "date_invested",
+            "matures_at",
+            "last_accrued_on",
+            "investment_plan__daily_earnings_percentage",
+        )
+    )
+
+
+def accrue(batch_size=None, today=None):
+    """Credit earnings for every active investment; returns rows credited"""
+    batch_size = _batch_size(batch_size)
+    today = today or timezone.now().date()
+    db = router.db_for_write(Investment)
+    credited = last = 0
+    while True:
+        with transaction.atomic(using=db):
+            batch = list(
+                _locked(_active_for_accrual(today), db)
+                .filter(pk__gt=last)
+                .order_by("pk")[:batch_size]
+            )
+            if not batch:
+                break
+            credited += _accrue_batch(batch, today, timezone.now())
+        last = batch[-1].pk
+    return credited
+
+
+def _complete_batch(queryset, statuses, now):
+    """
+    Mark investments completed and return the deposits of active ones;
+    returns how many were completed. The status guard on the update means
+    rows another run (or admin) already completed are neither completed nor
+    credited again.
+    """
+    candidates = list(queryset.filter(status__in=statuses).values_list("pk", flat=True))
+    if not candidates:
+        return 0
+    # Final accrual up to maturity, so completion doesn't lose days
+    _accrue_batch(
+        _active_for_accrual(now.date()).filter(pk__in=candidates), now.date(), now
+    )
+    completed = Investment.objects.filter(pk__in=candidates, status__in=statuses)
+    deposits = defaultdict(Decimal)
+    notices = []
+    counted = planstats.rows(completed)
+    for pk, user_id, amount, status, plan, deposit_return in completed.values_list(
+        "pk",
+        "user_id",
+        "amount",
+        "status",
+        "investment_plan__title",
+        "investment_plan__deposit_return",
+    ):
+        if deposit_return and user_id and status in RETURN_FROM:
+            deposits[user_id] += amount or 0
+        notices.append(
+            (
+                user_id,
+                "investment.completed",
+                outbox.investment_payload(pk, amount, plan),
+            )
+        )
+    count = completed.update(status="COMPLETED", date_completed=now)
+    planstats.record(
+        (row, row._replace(status="COMPLETED")) for row in counted.values()
+    )
+    _credit(Amount, "amount", deposits, now)
+    outbox.enqueue_many(notices)
+    return count
+
+
+def settle(batch_size=None, now=None):
+    """Complete every investment that has matured; returns how many"""
+    batch_size = _batch_size(batch_size)
+    db = router.db_for_write(Investment)
+    now = now or timezone.now()
+    settled = 0
+    while True:
+        with transaction.atomic(using=db):
+            due = _locked(
+                Investment.objects.filter(status__in=SETTLE_FROM, matures_at__lte=now)
+                .order_by("matures_at")
+                .values_list("pk", flat=True),
+                db,
+            )
+            ids = list(due[:batch_size])
+            if not ids:
+                break
+            count = _complete_batch(
+                Investment.objects.filter(pk__in=ids), SETTLE_FROM, now
+            )
+        settled += count
+        if len(ids) < batch_size:
+            break
+    return settled
+
+
+def complete(queryset, now=None):
+    """Complete chosen investments now, e.g. from the admin; returns how many"""
+    db = router.db_for_write(Investment)
+    with transaction.atomic(using=db):
+        ids = list(_locked(queryset.order_by("pk"), db).values_list("pk", flat=True))
+        return _complete_batch(
+            Investment.objects.filter(pk__in=ids), COMPLETE_FROM, now or timezone.now()
+        )
+
+
+def run(batch_size=None):
+    """
+    One full pass: fill missing maturities, accrue, settle, then record the
+    day's portfolio snapshots (hotmine/snapshots.py)
+    """
+    filled = fill_maturity()
+    accrued = accrue(batch_size)
+    settled = settle(batch_size)
+    snapshotted = snapshots.record()
+    snapshots.downsample()
+    logger.info(
+        "Settlement: %s maturity dates filled, %s investments accrued, "
+        "%s settled, %s snapshots written",
+        filled,
+        accrued,
+        settled,
+        snapshotted,
+    )
+    return {
+        "filled": filled,
+        "accrued": accrued,
+        "settled": settled,
+        "snapshots": snapshotted,
+    }
@@ -0,0 +1,189 @@
+"""
+Daily portfolio snapshots for balance and earnings charts.
+
+A PortfolioSnapshot row holds a user's numbers at the end of a day:
+
+    invested   principal in active investments
+    earned     Totalearnings
+    withdrawn  totalwithdraw
+    balance    Amount
+
+in integer cents (hotmine/money.py).
+
+record() runs after every settlement pass (hotmine/settlement.py). It only
+looks at users with active investments or whose balance rows changed since
+the previous pass, and only writes a row when something differs from that
+user's last snapshot, so the table grows with activity rather than with
+users x days. A chart carries each point forward until the next one.
+
+Rows older than SNAPSHOT_DAILY_DAYS are downsampled to the last snapshot of
+each month. series() reads a chart as one range query on the (user, day,
+...) index, which holds every column a chart needs.
+
+Settings:
+    SNAPSHOT_DAILY_DAYS   days kept at daily resolution (default 90)
+    SNAPSHOT_BATCH_SIZE   users per batch (default 500)
+"""
+
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db.models import Exists, Max, Min, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, TruncMonth
+from django.utils import timezone
+
+from .money import ZERO, Money
+from .models import (
+    Amount,
+    Investment,
+    PortfolioSnapshot,
+    Totalearnings,
+    totalwithdraw,
+)
+
+COLUMNS = ("invested", "earned", "withdrawn", "balance")
+# snapshot column: (model, column) of the user's first row, as the pages show
+BALANCES = {
+    "earned": (Totalearnings, "total_earnings"),
+    "withdrawn": (totalwithdraw, "total_withdraw"),
+    "balance": (Amount, "amount"),
+}
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _changed_users(since):
+    """Users whose numbers may have moved since the last record()"""
+    users = set(
+        Investment.objects.filter(status="ACTIVE", user__isnull=False).values_list(
+            "user_id", flat=True
+        )
+    )
+    if since is not None:
+        users.update(
+            Investment.objects.filter(
+                date_completed__gte=since, user__isnull=False
+            ).values_list("user_id", flat=True)
+        )
+    for model, _ in BALANCES.values():
+        rows = model.objects.filter(user__isnull=False)
+        if since is not None:
+            rows = rows.filter(updated_at__gte=since)
+        users.update(rows.values_list("user_id", flat=True))
+    return sorted(users)
+
+
+def _first_rows(model, column, user_ids):
+    first = (
+        model.objects.filter(user_id__in=user_ids)
+        .values("user_id")
+        .annotate(first=Min("pk"))
+        .values("first")
+    )
+    return dict(model.objects.filter(pk__in=first).values_list("user_id", column))
+
+
+def _current(user_ids):
+    """{user_id: {column: value}} for a batch of users, a query per column"""
+    numbers = {user_id: dict.fromkeys(COLUMNS, ZERO) for user_id in user_ids}
+    invested = (
+        Investment.objects.filter(user_id__in=user_ids, status="ACTIVE")
+        .values("user_id")
+        .annotate(total=Sum("amount"))
+        .values_list("user_id", "total")
+    )
+    for user_id, total in invested:
+        numbers[user_id]["invested"] = Money.parse(total or 0)
+    for name, (model, column) in BALANCES.items():
+        for user_id, value in _first_rows(model, column, user_ids).items():
+            numbers[user_id][name] = Money.parse(value or 0)
+    return numbers
+
+
+def _previous(user_ids, day):
+    """{user_id: (values...)} of each user's latest snapshot up to `day`"""
+    last_day = Subquery(
+        PortfolioSnapshot.objects.filter(user=OuterRef("user"), day__lte=day)
+        .order_by("-day")
+        .values("day")[:1]
+    )
+    return {
+        row[0]: row[1:]
+        for row in PortfolioSnapshot.objects.filter(
+            user_id__in=user_ids, day=last_day
+        ).values_list("user_id", *COLUMNS)
+    }
+
+
+def record(day=None, batch_size=None):
+    """Snapshot users whose numbers changed; returns how many rows were written"""
+    day = day or timezone.now().date()
+    batch_size = batch_size or _setting("SNAPSHOT_BATCH_SIZE", 500)
+    # Changes since the start of the last snapshot day; unchanged users are
+    # skipped below, so the overlap costs nothing but a comparison
+    latest = PortfolioSnapshot.objects.aggregate(latest=Max("day"))["latest"]
+    since = timezone.make_aware(datetime.combine(latest, time.min)) if latest else None
+    users = _changed_users(since)
+    written = 0
+    for start in range(0, len(users), batch_size):
+        batch = users[start : start + batch_size]
+        previous = _previous(batch, day)
+        snapshots = []
+        for user_id, numbers in _current(batch).items():
+            values = tuple(numbers[column] for column in COLUMNS)
+            if previous.get(user_id) == values:
+                continue
+            snapshots.append(PortfolioSnapshot(user_id=user_id, day=day, **numbers))
+        # Re-running on the same day updates that day's row
+        PortfolioSnapshot.objects.bulk_create(
+            snapshots,
+            update_conflicts=True,
+            unique_fields=["user", "day"],
+            update_fields=COLUMNS,
+        )
+        written += len(snapshots)
+    return written
+
+
+def downsample(today=None):
+    """Keep one snapshot per user and month past the daily window"""
+    today = today or timezone.now().date()
+    cutoff = today - timedelta(days=_setting("SNAPSHOT_DAILY_DAYS", 90))
+    later_in_month = (
+        PortfolioSnapshot.objects.filter(
+            user=OuterRef("user"), day__gt=OuterRef("day"), day__lt=cutoff
+        )
+        .annotate(month=TruncMonth("day"))
+        .filter(month=OuterRef("month"))
+    )
+    deleted, _ = (
+        PortfolioSnapshot.objects.filter(day__lt=cutoff)
+        .annotate(month=TruncMonth("day"))
+        .filter(Exists(later_in_month))
+        .delete()
+    )
+    return deleted
+
+
+def series(user, days=30, today=None):
+    """
+    [(day, invested, earned, withdrawn, balance), ...] covering the last
+    `days` days: the stored points, plus the one before the window that
+    the chart starts from.
+    """
+    today = today or timezone.now().date()
+    start = today - timedelta(days=days)
+    before = (
+        PortfolioSnapshot.objects.filter(user=user, day__lt=start)
+        .order_by("-day")
+        .values("day")[:1]
+    )
+    return list(
+        PortfolioSnapshot.objects.filter(
+            user=user, day__gte=Coalesce(Subquery(before), Value(start))
+        )
+        .order_by("day")
+        .values_list("day", *COLUMNS)
+    )
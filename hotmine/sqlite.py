@@ -0,0 +1,81 @@
+"""
+Tuned SQLite for single-node deployments.
+
+Without DATABASE_URL the app runs on db.sqlite3, and SQLite's defaults suit
+one process: a rollback journal, so readers and a committing writer block
+each other; an fsync on every commit; and deferred transactions, which only
+ask for the write lock at their first write. When another process holds it
+by then, SQLite can't wait without deadlocking and fails the transaction
+with "database is locked" at once, busy timeout or not. Under gunicorn's
+worker processes that shows up as lock errors and writers queuing on fsync.
+
+With SQLITE_TUNED on, every new SQLite connection gets these pragmas
+(through connection_created):
+
+    journal_mode=WAL     readers don't block the writer, or it them
+    synchronous=NORMAL   fsync at checkpoints rather than every commit; WAL
+                         keeps the file consistent, a power cut can lose
+                         the last few commits
+    mmap_size            read pages through a memory map
+    cache_size           page cache per connection (negative: KiB)
+    busy_timeout         milliseconds a writer waits for the lock
+
+and settings.py has the backend start transactions with BEGIN IMMEDIATE
+(its transaction_mode option), so an atomic block takes the write lock
+when it starts, waiting up to busy_timeout, instead of failing halfway.
+Connections outside atomic blocks (autocommit) just wait for the lock.
+
+WAL is recorded in the database file and adds -wal and -shm files next to
+it. `manage.py sync_replica` copies through the backup API, which reads
+both, and turns the copy back to a rollback journal.
+
+`manage.py benchmark_sqlite` compares the default and tuned profiles with
+concurrent writer processes.
+
+Settings:
+    SQLITE_TUNED     apply the profile (default False)
+    SQLITE_PRAGMAS   pragma values, merged over PRAGMAS
+"""
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -32 * 1024,
+    "busy_timeout": 10000,
+}
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def pragmas():
+    return {**PRAGMAS, **_setting("SQLITE_PRAGMAS", {})}
+
+
+def statements(values=None):
+    """The PRAGMA statements for a profile"""
+    return [f"PRAGMA {name} = {value}" for name, value in (values or pragmas()).items()]
+
+
+def apply(cursor, values=None):
+    for statement in statements(values):
+        cursor.execute(statement)
+
+
+@receiver(connection_created)
+def tune_connection(sender, connection, **kwargs):
+    if connection.vendor != "sqlite" or not _setting("SQLITE_TUNED", False):
+        return
+    values = pragmas()
+    if connection.alias in _setting("REPLICA_DATABASES", []):
+        # The local replicas are files sync_replica swaps out whole; they
+        # stay in rollback journal mode so no -wal file outlives its copy
+        values.pop("journal_mode", None)
+    with connection.cursor() as cursor:
+        apply(cursor, values)
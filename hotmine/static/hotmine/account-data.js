@@ -0,0 +1,86 @@
+// Fills every [data-api-field="section.field"] element on an account page
+// from one /api/v1/dashboard/ request, so the page HTML itself can be cached.
+// With live events on, an EventSource then keeps those numbers and any
+// [data-withdrawal-status] badges current without reloading.
+(function () {
+    const script = document.currentScript;
+    const targets = document.querySelectorAll("[data-api-field]");
+    const live = script.dataset.liveUrl && window.EventSource;
+
+    const formats = {
+        whole: function (value) {
+            return Math.round(parseFloat(value)).toString();
+        },
+    };
+
+    // Bootstrap badge colours used by the withdrawal page
+    const badgeClasses = {
+        completed: "bg-success",
+        rejected: "bg-danger",
+        processing: "bg-warning",
+    };
+
+    function fill(data) {
+        targets.forEach(function (el) {
+            const parts = el.dataset.apiField.split(".");
+            const section = data[parts[0]];
+            if (!section || section[parts[1]] === undefined) {
+                return;
+            }
+            const format = formats[el.dataset.apiFormat];
+            const value = section[parts[1]];
+            el.textContent = format ? format(value) : value;
+        });
+    }
+
+    function updateWithdrawal(withdrawal) {
+        const selector = '[data-withdrawal-status="' + withdrawal.id + '"]';
+        document.querySelectorAll(selector).forEach(function (el) {
+            el.textContent = withdrawal.status_display;
+            Array.from(el.classList).forEach(function (name) {
+                if (name.indexOf("status-") === 0 && name !== "status-badge") {
+                    el.classList.replace(name, "status-" + withdrawal.status);
+                }
+            });
+            if (el.classList.contains("badge")) {
+                el.classList.remove("bg-success", "bg-danger", "bg-warning", "bg-secondary");
+                el.classList.add(badgeClasses[withdrawal.status] || "bg-secondary");
+            }
+        });
+    }
+
+    if (targets.length && script.dataset.apiUrl && !live) {
+        const fields = new Set();
+        targets.forEach(function (el) {
+            fields.add(el.dataset.apiField);
+        });
+        fetch(script.dataset.apiUrl + "?fields=" + Array.from(fields).join(","), {
+            credentials: "same-origin",
+            headers: { Accept: "application/json" },
+        })
+            .then(function (response) {
+                if (response.status === 401) {
+                    window.location.href = "/login/";
+                    return null;
+                }
+                return response.ok ? response.json() : null;
+            })
+            .then(function (data) {
+                if (data) {
+                    fill(data);
+                }
+            })
+            .catch(function () { });
+    }
+
+    if (live) {
+        // The stream opens with a summary event, so it replaces the fetch
+        const source = new EventSource(script.dataset.liveUrl);
+        source.addEventListener("summary", function (event) {
+            fill({ summary: JSON.parse(event.data) });
+        });
+        source.addEventListener("withdrawal", function (event) {
+            updateWithdrawal(JSON.parse(event.data));
+        });
+    }
+})();
@@ -0,0 +1,88 @@
+// Keeps every {% price_ticker %} on the page current with one batched request
+// to our price endpoint. The browser revalidates with the ETag, so an
+// unchanged snapshot costs a 304.
+(function () {
+    const tickers = document.querySelectorAll("[data-price-ticker]");
+    if (!tickers.length) {
+        return;
+    }
+
+    const symbols = new Set();
+    let history = 0;
+    let refresh = 60;
+    tickers.forEach(function (ticker) {
+        ticker.dataset.symbols.split(",").forEach(function (symbol) {
+            symbols.add(symbol);
+        });
+        history = Math.max(history, parseInt(ticker.dataset.history, 10) || 0);
+        refresh = parseInt(ticker.dataset.refresh, 10) || refresh;
+    });
+
+    let url = tickers[0].dataset.url + "?symbols=" + Array.from(symbols).join(",");
+    if (history) {
+        url += "&history=" + history;
+    }
+
+    function formatPrice(price) {
+        const digits = price >= 1 ? 2 : 4;
+        return "$" + price.toLocaleString("en-US", {
+            minimumFractionDigits: digits,
+            maximumFractionDigits: digits,
+        });
+    }
+
+    function sparkline(series) {
+        if (!series || series.length < 2) {
+            return "";
+        }
+        const values = series.map(function (point) { return point[1]; });
+        const low = Math.min.apply(null, values);
+        const span = (Math.max.apply(null, values) - low) || 1;
+        const step = 100 / (values.length - 1);
+        return values.map(function (value, i) {
+            return (i * step).toFixed(1) + "," + (24 - (value - low) / span * 24).toFixed(1);
+        }).join(" ");
+    }
+
+    function render(data) {
+        document.querySelectorAll(".price-ticker .ticker-item").forEach(function (item) {
+            const symbol = item.dataset.symbol;
+            const quote = data.prices[symbol];
+            if (!quote) {
+                return;
+            }
+            item.querySelector(".ticker-price").textContent = formatPrice(quote.price);
+            const change = item.querySelector(".ticker-change");
+            if (quote.change_24h !== null && quote.change_24h !== undefined) {
+                const down = quote.change_24h < 0;
+                change.textContent = (down ? "" : "+") + quote.change_24h.toFixed(2) + "%";
+                change.classList.toggle("ticker-down", down);
+                change.classList.toggle("ticker-up", !down);
+            }
+            const line = item.querySelector(".ticker-spark polyline");
+            if (line && data.history) {
+                line.setAttribute("points", sparkline(data.history[symbol]));
+            }
+        });
+    }
+
+    function poll() {
+        if (document.hidden) {
+            return;
+        }
+        fetch(url, { credentials: "omit" })
+            .then(function (response) {
+                return response.ok ? response.json() : null;
+            })
+            .then(function (data) {
+                if (data) {
+                    render(data);
+                }
+            })
+            .catch(function () { });
+    }
+
+    poll();
+    setInterval(poll, refresh * 1000);
+    document.addEventListener("visibilitychange", poll);
+})();
@@ -0,0 +1,116 @@
+"""
+Streamed rendering for pages built around one long list of rows.
+
+The history pages render every investment or withdrawal a user ever made,
+so for heavy users the whole page used to sit in memory before the first
+byte went out. Here the page template is rendered once with a marker where
+its {{ rows }} go and split there: the head (layout, styles, the table
+header) is sent straight away, then the rows come from the queryset's
+iterator() a chunk at a time, each chunk rendered by the page's rows
+template, then the tail. Only one chunk of rows and its HTML are held at a
+time, however long the history is.
+
+The chunks are read and rendered on the request's thread-sensitive thread
+through sync_to_async, so under ASGI the event loop isn't blocked. By then
+the view has returned and the middleware has reset the request's routing,
+so each chunk re-enters it (hotmine/routers.py): the rows come from a
+replica unless the request is pinned to the primary. Wrap the view in
+gzip_page and each chunk is compressed as it goes out.
+
+With STREAM_HISTORY off the same templates render into one ordinary
+response, as before.
+
+Settings:
+    STREAM_HISTORY      stream the history pages (default True)
+    STREAM_CHUNK_SIZE   rows fetched and rendered per chunk (default 200)
+"""
+
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.middleware.csrf import get_token
+from django.shortcuts import render
+from django.template.loader import get_template, render_to_string
+from django.utils.safestring import mark_safe
+
+from .routers import current_route, replica, route_as
+
+# Stands in for {{ rows }} while the page around them is rendered
+MARKER = "<!-- hotmine:rows -->"
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+async def _stream(head, tail, template, rows, context, route, chunk_size):
+    objects = rows.iterator(chunk_size)
+
+    def render_next():
+        with route_as(route), replica():
+            chunk = list(islice(objects, chunk_size))
+            if not chunk:
+                return None
+            return template.render({**context, "rows": chunk})
+
+    yield head
+    try:
+        while (html := await sync_to_async(render_next)()) is not None:
+            yield html
+    finally:
+        # Free the cursor even when the client went away halfway
+        await sync_to_async(objects.close)()
+    yield tail
+
+
+def render_rows(
+    request, template_name, rows_template_name, rows, has_rows, context=None
+):
+    """
+    Render template_name with its {{ rows }} made from `rows` (a QuerySet or
+    ReadThrough) by rows_template_name, which loops over `rows`. has_rows
+    says whether there are any, for the page's empty state. The stream is
+    an async generator, which only ASGI sends as it goes (WSGI would
+    collect it whole first), so views call this through arender_rows().
+    """
+    template = get_template(rows_template_name)
+    # The rows template has no request, so hand it what its forms need
+    row_context = {"csrf_token": get_token(request)}
+    context = {**(context or {}), "has_rows": has_rows}
+    if not has_rows or not _setting("STREAM_HISTORY", True):
+        rows_html = template.render({**row_context, "rows": rows}) if has_rows else ""
+        return render(request, template_name, {**context, "rows": mark_safe(rows_html)})
+
+    page = render_to_string(
+        template_name, {**context, "rows": mark_safe(MARKER)}, request
+    )
+    head, tail = page.split(MARKER, 1)
+    response = StreamingHttpResponse(
+        _stream(
+            head,
+            tail,
+            template,
+            rows,
+            row_context,
+            current_route(),
+            _setting("STREAM_CHUNK_SIZE", 200),
+        ),
+        content_type="text/html; charset=utf-8",
+    )
+    # Stop nginx-style proxies from buffering the stream
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+async def arender_rows(request, template_name, rows_template_name, rows, context=None):
+    """render_rows() for async views"""
+    request.user = await request.auser()
+    has_rows = await sync_to_async(rows.exists)()
+    if has_rows and not _setting("STREAM_HISTORY", True):
+        # Rendered in one go here, so fetch them first
+        rows = await sync_to_async(list)(rows)
+    return render_rows(
+        request, template_name, rows_template_name, rows, has_rows, context
+    )
@@ -0,0 +1,27 @@
+from django import template
+from django.conf import settings
+from django.templatetags.static import static
+from django.urls import reverse
+from django.utils.html import format_html
+
+register = template.Library()
+
+
+@register.simple_tag
+def account_data_script(fetch=True):
+    """
+    account-data.js, pointed at the v1 API and, when live events are on, at
+    the event stream. fetch=False is for pages that already render their
+    numbers. The output is the same for every user, so it is safe in cached
+    page shells.
+    """
+    api_url = reverse("api_v1_dashboard") if fetch else ""
+    live_url = ""
+    if getattr(settings, "LIVE_EVENTS", False):
+        live_url = reverse("live_events")
+    return format_html(
+        '<script defer src="{}" data-api-url="{}" data-live-url="{}"></script>',
+        static("hotmine/account-data.js"),
+        api_url,
+        live_url,
+    )
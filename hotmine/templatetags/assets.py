@@ -0,0 +1,86 @@
+import json
+from functools import lru_cache
+
+from django import template
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.templatetags.static import static
+from django.utils.html import format_html, format_html_join
+
+from hotmine.assets import BUNDLE_DIR
+from hotmine.images import MANIFEST_NAME
+
+register = template.Library()
+
+
+@lru_cache(maxsize=None)
+def _bundle_exists(name):
+    try:
+        return staticfiles_storage.exists(name)
+    except Exception:
+        return False
+
+
+@register.simple_tag
+def stylesheets(page, *paths):
+    """
+    Link the purged per-page bundle built at collectstatic time, or the
+    individual stylesheets when bundles are off or haven't been built yet.
+    The collectstatic build stage reads the same arguments from the template.
+    """
+    bundle = f"{BUNDLE_DIR}/{page}.css"
+    if getattr(settings, "ASSET_BUNDLES", True) and _bundle_exists(bundle):
+        paths = (bundle,)
+    return format_html_join(
+        "\n    ",
+        '<link rel="stylesheet" href="{}">',
+        ((static(path),) for path in paths),
+    )
+
+
+@lru_cache(maxsize=None)
+def _image_variants():
+    try:
+        with staticfiles_storage.open(MANIFEST_NAME) as f:
+            return json.loads(f.read().decode("utf-8"))
+    except Exception:
+        return {}
+
+
+def _srcset(sources):
+    return ", ".join(f"{static(s['name'])} {s['width']}w" for s in sources)
+
+
+@register.simple_tag
+def picture(path, alt="", width=None, sizes=None, **attrs):
+    """
+    <picture> with WebP and resized sources from the collectstatic image
+    pipeline. width sets the display width; height follows from the image's
+    intrinsic aspect ratio so the layout doesn't shift while it loads.
+    """
+    entry = _image_variants().get(path)
+    img_attrs = {"src": static(path), "alt": alt, **attrs}
+    if not entry:
+        if width:
+            img_attrs["width"] = width
+        return format_html("<img {}>", format_html_join(" ", '{}="{}"', img_attrs.items()))
+
+    display = int(width) if width else entry["width"]
+    img_attrs["width"] = display
+    img_attrs["height"] = round(entry["height"] * display / entry["width"])
+    if sizes is None:
+        sizes = f"{width}px" if width else "100vw"
+    webp = [s for s in entry["sources"] if s["type"] == "image/webp"]
+    fallback = [s for s in entry["sources"] if s["type"] != "image/webp"]
+    if fallback:
+        img_attrs["srcset"] = _srcset(fallback)
+        img_attrs["sizes"] = sizes
+    img = format_html("<img {}>", format_html_join(" ", '{}="{}"', img_attrs.items()))
+    if not webp:
+        return img
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">{}</picture>',
+        _srcset(webp),
+        sizes,
+        img,
+    )
@@ -0,0 +1,70 @@
+from django import template
+from django.conf import settings
+from django.urls import reverse
+
+from hotmine import prices
+
+register = template.Library()
+
+SPARK_WIDTH = 100
+SPARK_HEIGHT = 24
+
+
+def sparkline_points(series):
+    """SVG polyline points for [[timestamp, price], ...] in a 100x24 box"""
+    values = [price for _, price in series]
+    if len(values) < 2:
+        return ""
+    low, high = min(values), max(values)
+    span = (high - low) or 1
+    step = SPARK_WIDTH / (len(values) - 1)
+    return " ".join(
+        f"{i * step:.1f},{SPARK_HEIGHT - (v - low) / span * SPARK_HEIGHT:.1f}"
+        for i, v in enumerate(values)
+    )
+
+
+def format_price(price):
+    if price is None:
+        return "--"
+    return f"${price:,.2f}" if price >= 1 else f"${price:.4f}"
+
+
+def format_change(change):
+    if change is None:
+        return ""
+    return f"{change:+.2f}%"
+
+
+@register.inclusion_tag("hotmine/price_ticker.html")
+def price_ticker(symbols="", layout="marquee", history=0, css_class=""):
+    """
+    Our own price ticker, rendered from the cached snapshot and kept current
+    by hotmine/ticker.js polling the batched price endpoint.
+    """
+    wanted = prices.parse_symbols(symbols)
+    # Never fetch from the feed while rendering a page; the endpoint does that
+    snapshot = prices.get_snapshot(refresh_stale=False) or {"prices": {}}
+    series = prices.get_history(wanted, history) if history else {}
+    items = []
+    for symbol in wanted:
+        quote = snapshot["prices"].get(symbol, {})
+        items.append(
+            {
+                "symbol": symbol,
+                "name": prices.NAMES[symbol],
+                "price": format_price(quote.get("price")),
+                "change": format_change(quote.get("change_24h")),
+                "direction": "down" if (quote.get("change_24h") or 0) < 0 else "up",
+                "spark": sparkline_points(series.get(symbol, [])),
+            }
+        )
+    return {
+        "items": items,
+        "layout": layout,
+        "history": history,
+        "css_class": css_class,
+        "symbols": ",".join(wanted),
+        "url": reverse("price_feed"),
+        "refresh": getattr(settings, "PRICE_TTL", 60),
+    }
@@ -1,3 +1,1441 @@
-from django.test import TestCase
+import asyncio
+import json
+import logging
+import re
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock, skipIf
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.core import mail
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.management import call_command
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db import connection
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.db.migrations.executor import MigrationExecutor
+from django.forms import model_to_dict
+from django.http import HttpResponse
+from django.test import (
+    Client,
+    RequestFactory,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.utils import timezone
+
+from . import (
+    accounts,
+    api,
+    archive,
+    assets,
+    caching,
+    catalog,
+    forecast,
+    hashing,
+    images,
+    live,
+    logs,
+    outbox,
+    planstats,
+    prices,
+    ratelimit,
+    reconcile,
+    routers,
+    scheduler,
+    settlement,
+    snapshots,
+    streaming,
+    tracing,
+    warmup,
+)
+from .admin import InvestmentAdmin, InvestmentAdminForm, WithdrawalRequestAdmin
+from .models import (
+    Amount,
+    ArchivedInvestment,
+    Investment,
+    InvestmentPlan,
+    InvestmentPlanStats,
+    JobLease,
+    OutboxMessage,
+    PortfolioSnapshot,
+    Totalearnings,
+    WithdrawalRequest,
+    totalwithdraw,
+)
+from .money import Money
+from .storage import HotmineStaticFilesStorage
+from .templatetags import assets as asset_tags
+
+
+class SettlementTests(TestCase):
+    """Money moved by accrual, maturity and the admin's status actions"""
+
+    def setUp(self):
+        self.user = User.objects.create_user("investor", "investor@example.com")
+        self.plan = InvestmentPlan.objects.create(
+            title="Starter",
+            daily_earnings_percentage=Decimal("1.00"),
+            investment_duration_days=10,
+            deposit_return=True,
+        )
+        Amount.objects.create(user=self.user, amount=Decimal("0.00"))
+
+    def invest(self, status="ACTIVE", days_ago=0, amount="100.00"):
+        investment = Investment.objects.create(
+            user=self.user,
+            investment_plan=self.plan,
+            amount=Decimal(amount),
+            status=status,
+        )
+        invested = timezone.now() - timedelta(days=days_ago)
+        Investment.objects.filter(pk=investment.pk).update(
+            date_invested=invested,
+            matures_at=invested + timedelta(days=self.plan.investment_duration_days),
+        )
+        investment.refresh_from_db()
+        return investment
+
+    def balance(self):
+        return Amount.objects.get(user=self.user).amount
+
+    def earnings(self):
+        row = Totalearnings.objects.filter(user=self.user).first()
+        return row.total_earnings.to_decimal() if row else Decimal("0.00")
+
+    def test_accrue_credits_each_day_once(self):
+        investment = self.invest(days_ago=3)
+        self.assertEqual(settlement.accrue(), 1)
+        self.assertEqual(settlement.accrue(), 0)
+        investment.refresh_from_db()
+        self.assertEqual(investment.total_earnings, Decimal("3.00"))
+        self.assertEqual(investment.last_accrued_on, timezone.now().date())
+        self.assertEqual(self.earnings(), Decimal("3.00"))
+
+    def test_accrue_stops_at_maturity(self):
+        investment = self.invest(days_ago=15)
+        settlement.accrue()
+        investment.refresh_from_db()
+        self.assertEqual(investment.total_earnings, Decimal("10.00"))
+
+    def test_settle_returns_deposit_once(self):
+        investment = self.invest(days_ago=12)
+        self.assertEqual(settlement.settle(), 1)
+        self.assertEqual(settlement.settle(), 0)
+        investment.refresh_from_db()
+        self.assertEqual(investment.status, "COMPLETED")
+        self.assertEqual(investment.total_earnings, Decimal("10.00"))
+        self.assertEqual(self.balance(), Decimal("100.00"))
+
+    def test_settle_leaves_running_investments(self):
+        self.invest(days_ago=5)
+        self.assertEqual(settlement.settle(), 0)
+        self.assertEqual(self.balance(), Decimal("0.00"))
+
+    def test_settle_without_deposit_return(self):
+        self.plan.deposit_return = False
+        self.plan.save()
+        self.invest(days_ago=12)
+        settlement.settle()
+        self.assertEqual(self.balance(), Decimal("0.00"))
+        self.assertEqual(self.earnings(), Decimal("10.00"))
+
+    def test_complete_active_returns_deposit(self):
+        investment = self.invest(days_ago=2)
+        settlement.complete(Investment.objects.filter(pk=investment.pk))
+        investment.refresh_from_db()
+        self.assertEqual(investment.status, "COMPLETED")
+        self.assertEqual(investment.total_earnings, Decimal("2.00"))
+        self.assertEqual(self.balance(), Decimal("100.00"))
+
+    def test_complete_pending_returns_nothing(self):
+        investment = self.invest(status="PENDING", days_ago=2)
+        settlement.complete(Investment.objects.filter(pk=investment.pk))
+        investment.refresh_from_db()
+        self.assertEqual(investment.status, "COMPLETED")
+        self.assertEqual(self.balance(), Decimal("0.00"))
+        self.assertEqual(self.earnings(), Decimal("0.00"))
+
+    def test_complete_twice_credits_once(self):
+        investment = self.invest(days_ago=2)
+        chosen = Investment.objects.filter(pk=investment.pk)
+        self.assertEqual(settlement.complete(chosen), 1)
+        self.assertEqual(settlement.complete(chosen), 0)
+        self.assertEqual(settlement.settle(), 0)
+        self.assertEqual(self.balance(), Decimal("100.00"))
+        self.assertEqual(self.earnings(), Decimal("2.00"))
+        notices = OutboxMessage.objects.filter(event="investment.completed")
+        self.assertEqual(notices.count(), 1)
+
+    def test_settle_after_complete_credits_nothing(self):
+        investment = self.invest(days_ago=12)
+        settlement.complete(Investment.objects.filter(pk=investment.pk))
+        self.assertEqual(settlement.settle(), 0)
+        self.assertEqual(self.balance(), Decimal("100.00"))
+        self.assertEqual(self.earnings(), Decimal("10.00"))
+
+    def test_activating_accrues_from_today(self):
+        investment = self.invest(status="PENDING", days_ago=5)
+        model_admin = InvestmentAdmin(Investment, admin.site)
+        model_admin._set_status(Investment.objects.filter(pk=investment.pk), "ACTIVE")
+        investment.refresh_from_db()
+        self.assertEqual(investment.last_accrued_on, timezone.now().date())
+        self.assertEqual(settlement.accrue(), 0)
+        self.assertEqual(self.earnings(), Decimal("0.00"))
+
+    def test_completed_is_not_reactivated(self):
+        investment = self.invest(days_ago=12)
+        settlement.settle()
+        model_admin = InvestmentAdmin(Investment, admin.site)
+        updated = model_admin._set_status(
+            Investment.objects.filter(pk=investment.pk), "ACTIVE"
+        )
+        self.assertEqual(updated, 0)
+        settlement.complete(Investment.objects.filter(pk=investment.pk))
+        self.assertEqual(self.balance(), Decimal("100.00"))
+
+    def status_form(self, investment, status):
+        data = {
+            name: value
+            for name, value in model_to_dict(investment).items()
+            if value is not None
+        }
+        data["status"] = status
+        return InvestmentAdminForm(data, instance=investment)
+
+    def test_completed_cannot_be_reopened_in_the_form(self):
+        investment = self.invest(days_ago=12)
+        settlement.settle()
+        investment.refresh_from_db()
+        form = self.status_form(investment, "ACTIVE")
+        self.assertFalse(form.is_valid())
+        self.assertIn("status", form.errors)
+
+    def test_form_leaves_completing_to_settlement(self):
+        investment = self.invest(days_ago=2)
+        form = self.status_form(investment, "COMPLETED")
+        self.assertFalse(form.is_valid())
+        self.assertIn("action", form.errors["status"][0])
+        self.assertTrue(self.status_form(investment, "CANCELLED").is_valid())
+
+
+class WithdrawalAdminTests(TestCase):
+    def test_bulk_actions_send_the_usual_payload(self):
+        user = User.objects.create_user("payee", "payee@example.com")
+        withdrawal = WithdrawalRequest.objects.create(
+            user=user,
+            amount=Decimal("25.00"),
+            withdrawal_method="bank",
+            account_details="123",
+            rejection_reason="Details don't match",
+        )
+        model_admin = WithdrawalRequestAdmin(WithdrawalRequest, admin.site)
+        model_admin._bulk_set_status(WithdrawalRequest.objects.all(), "rejected")
+        message = OutboxMessage.objects.get(user=user)
+        self.assertEqual(message.event, "withdrawal.rejected")
+        self.assertEqual(
+            message.payload,
+            {"id": withdrawal.pk, "amount": "25.00", "reason": "Details don't match"},
+        )
+
+
+class MaturityScheduleTests(TestCase):
+    """Progress and days remaining count to matures_at, like settlement"""
+
+    def setUp(self):
+        self.user = User.objects.create_user("holder", "holder@example.com")
+        self.plan = InvestmentPlan.objects.create(
+            title="Short",
+            daily_earnings_percentage=Decimal("1.00"),
+            investment_duration_days=10,
+        )
+
+    def invest(self, days_ago, term):
+        investment = Investment.objects.create(
+            user=self.user,
+            investment_plan=self.plan,
+            amount=Decimal("50.00"),
+            status="ACTIVE",
+        )
+        invested = timezone.now() - timedelta(days=days_ago)
+        Investment.objects.filter(pk=investment.pk).update(
+            date_invested=invested, matures_at=invested + timedelta(days=term)
+        )
+        investment.refresh_from_db()
+        return investment
+
+    def test_model_and_api_follow_matures_at(self):
+        # The plan says 10 days, but this one matures after 20
+        investment = self.invest(days_ago=5, term=20)
+        self.assertEqual(investment.days_remaining, 15)
+        self.assertEqual(investment.progress_percentage, 25)
+        fields = ["days_remaining", "progress_percentage"]
+        (row,) = api.get_investments(self.user, fields)
+        self.assertEqual(row, {"days_remaining": 15, "progress_percentage": 25})
+
+    def test_zero_term_is_done(self):
+        investment = self.invest(days_ago=0, term=0)
+        self.assertEqual(investment.days_remaining, 0)
+        self.assertEqual(investment.progress_percentage, 100)
+
+
+class DashboardApiTests(TestCase):
+    """One request fills the page shells with just the fields asked for"""
+
+    def setUp(self):
+        self.user = User.objects.create_user("investor")
+        Amount.objects.create(user=self.user, amount=Decimal("12.5"))
+        plan = InvestmentPlan.objects.create(
+            title="Starter",
+            daily_earnings_percentage=Decimal("1.00"),
+            investment_duration_days=10,
+        )
+        for user in (self.user, User.objects.create_user("someone-else")):
+            Investment.objects.create(
+                user=user, investment_plan=plan, amount=Decimal("100"), status="ACTIVE"
+            )
+
+    def get(self, fields):
+        return self.client.get("/api/v1/dashboard/", {"fields": fields})
+
+    def test_requires_a_session(self):
+        response = self.get("summary.amount")
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json()["error"], "Authentication required")
+
+    def test_returns_only_the_requested_fields(self):
+        self.client.force_login(self.user)
+        response = self.get("summary.amount,investments.plan")
+        self.assertEqual(
+            response.json(),
+            {
+                "version": api.API_VERSION,
+                "summary": {"amount": "12.50"},
+                "investments": [{"plan": "Starter"}],
+            },
+        )
+        self.assertIn("private", response["Cache-Control"])
+        self.assertIn("no-cache", response["Cache-Control"])
+
+    def test_unknown_fields_are_rejected(self):
+        self.client.force_login(self.user)
+        for fields in ("summary.password", "payments"):
+            with self.subTest(fields=fields):
+                response = self.get(fields)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("Unknown", response.json()["error"])
+
+
+class InvestmentRecordTests(TestCase):
+    """The async investments page counts and pages hot and archived rows"""
+
+    def setUp(self):
+        self.user = User.objects.create_user("investor")
+        plan = InvestmentPlan.objects.create(
+            title="Starter",
+            daily_earnings_percentage=Decimal("1.00"),
+            investment_duration_days=10,
+        )
+        for _ in range(12):
+            Investment.objects.create(
+                user=self.user,
+                investment_plan=plan,
+                amount=Decimal("10.00"),
+                status="ACTIVE",
+            )
+        ArchivedInvestment.objects.create(
+            id=10_000,
+            user=self.user,
+            investment_plan=plan,
+            amount=Decimal("10.00"),
+            status="COMPLETED",
+            date_invested=timezone.now() - timedelta(days=400),
+            archived_at=timezone.now(),
+        )
+
+    def page(self, number):
+        self.client.force_login(self.user)
+        return self.client.get("/my-investments/", {"page": number}).context
+
+    def test_counts_both_tables(self):
+        context = self.page(1)
+        self.assertEqual(context["total_invested"], Decimal("130.00"))
+        self.assertEqual(context["active_count"], 12)
+        self.assertEqual(context["completed_count"], 1)
+        self.assertEqual(len(context["investments"].object_list), 10)
+
+    def test_pages_past_the_end_show_the_last(self):
+        for number in (2, 99):
+            with self.subTest(page=number):
+                investments = self.page(number)["investments"]
+                self.assertEqual(investments.number, 2)
+                rows = investments.object_list
+                self.assertEqual([row.archived for row in rows], [False, False, True])
+
+    def test_requires_login(self):
+        response = self.client.get("/my-investments/")
+        self.assertEqual(response.status_code, 302)
+
+
+class EmailIdentityTests(TestCase):
+    """Python and the 0011 index fold the same letters, ASCII only"""
+
+    def test_lookups_fold_ascii_case_only(self):
+        user = User.objects.create_user("emile", "Émile@Example.com")
+        self.assertEqual(accounts.get_user_by_email(" Émile@EXAMPLE.com "), user)
+        self.assertIsNone(accounts.get_user_by_email("émile@example.com"))
+
+
+class ClientIpTests(TestCase):
+    """Rate limit buckets can't be dodged with a made-up X-Forwarded-For"""
+
+    def request(self, forwarded):
+        return RequestFactory().post(
+            "/login/", REMOTE_ADDR="10.0.0.1", HTTP_X_FORWARDED_FOR=forwarded
+        )
+
+    def test_ignores_forwarded_for_by_default(self):
+        request = self.request("203.0.113.9")
+        self.assertEqual(ratelimit.client_ip(request), "10.0.0.1")
+
+    @override_settings(RATELIMIT_TRUSTED_PROXIES=1)
+    def test_takes_the_address_the_proxy_appended(self):
+        request = self.request("198.51.100.77, 203.0.113.9")
+        self.assertEqual(ratelimit.client_ip(request), "203.0.113.9")
+
+    @override_settings(RATELIMIT_TRUSTED_PROXIES=2)
+    def test_short_header_falls_back_to_remote_addr(self):
+        request = self.request("203.0.113.9")
+        self.assertEqual(ratelimit.client_ip(request), "10.0.0.1")
+
+
+@override_settings(RATELIMIT_RULES={"login": [("account", 2, 300)]})
+class LoginRateLimitTests(TestCase):
+    """Attempts over the limit are answered without hashing the password"""
+
+    def setUp(self):
+        cache.clear()
+
+    def login(self, username):
+        return self.client.post("/login/", {"username": username, "password": "not-it"})
+
+    def test_rejects_before_hashing(self):
+        with mock.patch.object(hashing, "run", wraps=hashing.run) as run:
+            for _ in range(2):
+                self.assertEqual(self.login("amira").status_code, 200)
+            response = self.login("amira")
+            self.assertEqual(response.status_code, 429)
+            self.assertTrue(int(response["Retry-After"]) > 0)
+            self.assertEqual(run.await_count, 2)
+            # Another account isn't held up by this one's attempts
+            self.assertEqual(self.login("bruno").status_code, 200)
+
+
+class BlockingFeed(prices.PriceFeed):
+    """Hangs like a slow feed until the test lets it answer"""
+
+    answer = threading.Event()
+
+    def fetch(self, symbols):
+        self.answer.wait(5)
+        return {"BTC": {"price": 2.0, "change_24h": None}}
+
+
+@override_settings(
+    PRICE_FEED="hotmine.tests.BlockingFeed",
+    PRICE_FEED_OPTIONS={},
+    PRICE_BACKGROUND_REFRESH=True,
+)
+class PriceSnapshotTests(TestCase):
+    def setUp(self):
+        prices.get_cache().delete_many([prices.SNAPSHOT_KEY, prices.LOCK_KEY])
+        BlockingFeed.answer.clear()
+        self.addCleanup(BlockingFeed.answer.set)
+
+    def test_stale_snapshot_is_served_while_refreshing(self):
+        stale = {"updated": time.time() - 3600, "prices": {"BTC": {"price": 1.0}}}
+        prices.get_cache().set(prices.SNAPSHOT_KEY, stale, None)
+        # The feed hasn't answered, yet the request gets the old prices
+        self.assertEqual(prices.get_snapshot(), stale)
+        self.assertEqual(prices.get_snapshot(), stale)
+        BlockingFeed.answer.set()
+        deadline = time.monotonic() + 5
+        while prices.get_snapshot(refresh_stale=False) == stale:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+        snapshot = prices.get_snapshot(refresh_stale=False)
+        self.assertEqual(snapshot["prices"]["BTC"]["price"], 2.0)
+
+
+class PageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_query_strings_share_the_cached_page(self):
+        self.assertEqual(self.client.get("/?a=1")["X-Page-Cache"], "miss")
+        self.assertEqual(self.client.get("/?b=2")["X-Page-Cache"], "hit")
+        self.assertEqual(self.client.get("/")["X-Page-Cache"], "hit")
+
+    def test_signed_in_visitors_get_their_own_page(self):
+        def greeting(request):
+            return HttpResponse(f"hello {request.user.username or 'guest'}")
+
+        view = caching.cache_anonymous_page(60)(greeting)
+        factory = RequestFactory()
+
+        def get(user=None):
+            request = factory.get("/greeting/")
+            request.user = user or AnonymousUser()
+            if user is not None:
+                request.COOKIES[settings.SESSION_COOKIE_NAME] = "session"
+            return view(request)
+
+        amira = User.objects.create_user("amira")
+        response = get(amira)
+        self.assertEqual(response.content, b"hello amira")
+        self.assertNotIn("X-Page-Cache", response)
+        self.assertIn("private", response["Cache-Control"])
+        # Nothing of amira's was cached for anyone else
+        self.assertEqual(get()["X-Page-Cache"], "miss")
+        self.assertEqual(get().content, b"hello guest")
+        bruno = User.objects.create_user("bruno")
+        self.assertEqual(get(bruno).content, b"hello bruno")
+
+    def test_cached_form_gets_a_fresh_csrf_token(self):
+        first = Client().get("/login/")
+        second = Client().get("/login/")
+        self.assertEqual(first["X-Page-Cache"], "miss")
+        self.assertEqual(second["X-Page-Cache"], "hit")
+        self.assertIn("private", second["Cache-Control"])
+        self.assertNotIn(caching.CSRF_PLACEHOLDER, second.content)
+        self.assertIsNotNone(caching.CSRF_VALUE.search(second.content))
+        self.assertIn("csrftoken", second.cookies)
+
+    def test_listed_parameters_are_keyed(self):
+        request = RequestFactory().get("/", {"page": "2", "utm": "x"})
+        key = caching._page_key(request, query=("page",))
+        self.assertTrue(key.endswith(":/?page=2"))
+        self.assertEqual(key, caching._page_key(request, query=("page", "sort")))
+
+
+@override_settings(PRICE_FEED="hotmine.prices.FileFeed", PRICE_FEED_OPTIONS={})
+class WarmupTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_fills_the_caches_the_first_request_needs(self):
+        timings = warmup.run()
+        self.assertEqual(list(timings), [name for name, _, _ in warmup.STEPS])
+        self.assertNotIn(None, timings.values())
+        with self.assertNumQueries(0):
+            catalog.get_active_plans()
+        self.assertIsNotNone(prices.get_snapshot(refresh_stale=False))
+
+    def test_app_loading_variant_stays_off_the_database(self):
+        with self.assertNumQueries(0):
+            timings = warmup.run(database=False)
+        self.assertEqual(list(timings), ["urls", "templates"])
+
+    def test_failed_step_is_skipped(self):
+        def broken():
+            raise RuntimeError("no database")
+
+        steps = (("database", broken, True), ("urls", warmup.load_urls, False))
+        with mock.patch.object(warmup, "STEPS", steps):
+            with self.assertLogs("hotmine.warmup", "ERROR"):
+                timings = warmup.run()
+        self.assertIsNone(timings["database"])
+        self.assertIsNotNone(timings["urls"])
+
+
+class StaticStorageTests(TestCase):
+    def test_missing_file_fails(self):
+        with self.assertRaises(ValueError):
+            HotmineStaticFilesStorage().hashed_name("nope/missing.png")
+
+    def test_allowed_missing_file_warns_once(self):
+        storage = HotmineStaticFilesStorage()
+        (name,) = storage.missing_allowed
+        with self.assertLogs("hotmine.storage", "WARNING") as logs:
+            for _ in range(3):
+                self.assertEqual(storage.hashed_name(name), name)
+        self.assertEqual(len(logs.records), 1)
+
+
+@override_settings(ALLOWED_HOSTS=["hotmine.example"], LIVE_EVENTS=True)
+class LiveEventsHostTests(TestCase):
+    """/events/ skips Django's handler but not its ALLOWED_HOSTS check"""
+
+    def status(self, host):
+        scope = {
+            "type": "http",
+            "method": "GET",
+            "path": "/events/",
+            "headers": [(b"host", host)],
+            "server": ("10.0.0.5", 8000),
+        }
+        sent = []
+
+        async def receive():
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            sent.append(message)
+
+        asyncio.run(live.asgi_events(scope, receive, send))
+        return sent[0]["status"]
+
+    def test_unknown_host_is_refused(self):
+        self.assertEqual(self.status(b"attacker.example"), 400)
+
+    def test_allowed_host_reaches_the_session_check(self):
+        self.assertEqual(self.status(b"hotmine.example:443"), 401)
+
+    def test_django_view_refuses_wsgi(self):
+        user = User.objects.create_user("streamer", "streamer@example.com")
+        self.client.force_login(user)
+        response = self.client.get("/events/", HTTP_HOST="hotmine.example")
+        self.assertEqual(response.status_code, 501)
+
+
+class AssetBundleTests(TestCase):
+    """Purged bundles keep what their pages render, form widgets included"""
+
+    def build(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        storage = FileSystemStorage(directory)
+        source = Path(assets.__file__).resolve().parent / "static"
+        for name in ("hotmine/bootstrap.css", "hotmine/login.css"):
+            with open(source / name, "rb") as f:
+                storage.save(name, f)
+        assets.build(storage, {})
+        return storage
+
+    def bundle(self, storage, name):
+        with storage.open(f"{assets.BUNDLE_DIR}/{name}.css") as f:
+            return f.read().decode()
+
+    def test_bundles_keep_their_forms_classes(self):
+        storage = self.build()
+        for page in ("login", "signup", "password_reset", "profile", "password"):
+            with self.subTest(page=page):
+                self.assertIn(".form-control", self.bundle(storage, page))
+
+    def test_bundles_keep_template_classes_and_drop_the_rest(self):
+        css = self.bundle(self.build(), "login")
+        self.assertIn(".alert-primary", css)
+        self.assertNotIn(".carousel-caption", css)
+
+
+@skipIf(images.Image is None, "Pillow isn't installed")
+class ImagePipelineTests(TestCase):
+    """Images get resized and WebP variants, described for {% picture %}"""
+
+    def build(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        storage = FileSystemStorage(directory)
+        sizes = {
+            "hotmine/images/hero.png": (700, 350),
+            "hotmine/images/icon.png": (32, 32),
+        }
+        for name, size in sizes.items():
+            buffer = BytesIO()
+            images.Image.new("RGB", size, "orange").save(buffer, "PNG")
+            storage.save(name, ContentFile(buffer.getvalue()))
+        written = images.build(storage, sizes)
+        with storage.open(images.MANIFEST_NAME) as f:
+            manifest = json.load(f)
+        return storage, written, manifest
+
+    def test_writes_variants_and_their_sizes(self):
+        storage, written, manifest = self.build()
+        hero = manifest["hotmine/images/hero.png"]
+        self.assertEqual((hero["width"], hero["height"]), (700, 350))
+        self.assertEqual(
+            [(source["width"], source["type"]) for source in hero["sources"]],
+            [
+                (320, "image/png"),
+                (320, "image/webp"),
+                (640, "image/png"),
+                (640, "image/webp"),
+                (700, "image/png"),
+                (700, "image/webp"),
+            ],
+        )
+        for source in hero["sources"]:
+            self.assertIn(source["name"], written)
+        with storage.open("hotmine/images/hero.w320.png") as f:
+            self.assertEqual(images.Image.open(f).size, (320, 160))
+        # Too small to be worth variants
+        self.assertEqual(manifest["hotmine/images/icon.png"]["sources"], [])
+
+    def test_picture_uses_the_variants(self):
+        _, _, manifest = self.build()
+        with mock.patch.object(asset_tags, "_image_variants", return_value=manifest):
+            html = asset_tags.picture("hotmine/images/hero.png", alt="", width=350)
+        self.assertIn('<source type="image/webp"', html)
+        self.assertIn("hero.w320.webp 320w", html)
+        self.assertIn('width="350" height="175"', html)
+
+
+class TotalEarningsCentsMigrationTests(TransactionTestCase):
+    """0019 moves Totalearnings.total_earnings to cents and back"""
+
+    before = [("hotmine", "0018_plan_stats")]
+    after = [("hotmine", "0019_totalearnings_cents")]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+    def test_amounts_survive_both_ways(self):
+        apps = self.migrate(self.before)
+        user = apps.get_model("auth", "User").objects.create(username="earner")
+        Earnings = apps.get_model("hotmine", "Totalearnings")
+        Earnings.objects.create(user_id=user.pk, total_earnings=Decimal("1234.56"))
+        Earnings.objects.create(user_id=user.pk, total_earnings=None)
+
+        apps = self.migrate(self.after)
+        Earnings = apps.get_model("hotmine", "Totalearnings")
+        values = list(
+            Earnings.objects.order_by("pk").values_list("total_earnings", flat=True)
+        )
+        self.assertEqual(values, [Money(123456), None])
+
+        apps = self.migrate(self.before)
+        Earnings = apps.get_model("hotmine", "Totalearnings")
+        values = list(
+            Earnings.objects.order_by("pk").values_list("total_earnings", flat=True)
+        )
+        self.assertEqual(values, [Decimal("1234.56"), None])
+
+
+class TotalEarningsCentsTests(TestCase):
+    def test_credits_and_summary_in_cents(self):
+        user = User.objects.create_user("saver", "saver@example.com")
+        Totalearnings.objects.create(user=user, total_earnings=Money(1005))
+        now = timezone.now()
+        settlement._credit(Totalearnings, "total_earnings", {user.pk: Money(1)}, now)
+        row = Totalearnings.objects.get(user=user)
+        self.assertEqual(row.total_earnings, Money(1006))
+        summary = api.get_summary(user, ["total_earnings"])
+        self.assertEqual(summary, {"total_earnings": Decimal("10.06")})
+
+
+class ArchiveTests(TestCase):
+    """Finished rows move to the archive and are still read through history"""
+
+    def setUp(self):
+        self.user = User.objects.create_user("investor", "investor@example.com")
+        self.plan = InvestmentPlan.objects.create(
+            title="Starter",
+            daily_earnings_percentage=Decimal("1.00"),
+            investment_duration_days=10,
+        )
+
+    def invest(self, status, days_ago):
+        investment = Investment.objects.create(
+            user=self.user, investment_plan=self.plan, amount=Decimal("100.00")
+        )
+        when = timezone.now() - timedelta(days=days_ago)
+        Investment.objects.filter(pk=investment.pk).update(
+            status=status,
+            date_invested=when,
+            date_completed=when if status == "COMPLETED" else None,
+        )
+        return investment.pk
+
+    def test_moves_finished_rows_and_reads_them_back(self):
+        old = [self.invest("COMPLETED", days_ago) for days_ago in (200, 300)]
+        recent = self.invest("COMPLETED", 10)
+        running = self.invest("ACTIVE", 400)
+
+        moved = archive.archive("investments", days=180, batch_size=1, pause=0)
+        self.assertEqual(moved, 2)
+        self.assertEqual(archive.archive("investments", days=180, pause=0), 0)
+        self.assertCountEqual(
+            ArchivedInvestment.objects.values_list("pk", flat=True), old
+        )
+        self.assertCountEqual(
+            Investment.objects.values_list("pk", flat=True), [recent, running]
+        )
+
+        history = Investment.history.filter(user=self.user).prefetch_related(
+            "investment_plan"
+        )
+        self.assertEqual(history.count(), 4)
+        rows = list(history)
+        # Newest first, as Investment's own ordering
+        self.assertEqual([row.pk for row in rows], [recent, *old, running])
+        self.assertEqual([row.archived for row in rows], [False, True, True, False])
+        self.assertEqual(rows[1].investment_plan, self.plan)
+        self.assertEqual([row.pk for row in history[1:3]], old)
+
+
+class FailingEmailBackend(BaseEmailBackend):
+    def send_messages(self, email_messages):
+        raise ConnectionError("mail server down")
+
+
+class OutboxDispatchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("investor", "investor@example.com")
+
+    def enqueue(self, event="investment.completed"):
+        payload = outbox.investment_payload(1, Decimal("100"), "Starter")
+        outbox.enqueue(self.user.pk, event, payload)
+
+    def test_sends_one_digest_per_user(self):
+        self.enqueue("investment.active")
+        self.enqueue("investment.completed")
+        counts = outbox.dispatch()
+        self.assertEqual(counts, {"sent": 2, "retried": 0, "failed": 0})
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ["investor@example.com"])
+        self.assertIn("2 updates", mail.outbox[0].subject)
+        self.assertFalse(OutboxMessage.objects.exclude(status="sent").exists())
+        self.assertEqual(outbox.dispatch()["sent"], 0)
+
+    def test_backoff_doubles_up_to_the_cap(self):
+        with mock.patch.object(outbox.random, "uniform", return_value=1.0):
+            delays = [outbox.backoff(attempts) for attempts in (1, 2, 3, 10)]
+        self.assertEqual(delays, [60, 120, 240, 3600])
+
+    @override_settings(
+        EMAIL_BACKEND="hotmine.tests.FailingEmailBackend", OUTBOX_MAX_ATTEMPTS=2
+    )
+    def test_failed_send_retries_then_gives_up(self):
+        self.enqueue()
+        before = timezone.now()
+        self.assertEqual(outbox.dispatch()["retried"], 1)
+        message = OutboxMessage.objects.get()
+        self.assertEqual((message.status, message.attempts), ("pending", 1))
+        self.assertIn("mail server down", message.last_error)
+        wait = (message.available_at - before).total_seconds()
+        self.assertTrue(50 < wait < 70)
+        # Not due again until the backoff has passed
+        self.assertEqual(outbox.dispatch()["retried"], 0)
+
+        OutboxMessage.objects.update(available_at=timezone.now())
+        self.assertEqual(outbox.dispatch()["failed"], 1)
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts), ("failed", 2))
+        OutboxMessage.objects.update(available_at=timezone.now())
+        self.assertEqual(outbox.dispatch(), {"sent": 0, "retried": 0, "failed": 0})
+
+
+class ReconcileTests(TestCase):
+    """Balance rows that drifted from their records are found and rewritten"""
+
+    def setUp(self):
+        self.investor = User.objects.create_user("investor")
+        plan = InvestmentPlan.objects.create(
+            title="Starter",
+            daily_earnings_percentage=Decimal("1.00"),
+            investment_duration_days=10,
+        )
+        Investment.objects.create(
+            user=self.investor,
+            investment_plan=plan,
+            amount=Decimal("100.00"),
+            total_earnings=Decimal("10.00"),
+        )
+        Totalearnings.objects.create(user=self.investor, total_earnings=Decimal("7.00"))
+        # A completed withdrawal, and no totalwithdraw row at all
+        self.withdrawer = User.objects.create_user("withdrawer")
+        WithdrawalRequest.objects.create(
+            user=self.withdrawer,
+            amount=Decimal("5.00"),
+            withdrawal_method="bank",
+            account_details="123",
+            status="completed",
+        )
+
+    def mismatches(self):
+        return list(reconcile.run(workers=1, use_replica=False))
+
+    def test_detects_mismatches(self):
+        self.assertEqual(
+            self.mismatches(),
+            [
+                reconcile.Mismatch(self.investor.pk, "earnings", 700, 1000),
+                reconcile.Mismatch(self.withdrawer.pk, "withdrawals", None, 500),
+            ],
+        )
+
+    def test_fix_rewrites_the_balances(self):
+        with tempfile.NamedTemporaryFile(suffix=".csv") as report:
+            call_command(
+                "reconcile_balances",
+                "--fix",
+                "--primary",
+                workers=1,
+                output=report.name,
+                stderr=StringIO(),
+            )
+            self.assertEqual(len(Path(report.name).read_text().splitlines()), 3)
+        self.assertEqual(self.mismatches(), [])
+        earnings = Totalearnings.objects.get(user=self.investor)
+        self.assertEqual(earnings.total_earnings, Money(1000))
+        withdrawn = totalwithdraw.objects.get(user=self.withdrawer)
+        self.assertEqual(withdrawn.total_withdraw, Decimal("5.00"))
+
+
+@override_settings(SCHEDULER_LEASE_SECONDS=900)
+class SchedulerLeaseTests(TestCase):
+    """A due job is run by exactly one of the schedulers asking for it"""
+
+    def setUp(self):
+        self.calls = []
+        self.job = scheduler.Job("test", lambda: self.calls.append(1), every=60)
+        self.now = timezone.now()
+        scheduler.ensure_leases([self.job])
+        # Overdue by ten and a half runs
+        JobLease.objects.filter(name="test").update(
+            next_run_at=self.now - timedelta(seconds=630)
+        )
+
+    def test_only_one_acquire_wins(self):
+        first = scheduler.acquire(self.job, self.now)
+        self.assertIsNotNone(first)
+        self.assertEqual(first.owner, scheduler.OWNER)
+        self.assertIsNone(scheduler.acquire(self.job, self.now))
+        # Even forcing a run waits for the holder
+        self.assertIsNone(scheduler.acquire(self.job, self.now, force=True))
+
+    def test_expired_lease_is_taken_over(self):
+        scheduler.acquire(self.job, self.now)
+        later = self.now + timedelta(seconds=901)
+        self.assertIsNotNone(scheduler.acquire(self.job, later))
+
+    def test_run_releases_and_reschedules(self):
+        self.assertEqual(scheduler.run_job(self.job, self.now)[0], "ok")
+        self.assertIsNone(scheduler.run_job(self.job, self.now))
+        self.assertEqual(len(self.calls), 1)
+        lease = JobLease.objects.get(name="test")
+        self.assertIsNone(lease.leased_until)
+        self.assertEqual((lease.runs, lease.last_status), (1, "ok"))
+        # One run catches up; the ten whole intervals it covered were missed
+        self.assertEqual(lease.missed, 10)
+        self.assertGreaterEqual(lease.next_run_at, self.now + timedelta(seconds=60))
+        # Free again, so a forced run goes ahead before it's due
+        self.assertEqual(scheduler.run_job(self.job, self.now, force=True)[0], "ok")
+        self.assertEqual(len(self.calls), 2)
+
+
+class PlanStatsTests(TestCase):
+    """Plan counters follow investments through their life, and reconcile"""
+
+    def setUp(self):
+        self.user = User.objects.create_user("investor")
+        Amount.objects.create(user=self.user, amount=Decimal("0.00"))
+        self.plan = InvestmentPlan.objects.create(
+            title="Starter",
+            daily_earnings_percentage=Decimal("1.00"),
+            investment_duration_days=10,
+        )
+        self.admin = InvestmentAdmin(Investment, admin.site)
+
+    def invest(self, amount, record=True):
+        investment = Investment.objects.create(
+            user=self.user,
+            investment_plan=self.plan,
+            amount=Decimal(amount),
+            status="PENDING",
+        )
+        if record:
+            # As the invest view does
+            planstats.record([(None, planstats.row(investment))])
+        return investment
+
+    def stats(self):
+        """(investors, active, aum cents, pending, pending cents)"""
+        stats = InvestmentPlanStats.objects.get(plan=self.plan)
+        return (
+            stats.investors,
+            stats.active_investments,
+            stats.aum.cents,
+            stats.pending_investments,
+            stats.pending_amount.cents,
+        )
+
+    def test_counters_follow_each_change(self):
+        first, second = self.invest("100.00"), self.invest("50.00")
+        self.assertEqual(self.stats(), (0, 0, 0, 2, 15000))
+
+        self.admin._set_status(Investment.objects.filter(pk=first.pk), "ACTIVE")
+        self.assertEqual(self.stats(), (1, 1, 10000, 1, 5000))
+        # A second active investment by the same user is not a new investor
+        self.admin._set_status(Investment.objects.filter(pk=second.pk), "ACTIVE")
+        self.assertEqual(self.stats(), (1, 2, 15000, 0, 0))
+
+        settlement.complete(Investment.objects.filter(pk=first.pk))
+        self.assertEqual(self.stats(), (1, 1, 5000, 0, 0))
+        second.refresh_from_db()
+        self.admin.delete_model(None, second)
+        self.assertEqual(self.stats(), (0, 0, 0, 0, 0))
+        self.assertEqual(planstats.reconcile(), 0)
+
+    def test_reconcile_corrects_drift(self):
+        self.invest("100.00")
+        # Made outside anything that records it, like a shell or bulk SQL
+        unrecorded = self.invest("40.00", record=False)
+        Investment.objects.filter(pk=unrecorded.pk).update(status="ACTIVE")
+        self.assertEqual(planstats.reconcile(), 1)
+        self.assertEqual(self.stats(), (1, 1, 4000, 1, 10000))
+        self.assertEqual(planstats.reconcile(), 0)
+
+
+class ReplicaRoutingTests(TestCase):
+    """Reads go to a replica only where it's safe to"""
+
+    def setUp(self):
+        self.router = routers.ReplicaRouter()
+        # A "replica" alias, without a second database behind it
+        mock.patch.object(routers, "get_replicas", return_value=["replica"]).start()
+        self.usable = mock.patch.object(
+            routers.health, "is_usable", return_value=True
+        ).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def read(self):
+        return self.router.db_for_read(Investment)
+
+    def test_reads_use_the_replica_only_inside_replica(self):
+        self.assertIsNone(self.read())
+        with routers.replica():
+            self.assertEqual(self.read(), "replica")
+            self.usable.return_value = False
+            self.assertIsNone(self.read())
+
+    def test_a_write_pins_the_rest_of_the_block(self):
+        with routers.replica():
+            self.router.db_for_write(Investment)
+            self.assertIsNone(self.read())
+
+    def middleware_reads(self, request):
+        reads = []
+
+        def view(request):
+            with routers.replica():
+                reads.append(self.read())
+                if request.GET.get("write"):
+                    self.router.db_for_write(Investment)
+            return HttpResponse()
+
+        response = routers.ReplicaPinMiddleware(view)(request)
+        return reads[0], response
+
+    def test_middleware_pins_unsafe_methods_and_recent_writers(self):
+        factory = RequestFactory()
+        self.assertEqual(self.middleware_reads(factory.get("/"))[0], "replica")
+        self.assertIsNone(self.middleware_reads(factory.post("/"))[0])
+        read, response = self.middleware_reads(factory.get("/", {"write": "1"}))
+        self.assertEqual(read, "replica")
+        self.assertIn(routers.PIN_COOKIE, response.cookies)
+        pinned = factory.get("/")
+        pinned.COOKIES[routers.PIN_COOKIE] = "1"
+        self.assertIsNone(self.middleware_reads(pinned)[0])
+
+    @override_settings(REPLICA_MAX_LAG=10, REPLICA_CHECK_INTERVAL=60)
+    def test_lag_is_checked_at_most_once_an_interval(self):
+        health = routers.ReplicaHealth()
+        with mock.patch.object(routers, "replica_lag", return_value=30) as lag:
+            self.assertFalse(health.is_usable("replica"))
+            self.assertFalse(health.is_usable("replica"))
+        self.assertEqual(lag.call_count, 1)
+
+
+class PlanBackfillTests(TestCase):
+    """Legacy plan names and wallets move to the real columns in batches"""
+
+    def setUp(self):
+        self.user = User.objects.create_user("investor")
+        self.gold, self.silver = (
+            InvestmentPlan.objects.create(
+                title=title,
+                daily_earnings_percentage=Decimal("1.00"),
+                investment_duration_days=10,
+            )
+            for title in ("Gold Plan", "Silver Plan")
+        )
+        self.legacy = [
+            Investment.objects.create(
+                user=self.user,
+                amount=Decimal("100.00"),
+                status="ACTIVE",
+                plan=name,
+                wallet_address="wallet",
+            )
+            for name in ("gold package", "Silver", "Platinum")
+        ]
+        # As rows saved before wallet_address_used existed
+        Investment.objects.update(wallet_address_used=None)
+
+    def backfill(self, *args):
+        stdout = StringIO()
+        call_command(
+            "backfill_investment_plans", "--batch-size=2", *args, stdout=stdout
+        )
+        return stdout.getvalue()
+
+    def test_save_no_longer_looks_up_the_plan(self):
+        with self.assertNumQueries(1):
+            Investment(user=self.user, amount=Decimal("1.00"), plan="Gold").save()
+
+    def test_dry_run_writes_nothing(self):
+        output = self.backfill("--dry-run")
+        self.assertIn("\nInvestments: 3 row(s) to update", output)
+        self.assertFalse(Investment.objects.filter(wallet_address_used="wallet"))
+
+    def test_fills_the_columns_and_counts_the_plans(self):
+        output = self.backfill()
+        self.assertIn("No plan found for: Platinum", output)
+        plans = dict(Investment.objects.values_list("plan", "investment_plan_id"))
+        self.assertEqual(
+            plans,
+            {"gold package": self.gold.pk, "Silver": self.silver.pk, "Platinum": None},
+        )
+        self.assertEqual(
+            Investment.objects.filter(wallet_address_used="wallet").count(), 3
+        )
+        self.assertEqual(self.gold.stats.active_investments, 1)
+        # Only the unresolvable name is left, and it stays unresolved
+        self.assertIn("\nInvestments: 0 row(s) updated, 1 legacy", self.backfill())
+
+
+class ForecastTests(TestCase):
+    """Liability curves from the active book"""
+
+    def book(self):
+        book = forecast.Book(timezone.now().date(), ["Starter"])
+        # $1 a day, last accrued 3 days ago, $100 back in 5 days
+        book.add(0, 1.0, 100.0, -3, 5)
+        book.withdrawals = 25.0
+        return book
+
+    def test_curves(self):
+        result = forecast.forecast(self.book(), horizon=10)
+        self.assertEqual(result.accruals, [3, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0])
+        self.assertEqual(result.deposits, [0] * 5 + [100] + [0] * 5)
+        self.assertEqual(
+            result.totals(10),
+            {"accruals": 8, "deposits": 100, "withdrawals": 25, "total": 133},
+        )
+        self.assertEqual(result.cumulative()[-1], 133)
+
+    @skipIf(forecast.np is None, "NumPy isn't installed")
+    def test_numpy_and_python_agree(self):
+        book = forecast.Book.synthetic(500, seed=1)
+        for fast, slow in zip(
+            forecast._curves_numpy(book, 90), forecast._curves_python(book, 90)
+        ):
+            for fast_curve, slow_curve in zip(fast, slow):
+                for a, b in zip(fast_curve, slow_curve):
+                    self.assertAlmostEqual(a, b, places=6)
+
+    def test_loads_the_active_book(self):
+        user = User.objects.create_user("investor")
+        plan = InvestmentPlan.objects.create(
+            title="Starter",
+            daily_earnings_percentage=Decimal("2.00"),
+            investment_duration_days=10,
+            deposit_return=True,
+        )
+        today = timezone.now().date()
+        for status in ("ACTIVE", "COMPLETED"):
+            Investment.objects.create(
+                user=user, investment_plan=plan, amount=Decimal("100"), status=status
+            )
+        Investment.objects.update(
+            date_invested=timezone.now() - timedelta(days=4),
+            matures_at=timezone.now() + timedelta(days=6),
+            last_accrued_on=today - timedelta(days=2),
+        )
+        WithdrawalRequest.objects.create(
+            user=user,
+            amount=Decimal("25.00"),
+            withdrawal_method="bank",
+            account_details="123",
+        )
+        book = forecast.Book.load(today)
+        self.assertEqual(len(book), 1)
+        self.assertEqual(
+            (book.daily[0], book.deposit[0], book.start[0], book.end[0]),
+            (2.0, 100.0, -2, 6),
+        )
+        self.assertEqual(book.withdrawals, 25.0)
+
+
+class PortfolioSnapshotTests(TestCase):
+    """A snapshot is written when a user's numbers change, and kept monthly"""
+
+    def setUp(self):
+        self.user = User.objects.create_user("investor")
+        plan = InvestmentPlan.objects.create(
+            title="Starter",
+            daily_earnings_percentage=Decimal("1.00"),
+            investment_duration_days=10,
+        )
+        Investment.objects.create(
+            user=self.user, investment_plan=plan, amount=Decimal("100"), status="ACTIVE"
+        )
+        Amount.objects.create(user=self.user, amount=Decimal("50.00"))
+        self.today = timezone.now().date()
+
+    def test_records_only_changes(self):
+        yesterday = self.today - timedelta(days=1)
+        self.assertEqual(snapshots.record(yesterday), 1)
+        self.assertEqual(snapshots.record(yesterday), 0)
+        self.assertEqual(snapshots.record(self.today), 0)
+        Amount.objects.filter(user=self.user).update(amount=Decimal("75.00"))
+        self.assertEqual(snapshots.record(self.today), 1)
+        self.assertEqual(
+            snapshots.series(self.user, days=30, today=self.today),
+            [
+                (yesterday, Money(10000), Money(0), Money(0), Money(5000)),
+                (self.today, Money(10000), Money(0), Money(0), Money(7500)),
+            ],
+        )
+
+    def test_downsamples_to_the_last_of_each_month(self):
+        old = self.today.replace(day=1) - timedelta(days=365)
+        days = [old + timedelta(days=n) for n in (0, 5, 40)]
+        PortfolioSnapshot.objects.bulk_create(
+            PortfolioSnapshot(user=self.user, day=day, balance=n)
+            for n, day in enumerate(days)
+        )
+        self.assertEqual(snapshots.downsample(self.today), 1)
+        kept = PortfolioSnapshot.objects.order_by("day").values_list("day", flat=True)
+        self.assertEqual(list(kept), days[1:])
+        # The chart starts from the last point before its window
+        points = snapshots.series(self.user, days=30, today=self.today)
+        self.assertEqual([point[0] for point in points], [days[2]])
+
+
+@override_settings(STREAM_CHUNK_SIZE=2)
+class StreamedHistoryTests(TestCase):
+    """The history page streams every row, hot and archived, in order"""
+
+    def setUp(self):
+        self.user = User.objects.create_user("investor")
+        plan = InvestmentPlan.objects.create(
+            title="Starter",
+            daily_earnings_percentage=Decimal("1.00"),
+            investment_duration_days=10,
+        )
+        for n in range(1, 5):
+            investment = Investment.objects.create(
+                user=self.user, investment_plan=plan, amount=Decimal(100 + n)
+            )
+            Investment.objects.filter(pk=investment.pk).update(
+                date_invested=timezone.now() - timedelta(days=n)
+            )
+        ArchivedInvestment.objects.create(
+            id=10_000,
+            user=self.user,
+            investment_plan=plan,
+            amount=Decimal("105"),
+            status="COMPLETED",
+            date_invested=timezone.now() - timedelta(days=400),
+            archived_at=timezone.now(),
+        )
+
+    async def history(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get("/history/")
+        if response.streaming:
+            content = b"".join([chunk async for chunk in response.streaming_content])
+        else:
+            content = response.content
+        return response, content.decode()
+
+    def amounts(self, content):
+        return re.findall(r'"text-primary">\$([\d.]+)<', content)
+
+    async def test_streams_rows_between_head_and_tail(self):
+        response, content = await self.history()
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["X-Accel-Buffering"], "no")
+        self.assertEqual(
+            self.amounts(content), ["101.00", "102.00", "103.00", "104.00", "105.00"]
+        )
+        self.assertNotIn(streaming.MARKER, content)
+        self.assertTrue(content.rstrip().endswith("</html>"))
+
+    @override_settings(STREAM_HISTORY=False)
+    async def test_renders_in_one_go_when_off(self):
+        response, content = await self.history()
+        self.assertFalse(response.streaming)
+        self.assertEqual(len(self.amounts(content)), 5)
+
+
+@skipIf(connection.vendor != "sqlite", "Runs on SQLite")
+class SqliteTuningTests(TestCase):
+    """New SQLite connections get the tuned pragmas when SQLITE_TUNED is on"""
+
+    def pragmas(self, alias="tuned"):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        settings_dict = {**connection.settings_dict, "NAME": f"{directory}/db.sqlite3"}
+        tuned = DatabaseWrapper(settings_dict, alias=alias)
+        self.addCleanup(tuned.close)
+        with tuned.cursor() as cursor:
+            values = {}
+            for name in ("journal_mode", "synchronous", "busy_timeout"):
+                cursor.execute(f"PRAGMA {name}")
+                values[name] = cursor.fetchone()[0]
+        return values
+
+    @override_settings(SQLITE_TUNED=False)
+    def test_off_by_default(self):
+        self.assertEqual(self.pragmas()["journal_mode"], "delete")
+
+    @override_settings(SQLITE_TUNED=True, SQLITE_PRAGMAS={"busy_timeout": 500})
+    def test_tuned_connection(self):
+        self.assertEqual(
+            self.pragmas(),
+            # synchronous=NORMAL is 1
+            {"journal_mode": "wal", "synchronous": 1, "busy_timeout": 500},
+        )
+
+    @override_settings(SQLITE_TUNED=True, REPLICA_DATABASES=["replica"])
+    def test_replicas_keep_their_journal(self):
+        self.assertEqual(self.pragmas("replica")["journal_mode"], "delete")
+
+
+class CollectingHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+        self.addFilter(logs.RequestFilter())
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class StructuredLoggingTests(TestCase):
+    def queue_logger(self, **options):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = Path(directory) / "app.log"
+        handler = logs.QueueHandler(sinks=[str(path)], **options)
+        self.addCleanup(handler.close)
+        logger = logging.getLogger("hotmine.tests.queue")
+        logger.addHandler(handler)
+        self.addCleanup(logger.removeHandler, handler)
+        return logger, handler, path
+
+    def lines(self, path):
+        return [json.loads(line) for line in path.read_text().splitlines()]
+
+    def test_writes_json_lines_off_the_calling_thread(self):
+        logger, handler, path = self.queue_logger()
+        logger.warning("paid %s", "twice", extra={"order": 7})
+        handler.close()
+        (line,) = self.lines(path)
+        self.assertEqual(line["msg"], "paid twice")
+        self.assertEqual((line["level"], line["order"]), ("WARNING", 7))
+
+    def test_full_queue_drops_and_counts(self):
+        logger, handler, path = self.queue_logger(queue_size=1)
+        handler.listener.stop()
+        for n in range(3):
+            logger.warning("record %s", n)
+        handler.listener.start()
+        handler.close()
+        messages = [line["msg"] for line in self.lines(path)]
+        self.assertEqual(messages, ["record 0", "Log queue full, dropped 2 record(s)"])
+
+    def request_records(self, **headers):
+        handler = CollectingHandler()
+        requests_logger = logging.getLogger("hotmine.requests")
+        requests_logger.addHandler(handler)
+        self.addCleanup(requests_logger.removeHandler, handler)
+        response = self.client.get("/", headers=headers)
+        return response, handler.records
+
+    def test_requests_are_logged_with_their_id(self):
+        response, (record,) = self.request_records(x_request_id="trace-1")
+        self.assertEqual(response["X-Request-ID"], "trace-1")
+        self.assertEqual((record.request_id, record.status), ("trace-1", 200))
+        # Not something a client can write anything into
+        response, _ = self.request_records(x_request_id="no spaces, please")
+        self.assertRegex(response["X-Request-ID"], "^[0-9a-f]{32}$")
+
+    @override_settings(LOG_SAMPLING={"home": 0})
+    def test_unsampled_requests_skip_info(self):
+        response, records = self.request_records()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(records, [])
+
+
+@override_settings(TRACING=True, TRACING_SLOW_MS=0, TRACING_SAMPLE_RATE=0)
+class TracingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def trace(self, path="/"):
+        """The trace recorded for one request through the traced handler"""
+        handler = tracing.TracedWSGIHandler()
+        with mock.patch.object(tracing.exporter, "put") as put:
+            with connection.execute_wrapper(tracing.trace_sql):
+                handler.get_response(RequestFactory().get(path)).close()
+        return put.call_args[0][0].as_dict() if put.called else None
+
+    def test_spans_cover_middleware_view_sql_and_templates(self):
+        trace = self.trace()
+        self.assertEqual((trace["name"], trace["status"]), ("GET /", 200))
+        spans = {span["id"]: span for span in trace["spans"]}
+        kinds = {span["kind"] for span in spans.values()}
+        self.assertLessEqual(
+            {"request", "middleware", "handler", "view", "sql", "template"}, kinds
+        )
+        (view,) = [span for span in spans.values() if span["kind"] == "view"]
+        self.assertEqual(view["name"], "hotmine.views.home")
+        self.assertEqual(spans[view["parent"]]["kind"], "handler")
+        for span in spans.values():
+            if span["kind"] == "sql":
+                self.assertNotIn("%s", span["name"])
+        rows = tracing.waterfall(trace)
+        self.assertEqual((rows[0]["kind"], rows[0]["depth"]), ("request", 0))
+
+    @override_settings(TRACING_SLOW_MS=60_000)
+    def test_fast_requests_are_sampled(self):
+        self.assertIsNone(self.trace())
+
+    @override_settings(TRACING_MAX_SPANS=3)
+    def test_spans_past_the_limit_are_counted(self):
+        trace = self.trace()
+        self.assertEqual(len(trace["spans"]), 3)
+        self.assertGreater(trace["dropped_spans"], 0)
+
+    def test_exported_traces_are_read_back(self):
+        trace = self.trace()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        with override_settings(TRACING_FILE=f"{directory}/traces.jsonl"):
+            tracing.write_jsonl([trace])
+            self.assertEqual(tracing.recent()[0]["trace_id"], trace["trace_id"])
+            self.assertEqual(tracing.find(trace["trace_id"])["name"], "GET /")
+        payload = tracing.otlp([trace])
+        (spans,) = payload["resourceSpans"][0]["scopeSpans"]
+        self.assertEqual(len(spans["spans"]), len(trace["spans"]))
@@ -0,0 +1,541 @@
+"""
+Request tracing: where a slow request's time went.
+
+With TRACING on, every request through the traced handlers (myproject/asgi.py
+and wsgi.py) records a tree of spans:
+
+    request     the whole of Django's handling, named after the method and path
+    middleware  one per MIDDLEWARE entry, each inside the one before it and
+                covering everything after it; session loads and saves show
+                up under SessionMiddleware
+    handler     URL resolution, process_view hooks, the view and rendering a
+                TemplateResponse
+    view        the view function
+    sql         every query, with its statement (never its parameters)
+    template    every template rendered through the Django backend, which is
+                hotmine.tracing.DjangoTemplates; includes aren't separate
+
+Whatever a span took beyond its children is Python in that span.
+
+Which traces are kept is decided when the request ends: every request that
+took TRACING_SLOW_MS or longer, and TRACING_SAMPLE_RATE of the rest. The
+others are dropped. Kept traces go onto a queue that a background thread
+exports, so the request never waits on it:
+
+    jsonl  one trace per line appended to TRACING_FILE, which the admin's
+           traces page (/admin/traces/) reads and draws as waterfalls
+    otlp   POSTed as OTLP/HTTP JSON to TRACING_OTLP_ENDPOINT, a collector's
+           /v1/traces
+
+Streamed bodies (the history pages) go out after the handler returns, so
+their traces end with the page head.
+
+Settings:
+    TRACING                record traces (default False)
+    TRACING_SAMPLE_RATE    share of the fast requests kept (default 0.01)
+    TRACING_SLOW_MS        requests at least this slow are always kept (default 500)
+    TRACING_MAX_SPANS      spans recorded per request, the rest counted (default 1000)
+    TRACING_EXPORT         exporters, from "jsonl" and "otlp" (default ["jsonl"])
+    TRACING_FILE           the JSONL file
+    TRACING_FILE_MAX_MB    size at which it's rotated to TRACING_FILE.1 (default 20)
+    TRACING_OTLP_ENDPOINT  OTLP/HTTP traces URL
+    TRACING_SERVICE_NAME   service.name for OTLP (default hotmine)
+"""
+
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+import django
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.template import TemplateDoesNotExist
+from django.template.backends import django as django_backend
+
+logger = logging.getLogger(__name__)
+
+# Longest SQL statement kept on a span
+STATEMENT_LIMIT = 2000
+
+# OTLP span kinds
+OTLP_KINDS = {"request": 2, "sql": 3}
+OTLP_INTERNAL = 1
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def enabled():
+    return _setting("TRACING", False)
+
+
+class Span:
+    __slots__ = ("span_id", "parent_id", "name", "kind", "start", "end", "attributes")
+
+    def __init__(self, name, kind, parent_id, attributes):
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start = time.perf_counter_ns()
+        self.end = None
+        self.attributes = attributes
+
+    def finish(self):
+        self.end = time.perf_counter_ns()
+
+
+class Trace:
+    def __init__(self):
+        self.trace_id = os.urandom(16).hex()
+        # Spans are timed on the monotonic clock, exported against this
+        self.epoch = time.time_ns() - time.perf_counter_ns()
+        self.spans = []
+        self.dropped = 0
+
+    def start(self, name, kind, parent, attributes):
+        if len(self.spans) >= _setting("TRACING_MAX_SPANS", 1000):
+            self.dropped += 1
+            return None
+        span = Span(name, kind, parent.span_id if parent else None, attributes)
+        self.spans.append(span)
+        return span
+
+    def as_dict(self):
+        root = self.spans[0]
+        return {
+            "trace_id": self.trace_id,
+            "name": root.name,
+            "start": self.epoch + root.start,
+            "duration_ms": (root.end - root.start) / 1e6,
+            "request_id": root.attributes.get("request_id"),
+            "status": root.attributes.get("http.status_code"),
+            "dropped_spans": self.dropped,
+            "spans": [
+                {
+                    "id": span.span_id,
+                    "parent": span.parent_id,
+                    "name": span.name,
+                    "kind": span.kind,
+                    "start": self.epoch + span.start,
+                    # Unfinished when the request ended, e.g. an open cursor
+                    "end": self.epoch + (span.end or root.end),
+                    "attributes": span.attributes,
+                }
+                for span in self.spans
+            ],
+        }
+
+
+# (trace, current span) for the code running now
+_current = ContextVar("hotmine_trace", default=None)
+
+
+@contextmanager
+def span(name, kind="internal", **attributes):
+    """Record the block as a child of the current span, when tracing"""
+    current = _current.get()
+    if current is None:
+        yield None
+        return
+    trace, parent = current
+    child = trace.start(name, kind, parent, attributes)
+    if child is None:
+        yield None
+        return
+    token = _current.set((trace, child))
+    try:
+        yield child
+    finally:
+        _current.reset(token)
+        child.finish()
+
+
+def _keep(trace):
+    root = trace.spans[0]
+    if (root.end - root.start) / 1e6 >= _setting("TRACING_SLOW_MS", 500):
+        return True
+    return random.random() < _setting("TRACING_SAMPLE_RATE", 0.01)
+
+
+@contextmanager
+def record(request):
+    """Trace handling `request`; yields the root span"""
+    trace = Trace()
+    root = trace.start(f"{request.method} {request.path}", "request", None, {})
+    token = _current.set((trace, root))
+    try:
+        yield root
+    finally:
+        _current.reset(token)
+        root.finish()
+        match = getattr(request, "resolver_match", None)
+        if match:
+            root.attributes["view"] = match.view_name
+        root.attributes["request_id"] = getattr(request, "request_id", None)
+        if _keep(trace):
+            exporter.put(trace)
+
+
+# -- Instrumentation ----------------------------------------------------------
+
+
+def _wrap(function, is_async, name, kind, **attributes):
+    if is_async:
+
+        @wraps(function)
+        async def traced(*args, **kwargs):
+            with span(name, kind, **attributes):
+                return await function(*args, **kwargs)
+
+    else:
+
+        @wraps(function)
+        def traced(*args, **kwargs):
+            with span(name, kind, **attributes):
+                return function(*args, **kwargs)
+
+    return traced
+
+
+class TracedHandlerMixin:
+    """
+    Django's handler, with the spans above. A middleware is handed the rest
+    of the chain to call through adapt_method_mode, so that's where the
+    next one's span goes; the first one's goes around the whole chain.
+    """
+
+    def load_middleware(self, is_async=False):
+        super().load_middleware(is_async)
+        if enabled() and settings.MIDDLEWARE:
+            path = settings.MIDDLEWARE[0]
+            self._middleware_chain = _wrap(
+                self._middleware_chain,
+                is_async,
+                path.rsplit(".", 1)[-1],
+                "middleware",
+                path=path,
+            )
+
+    def adapt_method_mode(
+        self, is_async, method, method_is_async=None, debug=False, name=None
+    ):
+        adapted = super().adapt_method_mode(
+            is_async, method, method_is_async, debug, name
+        )
+        if not enabled() or not (name or "").startswith("middleware "):
+            return adapted
+        # `adapted` is what this middleware calls: the next one, or the
+        # handler after the last
+        middleware = list(settings.MIDDLEWARE)
+        index = middleware.index(name.split(" ", 1)[1]) + 1
+        if index == len(middleware):
+            return _wrap(adapted, is_async, "handler", "handler")
+        path = middleware[index]
+        return _wrap(
+            adapted, is_async, path.rsplit(".", 1)[-1], "middleware", path=path
+        )
+
+    def make_view_atomic(self, view):
+        view = super().make_view_atomic(view)
+        if not enabled():
+            return view
+        name = f"{view.__module__}.{getattr(view, '__qualname__', view.__name__)}"
+        return _wrap(view, iscoroutinefunction(view), name, "view")
+
+    def get_response(self, request):
+        if not enabled():
+            return super().get_response(request)
+        with record(request) as root:
+            response = super().get_response(request)
+            root.attributes["http.status_code"] = response.status_code
+        return response
+
+    async def get_response_async(self, request):
+        if not enabled():
+            return await super().get_response_async(request)
+        with record(request) as root:
+            response = await super().get_response_async(request)
+            root.attributes["http.status_code"] = response.status_code
+        return response
+
+
+class TracedASGIHandler(TracedHandlerMixin, ASGIHandler):
+    pass
+
+
+class TracedWSGIHandler(TracedHandlerMixin, WSGIHandler):
+    pass
+
+
+def get_asgi_application():
+    """django.core.asgi.get_asgi_application(), traced"""
+    django.setup(set_prefix=False)
+    return TracedASGIHandler()
+
+
+def get_wsgi_application():
+    """django.core.wsgi.get_wsgi_application(), traced"""
+    django.setup(set_prefix=False)
+    return TracedWSGIHandler()
+
+
+def trace_sql(execute, sql, params, many, context):
+    if _current.get() is None:
+        return execute(sql, params, many, context)
+    with span(
+        sql.split(None, 1)[0].upper() if sql else "SQL",
+        "sql",
+        statement=sql[:STATEMENT_LIMIT],
+        database=context["connection"].alias,
+        many=many,
+    ):
+        return execute(sql, params, many, context)
+
+
+@receiver(connection_created)
+def trace_connection(sender, connection, **kwargs):
+    if enabled() and trace_sql not in connection.execute_wrappers:
+        connection.execute_wrappers.append(trace_sql)
+
+
+class Template(django_backend.Template):
+    def render(self, context=None, request=None):
+        with span(self.template.name or "<string>", "template"):
+            return super().render(context, request)
+
+
+class DjangoTemplates(django_backend.DjangoTemplates):
+    """The Django template backend, with a span per render"""
+
+    def from_string(self, template_code):
+        return Template(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return Template(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            django_backend.reraise(exc, self)
+
+
+# -- Export -------------------------------------------------------------------
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def otlp(traces):
+    """OTLP/HTTP JSON for a list of trace dicts"""
+    spans = []
+    for trace in traces:
+        for span in trace["spans"]:
+            attributes = {"hotmine.kind": span["kind"], **span["attributes"]}
+            spans.append(
+                {
+                    "traceId": trace["trace_id"],
+                    "spanId": span["id"],
+                    "parentSpanId": span["parent"] or "",
+                    "name": span["name"],
+                    "kind": OTLP_KINDS.get(span["kind"], OTLP_INTERNAL),
+                    "startTimeUnixNano": str(span["start"]),
+                    "endTimeUnixNano": str(span["end"]),
+                    "attributes": [
+                        {"key": key, "value": _otlp_value(value)}
+                        for key, value in attributes.items()
+                        if value is not None
+                    ],
+                }
+            )
+    service = _setting("TRACING_SERVICE_NAME", "hotmine")
+    return {
+        "resourceSpans": [
+            {
+                "resource": {
+                    "attributes": [
+                        {"key": "service.name", "value": {"stringValue": service}}
+                    ]
+                },
+                "scopeSpans": [{"scope": {"name": __name__}, "spans": spans}],
+            }
+        ]
+    }
+
+
+def write_jsonl(traces):
+    path = _setting("TRACING_FILE", "traces.jsonl")
+    try:
+        if os.path.getsize(path) > _setting("TRACING_FILE_MAX_MB", 20) * 1024 * 1024:
+            os.replace(path, f"{path}.1")
+    except FileNotFoundError:
+        pass
+    lines = "".join(
+        json.dumps(trace, default=str, separators=(",", ":")) + "\n" for trace in traces
+    )
+    # One append per batch, so processes sharing the file don't interleave
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(lines)
+
+
+def post_otlp(traces):
+    request = urllib.request.Request(
+        _setting("TRACING_OTLP_ENDPOINT", "http://localhost:4318/v1/traces"),
+        data=json.dumps(otlp(traces), default=str).encode(),
+        headers={"Content-Type": "application/json"},
+    )
+    with urllib.request.urlopen(request, timeout=5):
+        pass
+
+
+EXPORTERS = {"jsonl": write_jsonl, "otlp": post_otlp}
+
+
+class Exporter:
+    """Exports kept traces in batches from a thread, started on first use"""
+
+    def __init__(self, size=100, batch_size=50):
+        self.traces = queue.Queue(size)
+        self.batch_size = batch_size
+        self.lock = threading.Lock()
+        self.pid = None
+
+    def put(self, trace):
+        self._ensure_thread()
+        try:
+            self.traces.put_nowait(trace)
+        except queue.Full:
+            # Exporting can't keep up; better a missing trace than a wait
+            pass
+
+    def _ensure_thread(self):
+        # Per process: a forked worker inherits the queue but not the thread
+        if self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid != os.getpid():
+                self.traces = queue.Queue(self.traces.maxsize)
+                threading.Thread(
+                    target=self.run, name="hotmine-trace-exporter", daemon=True
+                ).start()
+                self.pid = os.getpid()
+
+    def run(self):
+        while True:
+            batch = [self.traces.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.traces.get_nowait())
+                except queue.Empty:
+                    break
+            self.export([trace.as_dict() for trace in batch])
+
+    def export(self, traces):
+        for name in _setting("TRACING_EXPORT", ["jsonl"]):
+            try:
+                EXPORTERS[name](traces)
+            except Exception as e:
+                logger.warning(
+                    "Exporting %s trace(s) to %s failed: %s", len(traces), name, e
+                )
+
+
+exporter = Exporter()
+
+
+# -- Reading ------------------------------------------------------------------
+
+
+def _lines_from_end(path, block=64 * 1024):
+    """The file's lines, last first"""
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        rest = b""
+        while position > 0:
+            step = min(block, position)
+            position -= step
+            f.seek(position)
+            lines = (f.read(step) + rest).split(b"\n")
+            rest = lines.pop(0)
+            for line in reversed(lines):
+                if line:
+                    yield line
+        if rest:
+            yield rest
+
+
+def recent(limit=200):
+    """The last `limit` exported traces, newest first, from TRACING_FILE"""
+    traces = []
+    try:
+        for line in _lines_from_end(_setting("TRACING_FILE", "traces.jsonl")):
+            try:
+                traces.append(json.loads(line))
+            except ValueError:
+                continue
+            if len(traces) >= limit:
+                break
+    except FileNotFoundError:
+        pass
+    return traces
+
+
+def find(trace_id):
+    try:
+        for line in _lines_from_end(_setting("TRACING_FILE", "traces.jsonl")):
+            if trace_id.encode() in line:
+                trace = json.loads(line)
+                if trace["trace_id"] == trace_id:
+                    return trace
+    except FileNotFoundError:
+        pass
+    return None
+
+
+def waterfall(trace):
+    """
+    The trace's spans depth first, each with its depth and its offset and
+    width as percentages of the request
+    """
+    children = {}
+    for span in trace["spans"]:
+        children.setdefault(span["parent"], []).append(span)
+    start = trace["spans"][0]["start"]
+    total = max(trace["spans"][0]["end"] - start, 1)
+    rows = []
+
+    def visit(span, depth):
+        rows.append(
+            {
+                **span,
+                "depth": depth,
+                "ms": (span["end"] - span["start"]) / 1e6,
+                "offset": (span["start"] - start) * 100 / total,
+                "width": max((span["end"] - span["start"]) * 100 / total, 0.2),
+            }
+        )
+        for child in sorted(children.get(span["id"], []), key=lambda s: s["start"]):
+            visit(child, depth + 1)
+
+    for root in children.get(None, []):
+        visit(root, 0)
+    return rows
@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import api, live, views
 
 urlpatterns = [
     path("", views.home, name="home"),
@@ -10,9 +10,17 @@ urlpatterns = [
     path("dashboard/", views.dashboard, name="dashboard"),
     path("packages/", views.package_view, name="packages"),
     path("invest/", views.invest_view, name="invest"),
+    path("plans/<int:plan_id>/", views.get_plan_details, name="plan_details"),
     path("success/", views.investment_success, name="investment_success"),
     path("my-investments/", views.investment_record, name="my_investments"),
     path("buy/", views.buy_view, name="buy"),
+    path("api/prices/", views.price_feed, name="price_feed"),
+    path("api/v1/summary/", api.summary, name="api_v1_summary"),
+    path("api/v1/investments/", api.investments, name="api_v1_investments"),
+    path("api/v1/withdrawals/", api.withdrawals, name="api_v1_withdrawals"),
+    path("api/v1/dashboard/", api.dashboard, name="api_v1_dashboard"),
+    path("api/v1/portfolio/", api.portfolio, name="api_v1_portfolio"),
+    path("events/", live.events, name="live_events"),
     path("updatepassword/", views.change_password, name="update_password"),
     path("withdraw/", views.withdraw_view, name="withdraw"),
     path("history/", views.investment_history_view, name="transactions"),
@@ -1,10 +1,17 @@
+import asyncio
+import time
+
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect, get_object_or_404
-from django.contrib.auth import login, authenticate, logout
+from django.contrib.auth import alogin, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.urls import reverse
 from django.http import JsonResponse
 from django.core.paginator import Paginator
+from django.db.models import Count, Q, Sum
+from django.conf import settings
+from django.utils.cache import get_conditional_response, patch_cache_control
 from .forms import (
     SignUpForm,
     LoginForm,
@@ -13,8 +20,14 @@ from .forms import (
     EmailVerificationForm,
 )
 from django.views.decorators.csrf import csrf_protect
+from django.views.decorators.gzip import gzip_page
 from django.utils.decorators import method_decorator
 from django.views import View
+from . import hashing, planstats, prices, ratelimit, streaming
+from .money import Money
+from .caching import cache_anonymous_page, cache_page_shell
+from .routers import use_replica
+from .catalog import get_active_plan, get_active_plans_with_stats, get_catalog_version
 
 
 # Add these to your existing forms import
@@ -29,35 +42,50 @@ from .models import (
 )
 
 
-def home(request):
-    return render(request, "hotmine/home.html")
+def rate_limited(request, template_name, context, decision):
+    """Re-render a credential form with a 429 when the rate limiter says no"""
+    minutes = max(1, round(decision.retry_after / 60))
+    messages.error(
+        request, f"Too many attempts. Please try again in {minutes} minute(s)."
+    )
+    response = render(request, template_name, context, status=429)
+    response["Retry-After"] = str(decision.retry_after)
+    return response
 
 
-def dashboard(request):
-    user = request.user
+async def arender(request, template_name, context=None, status=None):
+    """
+    render() for async views. The user is resolved with the async ORM first,
+    since templates reading request.user would otherwise load it synchronously
+    in the middle of rendering.
+    """
+    request.user = await request.auser()
+    return render(request, template_name, context, status=status)
 
-    amount_obj = Amount.objects.filter(user=user).first()
-    earnings_obj = Totalearnings.objects.filter(user=user).first()
-    withdraw_obj = totalwithdraw.objects.filter(user=user).first()
 
-    context = {
-        "user": user,
-        "amount": amount_obj.amount if amount_obj else 0,
-        "total_earnings": earnings_obj.total_earnings if earnings_obj else 0,
-        "total_withdraw": withdraw_obj.total_withdraw if withdraw_obj else 0,
-    }
+@cache_anonymous_page(60 * 15, cdn_max_age=300)
+def home(request):
+    return render(request, "hotmine/home.html")
+
 
-    return render(request, "hotmine/dashboard.html", context)
+@login_required
+@cache_page_shell(60 * 5)
+async def dashboard(request):
+    # Balances and the referral link are filled in from /api/v1/dashboard/
+    return await arender(request, "hotmine/dashboard.html")
 
 
 def package_view(request):
     if request.user.is_authenticated:
-        # Get all active investment plans ordered by sort_order
-        investment_plans = InvestmentPlan.objects.filter(is_active=True).order_by(
-            "sort_order", "title"
-        )
-
-        context = {"investment_plans": investment_plans}
+        # Active plans and their counters come from the cached catalog; the
+        # plan cards themselves are a {% cache %} fragment keyed on both
+        # versions
+        plans, stats_version = get_active_plans_with_stats()
+        context = {
+            "investment_plans": plans,
+            "catalog_version": get_catalog_version(),
+            "stats_version": stats_version,
+        }
         return render(request, "hotmine/investmentplans.html", context)
     else:
         return redirect("login")
@@ -68,7 +96,7 @@ def signup_view(request):
         return redirect("dashboard")
 
     if request.method == "POST":
-        form = SignUpForm(request.POST)
+        form = SignUpForm(request.POST, request=request)
         if form.is_valid():
             user = form.save()
             # Save phone number to user profile
@@ -93,18 +121,37 @@ def signup_view(request):
     return render(request, "hotmine/signup.html", {"form": form})
 
 
-def login_view(request):
-    if request.user.is_authenticated:
+@cache_anonymous_page(60 * 15)
+async def login_view(request):
+    if (await request.auser()).is_authenticated:
         return redirect("dashboard")
 
     if request.method == "POST":
+        # Shed credential-stuffing bursts before the password hash runs. The
+        # form is left unbound here: rendering a bound AuthenticationForm
+        # would validate it and hash the password anyway.
+        account = request.POST.get("username", "")
+        decision = await sync_to_async(ratelimit.check)(
+            request, "login", account=account
+        )
+        if not decision.allowed:
+            form = LoginForm(request, initial={"username": account})
+            return await sync_to_async(rate_limited)(
+                request, "hotmine/login.html", {"form": form}, decision
+            )
+
         form = LoginForm(request, data=request.POST)
-        if form.is_valid():
-            username = form.cleaned_data.get("username")
-            password = form.cleaned_data.get("password")
-            user = authenticate(username=username, password=password)
+
+        # is_valid() already runs authenticate(), so reuse its user instead of
+        # hashing the password a second time. The hash runs on the bounded
+        # hashing pool rather than a request thread.
+        if await hashing.run(form.is_valid):
+            user = form.get_user()
             if user is not None:
-                login(request, user)
+                await sync_to_async(ratelimit.reset)(
+                    request, "login", account=account
+                )
+                await alogin(request, user)
                 messages.success(request, f"Welcome back, {user.first_name}!")
                 # Redirect to next page or home
                 next_page = request.GET.get("next", "dashboard")
@@ -114,7 +161,7 @@ def login_view(request):
     else:
         form = LoginForm()
 
-    return render(request, "hotmine/login.html", {"form": form})
+    return await arender(request, "hotmine/login.html", {"form": form})
 
 
 def logout_view(request):
@@ -128,7 +175,7 @@ def profile_view(request):
     user = request.user
 
     if request.method == "POST":
-        form = UserUpdateForm(request.POST, instance=user)
+        form = UserUpdateForm(request.POST, instance=user, request=request)
         if form.is_valid():
             form.save()
             messages.success(request, "Profile updated successfully!")
@@ -136,16 +183,10 @@ def profile_view(request):
     else:
         form = UserUpdateForm(instance=user)
 
-    # Get financial data
-    amount_obj = Amount.objects.filter(user=user).first()
-    withdraw_obj = totalwithdraw.objects.filter(user=user).first()
-    earnings_obj = Totalearnings.objects.filter(user=user).first()
+    # The wallet numbers are filled in from /api/v1/dashboard/
     context = {
         "user": user,
         "form": form,
-        "amount": amount_obj.amount if amount_obj else 0,
-        "total_earnings": earnings_obj.total_earnings if earnings_obj else 0,
-        "total_withdraw": withdraw_obj.total_withdraw if withdraw_obj else 0,
     }
 
     return render(request, "hotmine/profile.html", context)
@@ -187,20 +228,13 @@ def change_password(request):
 
 @login_required
 def invest_view(request):
-    # Get all active investment plans
-    plans = InvestmentPlan.objects.filter(is_active=True).order_by(
-        "sort_order", "title"
-    )
+    # Get all active investment plans, with their counters
+    plans, _ = get_active_plans_with_stats()
     selected_plan_id = request.GET.get("plan_id", "")
     selected_plan = None
 
     if selected_plan_id:
-        try:
-            selected_plan = InvestmentPlan.objects.get(
-                id=selected_plan_id, is_active=True
-            )
-        except InvestmentPlan.DoesNotExist:
-            pass
+        selected_plan = get_active_plan(selected_plan_id)
 
     if request.method == "POST":
         plan_id = request.POST.get("plan_id")
@@ -208,10 +242,11 @@ def invest_view(request):
 
         try:
             investment_plan = InvestmentPlan.objects.get(id=plan_id, is_active=True)
-            amount = float(amount)
+            # Exact cents; a float here let 0.1 + 0.2 style error into limits
+            amount = Money.parse(amount)
 
             # Validate investment amount
-            if amount < investment_plan.minimum_deposit:
+            if amount < Money.parse(investment_plan.minimum_deposit):
                 messages.error(
                     request,
                     f"Minimum investment for {investment_plan.title} is ${investment_plan.minimum_deposit}",
@@ -220,7 +255,7 @@ def invest_view(request):
 
             if (
                 investment_plan.maximum_deposit
-                and amount > investment_plan.maximum_deposit
+                and amount > Money.parse(investment_plan.maximum_deposit)
             ):
                 messages.error(
                     request,
@@ -228,16 +263,21 @@ def invest_view(request):
                 )
                 return redirect(f"/invest/?plan_id={plan_id}")
 
-            # Create investment record
-            Investment.objects.create(
-                user=request.user,
-                investment_plan=investment_plan,
-                amount=amount,
-                wallet_address_used=investment_plan.crypto_wallet.wallet_address,
-                # Legacy fields for compatibility
-                plan=investment_plan.title,
-                wallet_address=investment_plan.crypto_wallet.wallet_address,
-            )
+            # Create investment record, counted in the plan's stats with it
+            with transaction.atomic():
+                if not planstats.has_room(investment_plan, amount):
+                    messages.error(
+                        request,
+                        f"{investment_plan.title} doesn't have room for ${amount} right now.",
+                    )
+                    return redirect(f"/invest/?plan_id={plan_id}")
+                investment = Investment.objects.create(
+                    user=request.user,
+                    investment_plan=investment_plan,
+                    amount=amount.to_decimal(),
+                    wallet_address_used=investment_plan.crypto_wallet.wallet_address,
+                )
+                planstats.record([(None, planstats.row(investment))])
 
             messages.success(
                 request,
@@ -261,63 +301,92 @@ def invest_view(request):
     return render(request, "hotmine/invest.html", context)
 
 
-def get_plan_details(request, plan_id):
+async def get_plan_details(request, plan_id):
     """AJAX endpoint to get plan details"""
-    try:
-        plan = InvestmentPlan.objects.get(id=plan_id, is_active=True)
-        return JsonResponse(
-            {
-                "success": True,
-                "plan": {
-                    "id": plan.id,
-                    "title": plan.title,
-                    "description": plan.description,
-                    "minimum_deposit": float(plan.minimum_deposit),
-                    "maximum_deposit": (
-                        float(plan.maximum_deposit) if plan.maximum_deposit else None
-                    ),
-                    "daily_earnings_percentage": float(plan.daily_earnings_percentage),
-                    "investment_duration_days": plan.investment_duration_days,
-                    "deposit_return": plan.deposit_return,
-                    "wallet_address": plan.crypto_wallet.wallet_address,
-                    "wallet_type": plan.crypto_wallet.get_wallet_type_display(),
-                    "investment_range": plan.investment_range_display,
-                    "total_return_percentage": float(plan.total_return_percentage),
-                },
-            }
-        )
-    except InvestmentPlan.DoesNotExist:
+    # Same cached catalog the invest page uses, so usually no query at all
+    plan = await sync_to_async(get_active_plan)(plan_id)
+    if plan is None:
         return JsonResponse({"success": False, "error": "Plan not found"})
+    return JsonResponse(
+        {
+            "success": True,
+            "plan": {
+                "id": plan.id,
+                "title": plan.title,
+                "description": plan.description,
+                "minimum_deposit": float(plan.minimum_deposit),
+                "maximum_deposit": (
+                    float(plan.maximum_deposit) if plan.maximum_deposit else None
+                ),
+                "daily_earnings_percentage": float(plan.daily_earnings_percentage),
+                "investment_duration_days": plan.investment_duration_days,
+                "deposit_return": plan.deposit_return,
+                "wallet_address": plan.crypto_wallet.wallet_address,
+                "wallet_type": plan.crypto_wallet.get_wallet_type_display(),
+                "investment_range": plan.investment_range_display,
+                "total_return_percentage": float(plan.total_return_percentage),
+            },
+        }
+    )
 
 
 def investment_success(request):
     return render(request, "hotmine/success.html")
 
 
+INVESTMENTS_PER_PAGE = 10
+
+
+async def _page_rows(history, number):
+    start = (number - 1) * INVESTMENTS_PER_PAGE
+    return await history.aslice(start, start + INVESTMENTS_PER_PAGE)
+
+
 @login_required
-def investment_record(request):
-    user = request.user
-    investments_list = Investment.objects.filter(user=user).order_by("-date_invested")
+@use_replica
+async def investment_record(request):
+    user = await request.auser()
+    # Archived investments included (see hotmine/archive.py)
+    investments_list = (
+        Investment.history.filter(user=user)
+        .order_by("-date_invested")
+        .prefetch_related("user", "investment_plan")
+    )
 
-    # Add pagination
-    paginator = Paginator(investments_list, 10)  # Show 10 investments per page
-    page_number = request.GET.get("page")
-    investments = paginator.get_page(page_number)
+    try:
+        requested = max(1, int(request.GET.get("page", 1)))
+    except (TypeError, ValueError):
+        requested = 1
+
+    # The summary is aggregated in SQL instead of loading every investment,
+    # and it doesn't depend on the page rows, so both are fetched together
+    stats, rows = await asyncio.gather(
+        investments_list.aaggregate(
+            count=Count("id"),
+            total_invested=Sum("amount"),
+            total_earnings=Sum("total_earnings"),
+            active_count=Count("id", filter=Q(status="ACTIVE")),
+            completed_count=Count("id", filter=Q(status="COMPLETED")),
+        ),
+        _page_rows(investments_list, requested),
+    )
 
-    # Calculate summary statistics
-    total_invested = sum(inv.amount for inv in investments_list)
-    total_earnings = sum(inv.total_earnings for inv in investments_list)
-    active_count = investments_list.filter(status="ACTIVE").count()
-    completed_count = investments_list.filter(status="COMPLETED").count()
+    paginator = Paginator(investments_list, INVESTMENTS_PER_PAGE)
+    paginator.count = stats["count"]  # already counted by the aggregate
+    investments = paginator.get_page(requested)
+    if investments.number != requested:
+        # Past the last page: get_page fell back to the last one
+        rows = await _page_rows(investments_list, investments.number)
+    investments.object_list = rows
 
     context = {
         "investments": investments,
-        "total_invested": total_invested,
-        "total_earnings": total_earnings,
-        "active_count": active_count,
-        "completed_count": completed_count,
+        "total_invested": stats["total_invested"] or 0,
+        "total_earnings": stats["total_earnings"] or 0,
+        "active_count": stats["active_count"],
+        "completed_count": stats["completed_count"],
     }
-    return render(request, "hotmine/myinvestment.html", context)
+    return await arender(request, "hotmine/myinvestment.html", context)
 
 
 def buy_view(request):
@@ -425,7 +494,9 @@ def process_withdrawal_request(request, user, user_balance):
 
             # Log the withdrawal request
             logger.info(
-                f"Withdrawal request created: {withdrawal_request.id} for user {user.username}"
+                "Withdrawal request %s created",
+                withdrawal_request.id,
+                extra={"withdrawal_id": withdrawal_request.id, "user_id": user.pk},
             )
 
             messages.success(
@@ -437,8 +508,8 @@ def process_withdrawal_request(request, user, user_balance):
     except ValueError:
         messages.error(request, "Invalid withdrawal amount")
     except Exception as e:
-        logger.error(
-            f"Error processing withdrawal request for user {user.username}: {str(e)}"
+        logger.exception(
+            "Error processing withdrawal request: %s", e, extra={"user_id": user.pk}
         )
         messages.error(
             request,
@@ -449,16 +520,20 @@ def process_withdrawal_request(request, user, user_balance):
 
 
 @login_required
-def withdrawal_history(request):
+@gzip_page
+@use_replica
+async def withdrawal_history(request):
     """Display user's withdrawal history"""
-    user = request.user
-    withdrawals = WithdrawalRequest.objects.filter(user=user)
-
-    context = {
-        "withdrawals": withdrawals,
-    }
-
-    return render(request, "hotmine/withdrawal_history.html", context)
+    user = await request.auser()
+    withdrawals = WithdrawalRequest.history.filter(user=user)
+
+    # Rows are streamed in chunks (see hotmine/streaming.py)
+    return await streaming.arender_rows(
+        request,
+        "hotmine/withdrawal_history.html",
+        "hotmine/withdrawal_history_rows.html",
+        withdrawals,
+    )
 
 
 @login_required
@@ -485,19 +560,35 @@ def cancel_withdrawal(request, withdrawal_id):
 
             messages.success(request, "Withdrawal request cancelled successfully")
     except Exception as e:
-        logger.error(f"Error cancelling withdrawal {withdrawal_id}: {str(e)}")
+        logger.exception(
+            "Error cancelling withdrawal %s: %s",
+            withdrawal_id,
+            e,
+            extra={"withdrawal_id": withdrawal_id, "user_id": request.user.pk},
+        )
         messages.error(request, "An error occurred while cancelling your withdrawal")
 
     return redirect("withdrawal_history")
 
 
 @login_required
-def investment_history_view(request):
-    user = request.user
-    investments = Investment.objects.filter(user=user).order_by("-date_invested")
+@gzip_page
+@use_replica
+async def investment_history_view(request):
+    user = await request.auser()
+    investments = (
+        Investment.history.filter(user=user)
+        .order_by("-date_invested")
+        .prefetch_related("investment_plan")
+    )
 
-    context = {"investments": investments}
-    return render(request, "hotmine/history.html", context)
+    # Rows are streamed in chunks (see hotmine/streaming.py)
+    return await streaming.arender_rows(
+        request,
+        "hotmine/history.html",
+        "hotmine/history_rows.html",
+        investments,
+    )
 
 
 @method_decorator(csrf_protect, name="dispatch")
@@ -512,7 +603,13 @@ class SimplePasswordResetView(View):
         return render(request, self.template_name, {"form": form})
 
     def post(self, request):
-        form = self.form_class(request.POST)
+        email = request.POST.get("email", "")
+        decision = ratelimit.check(request, "password_reset", account=email)
+        if not decision.allowed:
+            form = self.form_class(initial={"email": email})
+            return rate_limited(request, self.template_name, {"form": form}, decision)
+
+        form = self.form_class(request.POST, request=request)
 
         if form.is_valid():
             user = form.save()
@@ -527,3 +624,38 @@ class SimplePasswordResetView(View):
                 messages.error(request, "An error occurred. Please try again.")
 
         return render(request, self.template_name, {"form": form})
+
+
+@require_http_methods(["GET", "HEAD"])
+def price_feed(request):
+    """Batched prices for our ticker: ?symbols=BTC,ETH&history=48"""
+    symbols = prices.parse_symbols(request.GET.get("symbols"))
+    try:
+        points = min(int(request.GET.get("history", 0)), 1000)
+    except ValueError:
+        points = 0
+
+    snapshot = prices.get_snapshot()
+    if snapshot is None:
+        response = JsonResponse({"error": "Prices are not available yet"}, status=503)
+        response["Retry-After"] = "30"
+        return response
+
+    etag = f'"{int(snapshot["updated"] * 1000)}-{".".join(symbols)}-{points}"'
+    ttl = getattr(settings, "PRICE_TTL", 60)
+    max_age = max(1, int(ttl - (time.time() - snapshot["updated"])))
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        patch_cache_control(not_modified, public=True, max_age=max_age)
+        return not_modified
+
+    data = {
+        "updated": int(snapshot["updated"]),
+        "prices": {s: snapshot["prices"][s] for s in symbols if s in snapshot["prices"]},
+    }
+    if points:
+        data["history"] = prices.get_history(symbols, points)
+    response = JsonResponse(data)
+    response["ETag"] = etag
+    patch_cache_control(response, public=True, max_age=max_age)
+    return response
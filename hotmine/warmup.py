@@ -0,0 +1,135 @@
+"""
+Start-up warm-up, so the first request after a free-tier cold start doesn't
+pay for everything that is loaded lazily.
+
+run() builds the URL resolver (which imports the admin and jazzmin), compiles
+the hot templates, opens and checks the database connection, loads the plan
+catalog into the cache, fills a stale price snapshot and renders the hot
+templates once, which also loads the static manifest and the bundle and
+image variant lookups. Each step is timed and logged. A step that fails is
+logged and skipped, because a worker that couldn't warm up can still serve.
+
+gunicorn.conf.py runs it in every worker once the app is loaded. With
+WARMUP_ON_READY it runs from AppConfig.ready() instead, for servers without
+that hook. Django discourages queries during app loading, so that variant
+only does the steps that don't touch the database.
+
+Settings:
+    WARMUP_ENABLED     run the warm-up at all (default True)
+    WARMUP_ON_READY    run the database-free steps from AppConfig.ready()
+    WARMUP_TEMPLATES   templates to compile and render
+"""
+
+import logging
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.http import HttpRequest
+from django.template.loader import get_template
+from django.urls import get_resolver, reverse
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TEMPLATES = (
+    "hotmine/home.html",
+    "hotmine/login.html",
+    "hotmine/signup.html",
+    "hotmine/dashboard.html",
+    "hotmine/investmentplans.html",
+    "hotmine/myinvestment.html",
+    "hotmine/withdrawal_history.html",
+)
+
+
+def _templates():
+    return getattr(settings, "WARMUP_TEMPLATES", DEFAULT_TEMPLATES)
+
+
+def load_urls():
+    get_resolver().url_patterns
+    reverse("home")
+
+
+def compile_templates():
+    for name in _templates():
+        get_template(name)
+
+
+def check_database():
+    connection.ensure_connection()
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1")
+        cursor.fetchone()
+
+
+def load_catalog():
+    from .catalog import get_active_plans
+
+    get_active_plans()
+
+
+def load_prices():
+    from . import prices
+
+    prices.refresh_if_stale()
+
+
+def _anonymous_request():
+    request = HttpRequest()
+    request.method = "GET"
+    request.path = request.path_info = "/"
+    if settings.ALLOWED_HOSTS:
+        request.META["HTTP_HOST"] = settings.ALLOWED_HOSTS[0].lstrip(".")
+    return request
+
+
+def render_templates():
+    for name in _templates():
+        try:
+            get_template(name).render({}, _anonymous_request())
+        except Exception as e:
+            # Some pages expect context; compiling them was the main win
+            logger.debug("Warm-up render of %s skipped: %s", name, e)
+
+
+# (name, function, touches the database)
+STEPS = (
+    ("urls", load_urls, False),
+    ("templates", compile_templates, False),
+    ("database", check_database, True),
+    ("catalog", load_catalog, True),
+    ("prices", load_prices, True),
+    ("render", render_templates, True),
+)
+
+
+def run(database=True):
+    """Run the warm-up steps; returns {step: seconds}, None for failed steps"""
+    if not getattr(settings, "WARMUP_ENABLED", True):
+        return {}
+    timings = {}
+    started = time.perf_counter()
+    for name, step, needs_database in STEPS:
+        if needs_database and not database:
+            continue
+        step_started = time.perf_counter()
+        try:
+            step()
+        except Exception:
+            logger.exception("Warm-up step %r failed", name)
+            timings[name] = None
+            continue
+        timings[name] = time.perf_counter() - step_started
+    if database:
+        # Requests open their own connections; don't hold this one idle
+        close_old_connections()
+    logger.info(
+        "Warm-up finished in %.0f ms (%s)",
+        (time.perf_counter() - started) * 1000,
+        ", ".join(
+            f"{name} {'failed' if t is None else f'{t * 1000:.0f} ms'}"
+            for name, t in timings.items()
+        ),
+    )
+    return timings
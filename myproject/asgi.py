@@ -9,8 +9,24 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
-
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "myproject.settings")
 
-application = get_asgi_application()
+# Django's ASGI handler, with request tracing (see hotmine/tracing.py)
+from hotmine.tracing import get_asgi_application  # noqa: E402
+
+django_application = get_asgi_application()
+
+# Imported after Django is set up
+from hotmine.live import asgi_events  # noqa: E402
+
+
+async def application(scope, receive, send):
+    # Live event streams skip Django's handler, see hotmine/live.py, and with
+    # it MIDDLEWARE. asgi_events() checks the Host itself and authenticates
+    # from the session cookie; it goes without SecurityMiddleware's other
+    # headers (HSTS, Referrer-Policy, COOP) and SSL redirect, CSRF (it only
+    # answers GET and HEAD and changes nothing), the session's expiry being
+    # refreshed, request IDs and access log lines, and tracing spans.
+    if scope["type"] == "http" and scope["path"] == "/events/":
+        return await asgi_events(scope, receive, send)
+    return await django_application(scope, receive, send)
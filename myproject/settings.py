@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 import os
+import sys
 import dj_database_url
 from pathlib import Path
 
@@ -29,6 +30,9 @@ SECRET_KEY = os.environ.get(
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = False
 
+# Running under "manage.py test"
+TESTING = len(sys.argv) > 1 and sys.argv[1] == "test"
+
 # Updated for deployment
 ALLOWED_HOSTS = [
     "hotmine.org.uk",
@@ -53,12 +57,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "hotmine.logs.RequestLogMiddleware",  # Request IDs for the logs
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",  # For static files in production
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "hotmine.routers.ReplicaPinMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -67,7 +73,8 @@ ROOT_URLCONF = "myproject.urls"
 
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        # Django's backend, with a tracing span per render (hotmine/tracing.py)
+        "BACKEND": "hotmine.tracing.DjangoTemplates",
         "DIRS": [BASE_DIR / "templates"],  # Add templates directory
         "APP_DIRS": True,
         "OPTIONS": {
@@ -87,9 +94,14 @@ WSGI_APPLICATION = "myproject.wsgi.application"
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
 if os.environ.get("DATABASE_URL"):
+    # Under ASGI every request runs on its own thread, so a persistent
+    # connection would be left behind with each one; connect per request
+    # unless DB_CONN_MAX_AGE says otherwise (e.g. behind a pooler)
     DATABASES = {
         "default": dj_database_url.config(
-            default=os.environ["DATABASE_URL"], conn_max_age=600, ssl_require=True
+            default=os.environ["DATABASE_URL"],
+            conn_max_age=int(os.environ.get("DB_CONN_MAX_AGE", 0)),
+            ssl_require=True,
         )
     }
 else:
@@ -100,6 +112,230 @@ else:
         }
     }
 
+# Opt-in SQLite profile for single-node deploys (see hotmine/sqlite.py): WAL
+# and friends on every connection, and transactions that take the write
+# lock up front with BEGIN IMMEDIATE
+SQLITE_TUNED = os.environ.get("SQLITE_TUNED", "False") == "True"
+SQLITE_PRAGMAS = {}
+if SQLITE_TUNED and not os.environ.get("DATABASE_URL"):
+    DATABASES["default"]["OPTIONS"] = {"transaction_mode": "IMMEDIATE"}
+
+# Read replicas (see hotmine/routers.py). DATABASE_REPLICA_URLS is a comma
+# separated list; locally SQLITE_REPLICA=True adds a second SQLite file that
+# `manage.py sync_replica` keeps copied from the first. Tests read the
+# primary through the replica aliases.
+REPLICA_DATABASES = []
+if os.environ.get("DATABASE_URL") and os.environ.get("DATABASE_REPLICA_URLS"):
+    for i, url in enumerate(os.environ["DATABASE_REPLICA_URLS"].split(","), 1):
+        DATABASES[f"replica{i}"] = dj_database_url.parse(
+            url.strip(),
+            conn_max_age=int(os.environ.get("DB_CONN_MAX_AGE", 0)),
+            ssl_require=True,
+        )
+        DATABASES[f"replica{i}"]["TEST"] = {"MIRROR": "default"}
+        REPLICA_DATABASES.append(f"replica{i}")
+elif not os.environ.get("DATABASE_URL") and os.environ.get("SQLITE_REPLICA") == "True":
+    DATABASES["replica1"] = {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BASE_DIR / "db-replica.sqlite3",
+        "TEST": {"MIRROR": "default"},
+    }
+    REPLICA_DATABASES.append("replica1")
+
+DATABASE_ROUTERS = ["hotmine.routers.ReplicaRouter"]
+REPLICA_MAX_LAG = int(os.environ.get("REPLICA_MAX_LAG", 10))
+REPLICA_CHECK_INTERVAL = 5
+# Longer than the lag allowed, so a browser never reads from behind its writes
+REPLICA_PIN_SECONDS = REPLICA_MAX_LAG + 5
+
+# Cache
+# A shared cache (Redis) lets every gunicorn worker see the same rate-limit
+# counters; without one each process falls back to its own local memory.
+
+if os.environ.get("REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ["REDIS_URL"],
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "hotmine-default",
+        }
+    }
+
+# Anonymous full-page cache entries are namespaced per deploy so a new release
+# never serves HTML pointing at the previous release's hashed static files
+PAGE_CACHE_KEY_PREFIX = os.environ.get("RENDER_GIT_COMMIT", "")[:12]
+
+# Login / password reset rate limiting (see hotmine/ratelimit.py)
+RATELIMIT_ENABLED = os.environ.get("RATELIMIT_ENABLED", "True") == "True"
+RATELIMIT_CACHE = "default"
+# Proxies in front of the app that append to X-Forwarded-For; 0 counts
+# attempts by REMOTE_ADDR. Render's load balancer is one (render.yaml).
+RATELIMIT_TRUSTED_PROXIES = int(os.environ.get("RATELIMIT_TRUSTED_PROXIES", 0))
+RATELIMIT_RULES = {
+    # (key, max attempts, window in seconds)
+    "login": [("ip", 30, 60), ("account", 10, 300)],
+    "password_reset": [("ip", 10, 300), ("account", 5, 900)],
+}
+
+# Crypto prices for our ticker (see hotmine/prices.py). PRICE_FEED_FILE swaps
+# CoinGecko for a JSON file, e.g. hotmine/data/prices.json in tests
+if os.environ.get("PRICE_FEED_FILE"):
+    PRICE_FEED = "hotmine.prices.FileFeed"
+    PRICE_FEED_OPTIONS = {"path": os.environ["PRICE_FEED_FILE"]}
+else:
+    PRICE_FEED = "hotmine.prices.CoinGeckoFeed"
+    PRICE_FEED_OPTIONS = {"api_key": os.environ.get("COINGECKO_API_KEY")}
+PRICE_TTL = int(os.environ.get("PRICE_TTL", 60))
+# One point per refresh: 288 x 60s is roughly the last 5 hours
+PRICE_HISTORY_SIZE = 288
+# Without Redis each process has its own snapshot, which the price endpoint
+# refreshes in the background; with it the refresh_prices job below does
+PRICE_BACKGROUND_REFRESH = not os.environ.get("REDIS_URL")
+
+# Live account updates over server-sent events (see hotmine/live.py). Only
+# turn this on when serving through ASGI: under WSGI each open stream would
+# hold a worker thread.
+LIVE_EVENTS = os.environ.get("LIVE_EVENTS", "False") == "True"
+LIVE_CHANNEL = os.environ.get("LIVE_CHANNEL", "auto")
+LIVE_POLL_INTERVAL = 2
+
+# Threads the async login view hashes passwords on (see hotmine/hashing.py)
+PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", 2))
+
+# Warm each worker up before it serves (see hotmine/warmup.py and
+# gunicorn.conf.py), so a cold start on the free plan isn't paid by a visitor
+WARMUP_ENABLED = os.environ.get("WARMUP_ENABLED", "True") == "True"
+WARMUP_ON_READY = os.environ.get("WARMUP_ON_READY", "False") == "True"
+
+# Finished investments and withdrawals move to archive tables after this many
+# days (see hotmine/archive.py and `manage.py archive_history`)
+ARCHIVE_AFTER_DAYS = int(os.environ.get("ARCHIVE_AFTER_DAYS", 180))
+ARCHIVE_BATCH_SIZE = 500
+ARCHIVE_BATCH_SLEEP = 0.2
+
+# The history pages send their layout first and stream the rows in chunks
+# (see hotmine/streaming.py)
+STREAM_HISTORY = os.environ.get("STREAM_HISTORY", "True") == "True"
+STREAM_CHUNK_SIZE = 200
+
+# Earnings accrual and maturity settlement (see hotmine/settlement.py and
+# `manage.py settle_investments`)
+SETTLEMENT_BATCH_SIZE = 500
+# Portfolio chart snapshots, written after each settlement pass (see
+# hotmine/snapshots.py); older ones are thinned to one per month
+SNAPSHOT_DAILY_DAYS = 90
+SNAPSHOT_BATCH_SIZE = 500
+
+# Horizons, in days, of the admin's liability forecast (see hotmine/forecast.py)
+FORECAST_HORIZONS = (30, 90, 365)
+
+# Nightly balance reconciliation (see hotmine/reconcile.py and
+# `manage.py reconcile_balances`); workers default to the CPU count
+RECONCILE_CHUNK_SIZE = 5000
+RECONCILE_WORKERS = int(os.environ.get("RECONCILE_WORKERS", 0)) or None
+
+# Periodic jobs, run inside the web workers when SCHEDULER_EMBEDDED is on
+# (see hotmine/scheduler.py and `manage.py run_scheduler`). Seconds between
+# runs; 0 turns a job off.
+SCHEDULER_EMBEDDED = os.environ.get("SCHEDULER_EMBEDDED", "False") == "True"
+SCHEDULER_JOBS = {
+    "settle": 300,
+    "dispatch_outbox": 30,
+    "clear_sessions": 86400,
+    "archive_history": 86400,
+    # Corrects drift in the packages page counters (hotmine/planstats.py)
+    "reconcile_plan_stats": 3600,
+    # The snapshot only reaches other workers through a shared cache
+    "refresh_prices": PRICE_TTL if os.environ.get("REDIS_URL") else 0,
+}
+SCHEDULER_LEASE_SECONDS = 900
+SCHEDULER_TICK = 15
+
+# User notifications go through the outbox (see hotmine/outbox.py and
+# `manage.py dispatch_outbox`). Locally emails land in sent_emails/.
+EMAIL_BACKEND = os.environ.get(
+    "EMAIL_BACKEND", "django.core.mail.backends.filebased.EmailBackend"
+)
+EMAIL_FILE_PATH = BASE_DIR / "sent_emails"
+EMAIL_HOST = os.environ.get("EMAIL_HOST", "localhost")
+EMAIL_PORT = int(os.environ.get("EMAIL_PORT", 25))
+EMAIL_HOST_USER = os.environ.get("EMAIL_HOST_USER", "")
+EMAIL_HOST_PASSWORD = os.environ.get("EMAIL_HOST_PASSWORD", "")
+EMAIL_USE_TLS = os.environ.get("EMAIL_USE_TLS", "False") == "True"
+DEFAULT_FROM_EMAIL = os.environ.get(
+    "DEFAULT_FROM_EMAIL", "HotMine <no-reply@hotmine.local>"
+)
+OUTBOX_BATCH_SIZE = 100
+OUTBOX_MAX_ATTEMPTS = 6
+OUTBOX_RETRY_SECONDS = 60
+OUTBOX_RETRY_MAX = 3600
+OUTBOX_LEASE_SECONDS = 300
+OUTBOX_KEEP_DAYS = 30
+
+# Logging: JSON lines, written by a listener thread off the request path
+# (see hotmine/logs.py). LOG_SINKS is comma separated: stderr, stdout or
+# file paths. Test runs write nowhere unless LOG_SINKS is set; the views
+# they fail on purpose would bury the results in tracebacks.
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+LOG_SINKS = [
+    name
+    for name in os.environ.get("LOG_SINKS", "" if TESTING else "stderr").split(",")
+    if name
+]
+LOG_QUEUE_SIZE = 10000
+LOG_BATCH_SIZE = 500
+# {url name: share of requests whose INFO records are kept}; the polled
+# endpoints would drown out everything else
+LOG_SAMPLING = {
+    "price_feed": 0.1,
+    "live_events": 0.1,
+}
+LOG_REQUEST_ID_HEADER = "X-Request-ID"
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "filters": {
+        "request": {"()": "hotmine.logs.RequestFilter"},
+    },
+    "handlers": {
+        "queue": {
+            "class": "hotmine.logs.QueueHandler",
+            "filters": ["request"],
+            "sinks": LOG_SINKS,
+            "queue_size": LOG_QUEUE_SIZE,
+            "batch_size": LOG_BATCH_SIZE,
+        },
+    },
+    "root": {"handlers": ["queue"], "level": LOG_LEVEL},
+    "loggers": {
+        # Through the queue like everything else, instead of Django's own
+        # console and mail_admins handlers
+        "django": {"handlers": [], "level": LOG_LEVEL},
+    },
+}
+
+# Request tracing (see hotmine/tracing.py): spans for middleware, the view,
+# SQL and templates. Slow requests are always kept, a sample of the rest;
+# the admin draws them from TRACING_FILE at /admin/traces/.
+TRACING = os.environ.get("TRACING", "False") == "True"
+TRACING_SAMPLE_RATE = float(os.environ.get("TRACING_SAMPLE_RATE", 0.01))
+TRACING_SLOW_MS = int(os.environ.get("TRACING_SLOW_MS", 500))
+TRACING_MAX_SPANS = 1000
+TRACING_EXPORT = os.environ.get("TRACING_EXPORT", "jsonl").split(",")
+TRACING_FILE = os.environ.get("TRACING_FILE", BASE_DIR / "traces.jsonl")
+TRACING_FILE_MAX_MB = 20
+TRACING_OTLP_ENDPOINT = os.environ.get(
+    "TRACING_OTLP_ENDPOINT", "http://localhost:4318/v1/traces"
+)
+TRACING_SERVICE_NAME = "hotmine"
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -152,4 +388,24 @@ MEDIA_ROOT = BASE_DIR / "media"
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 # Static files storage (for production)
-STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
+# STATICFILES_STORAGE was removed in Django 5.1, so storages are configured
+# through STORAGES. The hotmine storage runs the CSS/JS build stage
+# (hotmine/assets.py) before WhiteNoise hashes and compresses everything.
+STORAGES = {
+    "default": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+    },
+    "staticfiles": {
+        "BACKEND": "hotmine.storage.HotmineStaticFilesStorage",
+    },
+}
+if TESTING:
+    # The manifest only exists once collectstatic has run, and the hotmine
+    # storage fails a {% static %} of a name missing from it
+    STORAGES["staticfiles"] = {
+        "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage",
+    }
+
+# Per-page purged stylesheet bundles from {% stylesheets %}; when off (or
+# before collectstatic has run) pages link the individual stylesheets
+ASSET_BUNDLES = os.environ.get("ASSET_BUNDLES", "True") == "True"
@@ -18,7 +18,21 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from hotmine import admin as hotmine_admin
+
 urlpatterns = [
+    # Staff-only request trace waterfalls (hotmine/tracing.py); ahead of the
+    # admin's own URLs, which would 404 them
+    path(
+        "admin/traces/",
+        admin.site.admin_view(hotmine_admin.traces_view),
+        name="admin_traces",
+    ),
+    path(
+        "admin/traces/<str:trace_id>/",
+        admin.site.admin_view(hotmine_admin.trace_view),
+        name="admin_trace",
+    ),
     path("admin/", admin.site.urls),
     path("", include("hotmine.urls")),
 ]
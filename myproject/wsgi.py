@@ -9,8 +9,9 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/wsgi/
 
 import os
 
-from django.core.wsgi import get_wsgi_application
-
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "myproject.settings")
 
+# Django's WSGI handler, with request tracing (see hotmine/tracing.py)
+from hotmine.tracing import get_wsgi_application  # noqa: E402
+
 application = get_wsgi_application()